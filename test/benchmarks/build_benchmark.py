@@ -0,0 +1,78 @@
+"""
+Compares BasePersistenceModel.build with build_trusted for records loaded from the database
+
+    python -m test.benchmarks.build_benchmark
+"""
+import timeit
+
+from pynamodb.attributes import UnicodeAttribute, NumberAttribute, MapAttribute
+from pynamodb.models import Model as PynamoModel
+from schematics.types import StringType, IntType, ListType, ModelType
+
+from wavelength_py.dal.dao.models.pynamo_crud_model import PynamoCrudModel
+from wavelength_py.model.model_base import BaseModel
+
+ITERATIONS = 2000
+
+
+class BenchmarkDbModel(PynamoModel):
+    class Meta:
+        table_name = 'benchmark-table'
+
+    account_id = UnicodeAttribute(hash_key=True)
+    range_id = UnicodeAttribute(range_key=True)
+    display_name = UnicodeAttribute(null=True)
+    description = UnicodeAttribute(null=True)
+    item_count = NumberAttribute(null=True)
+    settings = MapAttribute(null=True)
+    created_at = NumberAttribute(null=True)
+    modified_at = NumberAttribute(null=True)
+    version = NumberAttribute(null=True)
+    table_state = UnicodeAttribute(null=True)
+
+
+class BenchmarkSettings(BaseModel):
+    page_size = IntType()
+    tags = ListType(StringType())
+
+
+class BenchmarkModel(PynamoCrudModel):
+    account_id = StringType()
+    range_id = StringType()
+    display_name = StringType()
+    description = StringType()
+    item_count = IntType()
+    settings = ModelType(BenchmarkSettings)
+
+    def __init__(self, source_model: dict, **kwargs):
+        super().__init__(source_model, BenchmarkDbModel, **kwargs)
+
+
+RECORD = {
+    'accountId': '0e9a51c8-6b5a-4a52-9f38-2f4a6d5b1e77',
+    'rangeId': 'item::000042',
+    'displayName': 'Benchmark item',
+    'description': 'A record shaped like the rows our list endpoints return',
+    'itemCount': 42,
+    'settings': {'pageSize': 25, 'tags': ['a', 'b', 'c']},
+    'createdAt': 1546300800,
+    'modifiedAt': 1546300900,
+    'version': 7,
+    'tableState': 'MOD'
+}
+
+
+def run(iterations: int = ITERATIONS) -> None:
+    parent = BenchmarkModel({})
+    assert parent.build_trusted(RECORD).to_json() == parent.build(RECORD).to_json()
+
+    build = timeit.timeit(lambda: parent.build(RECORD), number=iterations)
+    trusted = timeit.timeit(lambda: parent.build_trusted(RECORD), number=iterations)
+
+    print(f'build          {build / iterations * 1e6:10.1f} us/item')
+    print(f'build_trusted  {trusted / iterations * 1e6:10.1f} us/item')
+    print(f'speedup        {build / trusted:10.1f}x')
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 - *-
+
+import unittest
+
+from mock import MagicMock, patch
+from pynamodb.exceptions import DoesNotExist
+
+from wavelength_py.dal.cache.container_cache import ContainerCache, ContainerCacheRegistry
+from wavelength_py.dal.dao.commands.get_by_key_pynamo_command import PynamoGetByIdCommand
+from wavelength_py.dal.pynamo_models.cachable_pynamo_model import CachingPynamoModel
+from test.dal.dao.commands.test_pynamo_command import get_persitence_model_mock
+from test.dal.dao.test_platform_persistence_model import DbModelTestMock
+from test.dal.pynamo_models.test_cachable_pynamo_model import ManualTimer
+
+
+class QueuedExecutor:
+    """ Holds submitted refreshes until run is called """
+
+    def __init__(self):
+        self.tasks = []
+
+    def submit(self, func, *args):
+        self.tasks.append((func, args))
+
+    def run(self):
+        tasks, self.tasks = self.tasks, []
+        for func, args in tasks:
+            func(*args)
+
+
+class ContainerCachedDbModelTestMock(CachingPynamoModel, DbModelTestMock):
+    class Meta:
+        table_name = 'container-test-table'
+        container_cache_soft_ttl = 10
+        container_cache_hard_ttl = 100
+
+    def to_json(self):
+        return {'kind': self.kind}
+
+
+class TestContainerCache(unittest.TestCase):
+
+    def setUp(self):
+        self.timer = ManualTimer()
+        self.executor = QueuedExecutor()
+        self.cache = ContainerCache(soft_ttl=10, hard_ttl=100, timer=self.timer, executor=self.executor)
+
+    def test_fresh_entries_are_served(self):
+        loader = MagicMock(return_value='v1')
+
+        self.assertEqual(self.cache.get('a', loader), 'v1')
+        self.assertEqual(self.cache.get('a', loader), 'v1')
+        loader.assert_called_once()
+        self.assertEqual(self.cache.stats.hits, 1)
+
+    def test_stale_entries_are_served_while_refreshed(self):
+        loader = MagicMock(side_effect=['v1', 'v2'])
+        self.cache.get('a', loader)
+        self.timer.now += 11
+
+        self.assertEqual(self.cache.get('a', loader), 'v1')
+        self.assertEqual(self.cache.get('a', loader), 'v1')
+        self.assertEqual(len(self.executor.tasks), 1)  # a single refresh per key
+
+        self.executor.run()
+        self.assertEqual(self.cache.get('a', loader), 'v2')
+        self.assertEqual(self.cache.stats.stale_hits, 2)
+        self.assertEqual(self.cache.refreshes, 1)
+
+    def test_failed_refresh_keeps_stale_entry(self):
+        loader = MagicMock(side_effect=['v1', IOError('throttled')])
+        self.cache.get('a', loader)
+        self.timer.now += 11
+        self.cache.get('a', loader)
+        self.executor.run()
+
+        self.assertEqual(self.cache.refresh_errors, 1)
+        self.assertEqual(self.cache.get('a', loader), 'v1')
+
+    def test_hard_ttl_reads_through(self):
+        loader = MagicMock(side_effect=['v1', 'v2', DoesNotExist()])
+        self.cache.get('a', loader)
+        self.timer.now += 100
+
+        self.assertEqual(self.cache.get('a', loader), 'v2')
+        self.assertEqual(self.executor.tasks, [])
+
+        self.timer.now += 100
+        with self.assertRaises(DoesNotExist):
+            self.cache.get('a', loader)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_peek_does_not_load(self):
+        loader = MagicMock(return_value='v1')
+        self.assertIsNone(self.cache.peek('a'))
+        self.cache.get('a', loader)
+        self.timer.now += 50
+
+        self.assertEqual(self.cache.peek('a'), 'v1')
+        self.assertEqual(self.executor.tasks, [])
+        self.timer.now += 50
+        self.assertIsNone(self.cache.peek('a'))
+        loader.assert_called_once()
+
+    def test_refresh_reloads_every_entry(self):
+        self.cache.get('a', MagicMock(side_effect=['a1', 'a2']))
+        self.cache.get('b', MagicMock(side_effect=['b1', 'b2']))
+        self.cache.refresh()
+
+        self.assertEqual([self.cache.get('a', None), self.cache.get('b', None)], ['a2', 'b2'])
+
+    def test_refreshes_racing_a_write_are_discarded(self):
+        self.cache.get('a', MagicMock(return_value='v1'))
+        self.timer.now += 11
+
+        def written_while_loading():
+            self.cache.put('a', 'v3', loader)
+            return 'v2'
+
+        loader = MagicMock(side_effect=written_while_loading)
+        self.cache.get('a', loader)
+        self.executor.run()
+        self.assertEqual(self.cache.get('a', None), 'v3')
+
+        def deleted_while_loading():
+            self.cache.pop('a')
+            return 'v3'
+
+        self.timer.now += 11
+        self.cache.get('a', MagicMock(side_effect=deleted_while_loading))
+        self.executor.run()
+        self.assertEqual(len(self.cache), 0)
+
+    def test_hard_ttl_shorter_than_soft_ttl(self):
+        with self.assertRaises(ValueError):
+            ContainerCache(soft_ttl=10, hard_ttl=5)
+
+
+timer = ManualTimer()
+executor = QueuedExecutor()
+registry = ContainerCacheRegistry(timer, executor)
+get_mock = MagicMock()
+
+
+@patch('wavelength_py.dal.pynamo_models.cachable_pynamo_model.CONTAINER_CACHES', registry)
+@patch('wavelength_py.dal.pynamo_models.cachable_pynamo_model.PynamoModel.get', get_mock)
+@patch('wavelength_py.dal.pynamo_models.cachable_pynamo_model.PynamoModel.save', MagicMock(return_value=None))
+@patch('wavelength_py.dal.pynamo_models.cachable_pynamo_model.PynamoModel.delete', MagicMock(return_value=None))
+class TestContainerCachedModel(unittest.TestCase):
+
+    def setUp(self):
+        registry.reset()
+        get_mock.reset_mock()
+        get_mock.side_effect = lambda hash_key, range_key, *args: ContainerCachedDbModelTestMock(
+            account_id=hash_key, range_id=range_key, kind='v%d' % get_mock.call_count)
+
+    def test_registry_opt_in(self):
+        self.assertIsNone(registry.get(DbModelTestMock))
+        self.assertEqual(registry.get(ContainerCachedDbModelTestMock).hard_ttl, 100)
+
+    def test_get_serves_stale_and_refreshes(self):
+        self.assertEqual(ContainerCachedDbModelTestMock.get('1234', 'a').kind, 'v1')
+        timer.now += 11
+        self.assertEqual(ContainerCachedDbModelTestMock.get('1234', 'a').kind, 'v1')
+
+        executor.run()
+        self.assertEqual(ContainerCachedDbModelTestMock.get('1234', 'a').kind, 'v2')
+        self.assertEqual(get_mock.call_count, 2)
+
+    def test_dal_gets_read_through_the_container_cache(self):
+        model_mock = get_persitence_model_mock({}, {})
+        model_mock.db_model = ContainerCachedDbModelTestMock
+        model_mock.build_trusted = MagicMock(side_effect=lambda json: json['kind'])
+        command = PynamoGetByIdCommand(model_mock, post_filter=MagicMock(return_value=True))
+
+        self.assertEqual(command('1234', 'a'), 'v1')
+        timer.now += 11
+        self.assertEqual(command('1234', 'a'), 'v1')
+        executor.run()
+        self.assertEqual(command('1234', 'a'), 'v2')
+
+        self.assertEqual(get_mock.call_count, 2)
+
+    def test_writes_replace_entries(self):
+        model = ContainerCachedDbModelTestMock(account_id='1234', range_id='a', kind='saved')
+        model.save()
+        self.assertEqual(ContainerCachedDbModelTestMock.get('1234', 'a').kind, 'saved')
+
+        model.delete()
+        self.assertEqual(ContainerCachedDbModelTestMock.get('1234', 'a').kind, 'v1')
+
+    def test_get_stale_skips_dynamodb(self):
+        self.assertIsNone(ContainerCachedDbModelTestMock.get_stale('1234', 'a'))
+        ContainerCachedDbModelTestMock.get('1234', 'a')
+        timer.now += 50
+
+        self.assertEqual(ContainerCachedDbModelTestMock.get_stale('1234', 'a').kind, 'v1')
+        self.assertEqual(get_mock.call_count, 1)
+
+    def test_warmup_refresh(self):
+        ContainerCachedDbModelTestMock.get('1234', 'a')
+        registry.refresh()
+
+        self.assertEqual(ContainerCachedDbModelTestMock.get('1234', 'a').kind, 'v2')
+
+
+if __name__ == '__main__':
+    unittest.main()
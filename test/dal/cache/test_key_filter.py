@@ -0,0 +1,205 @@
+# -*- coding: utf-8 - *-
+
+import os
+import tempfile
+import unittest
+
+from mock import MagicMock, patch
+
+from wavelength_py.dal.cache.key_filter import BloomFilter, KeyFilterRegistry, get_key_token
+from wavelength_py.dal.dal_config import DalConfig
+from wavelength_py.dal.dao.commands.get_by_key_pynamo_command import PynamoGetByIdCommand
+from wavelength_py.errors.exceptions import Base404Exception
+from test.dal.dao.commands.test_pynamo_command import get_persitence_model_mock
+from test.dal.dao.test_platform_persistence_model import DbModelTestMock
+from test.dal.pynamo_models.test_cachable_pynamo_model import ManualTimer
+
+
+class KeyFilteredDbModelTestMock(DbModelTestMock):
+    class Meta:
+        table_name = 'key-filter-test-table'
+        key_filter_capacity = 100
+        key_filter_max_age = 60
+
+
+class SkippingKeyFilteredDbModelTestMock(KeyFilteredDbModelTestMock):
+    class Meta:
+        table_name = 'key-filter-test-table'
+        key_filter_capacity = 100
+        key_filter_max_age = 3600
+        key_filter_skip_reads = True
+
+
+class TestBloomFilter(unittest.TestCase):
+
+    def test_added_keys_are_always_found(self):
+        bloom = BloomFilter(1000, 0.01)
+        for index in range(1000):
+            bloom.add(str(index))
+
+        self.assertTrue(all(str(index) in bloom for index in range(1000)))
+        self.assertEqual(bloom.count, 1000)
+
+    def test_false_positive_rate_at_capacity(self):
+        bloom = BloomFilter(1000, 0.01)
+        for index in range(1000):
+            bloom.add(str(index))
+
+        false_positives = sum(1 for index in range(1000, 11000) if str(index) in bloom)
+        self.assertLess(false_positives / 10000, 0.03)
+        self.assertAlmostEqual(bloom.estimated_fp_rate, 0.01, delta=0.005)
+
+    def test_serialization(self):
+        bloom = BloomFilter(100, 0.01, built_at=123.0)
+        bloom.add('a')
+
+        result = BloomFilter.from_bytes(bloom.to_bytes())
+
+        self.assertIn('a', result)
+        self.assertEqual((result.count, result.built_at, result.bits), (1, 123.0, bloom.bits))
+        with self.assertRaises(ValueError):
+            BloomFilter.from_bytes(b'not a filter')
+        with self.assertRaises(ValueError):
+            BloomFilter.from_bytes(bloom.to_bytes()[:-1])
+
+    def test_key_token(self):
+        self.assertEqual(get_key_token(('1234', None)), get_key_token(['1234']))
+        self.assertEqual(get_key_token((5.0, 'a')), get_key_token((5, 'a')))
+        self.assertNotEqual(get_key_token(('1234', 'a')), get_key_token(('1234a',)))
+
+
+scan_mock = MagicMock()
+
+
+@patch.object(KeyFilteredDbModelTestMock, 'scan', scan_mock)
+class TestKeyFilterRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.timer = ManualTimer()
+        self.timer.now = 1000.0
+        self.registry = KeyFilterRegistry(timer=self.timer, directory=self.directory.name)
+        scan_mock.reset_mock()
+        scan_mock.side_effect = lambda **kwargs: iter([
+            KeyFilteredDbModelTestMock(account_id='1234', range_id=range_id) for range_id in ('a', 'b')])
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_opt_in(self):
+        self.assertIsNone(self.registry.get(DbModelTestMock))
+        self.assertFalse(self.registry.is_missing(DbModelTestMock, ('1234', 'z')))
+        with self.assertRaises(ValueError):
+            self.registry.build(DbModelTestMock)
+
+    def test_lookups_pass_through_until_built(self):
+        self.assertFalse(self.registry.is_missing(KeyFilteredDbModelTestMock, ('1234', 'z')))
+
+        self.registry.build(KeyFilteredDbModelTestMock)
+
+        scan_mock.assert_called_once_with(attributes_to_get=['account_id', 'range_id'])
+        self.assertFalse(self.registry.is_missing(KeyFilteredDbModelTestMock, ('1234', 'a')))
+        self.assertTrue(self.registry.is_missing(KeyFilteredDbModelTestMock, ('1234', 'z')))
+
+    def test_created_keys_are_added(self):
+        self.registry.build(KeyFilteredDbModelTestMock)
+        self.registry.add(KeyFilteredDbModelTestMock, ['1234', 'z'])
+
+        self.assertFalse(self.registry.is_missing(KeyFilteredDbModelTestMock, ('1234', 'z')))
+
+    def test_keys_written_during_a_build_are_merged(self):
+        def scan(**kwargs):
+            yield KeyFilteredDbModelTestMock(account_id='1234', range_id='a')
+            self.registry.add(KeyFilteredDbModelTestMock, ['1234', 'z'])
+
+        scan_mock.side_effect = scan
+        self.registry.build(KeyFilteredDbModelTestMock)
+
+        self.assertFalse(self.registry.is_missing(KeyFilteredDbModelTestMock, ('1234', 'z')))
+        self.assertTrue(self.registry.is_missing(KeyFilteredDbModelTestMock, ('1234', 'y')))
+
+    def test_filters_are_loaded_from_disk(self):
+        self.registry.build(KeyFilteredDbModelTestMock)
+        self.assertTrue(os.path.exists(self.registry.get_path(KeyFilteredDbModelTestMock)))
+
+        registry = KeyFilterRegistry(timer=self.timer, directory=self.directory.name)
+
+        self.assertTrue(registry.is_missing(KeyFilteredDbModelTestMock, ('1234', 'z')))
+        scan_mock.assert_called_once()
+
+    def test_old_filters_are_not_trusted_and_rebuilt_by_warmup(self):
+        self.registry.build(KeyFilteredDbModelTestMock)
+        self.timer.now += 60
+
+        self.assertFalse(self.registry.is_missing(KeyFilteredDbModelTestMock, ('1234', 'z')))
+        self.registry.refresh()
+        self.assertTrue(self.registry.is_missing(KeyFilteredDbModelTestMock, ('1234', 'z')))
+        self.assertEqual(scan_mock.call_count, 2)
+
+    def test_models_skipping_reads_trust_filters_briefly(self):
+        self.assertFalse(self.registry.skips_reads(KeyFilteredDbModelTestMock))
+        self.assertTrue(self.registry.skips_reads(SkippingKeyFilteredDbModelTestMock))
+        self.registry.build(SkippingKeyFilteredDbModelTestMock)
+        self.timer.now += DalConfig.key_filter_skip_max_age
+
+        self.assertFalse(self.registry.is_missing(SkippingKeyFilteredDbModelTestMock, ('1234', 'z')))
+
+    def test_fp_rates(self):
+        self.registry.build(KeyFilteredDbModelTestMock)
+        self.registry.record_lookup(KeyFilteredDbModelTestMock, missing=True, found=False)
+        self.registry.record_lookup(KeyFilteredDbModelTestMock, missing=False, found=False)
+        self.registry.record_lookup(KeyFilteredDbModelTestMock, missing=True, found=True)
+        self.registry.record_lookup(KeyFilteredDbModelTestMock, missing=False, found=True)
+
+        rates = self.registry.fp_rates()['key-filter-test-table']
+
+        self.assertEqual(rates['observed'], 0.5)
+        self.assertEqual(rates['stale'], 0.5)
+        self.assertLess(rates['estimated'], 0.01)
+
+
+class TestKeyFilteredGet(unittest.TestCase):
+
+    def get_command(self, get):
+        template = {
+            'table_state': DalConfig.table_state_new,
+            'kind': 'abcd'
+        }
+        model_mock = get_persitence_model_mock(template, template)
+        model_mock.db_model.get = get
+        return PynamoGetByIdCommand(model_mock, post_filter=MagicMock(return_value=True)), model_mock
+
+    @patch('wavelength_py.dal.dao.commands.get_by_key_pynamo_command.KEY_FILTERS')
+    def test_misses_are_still_read_by_default(self, key_filters):
+        key_filters.is_missing = MagicMock(return_value=True)
+        key_filters.skips_reads = MagicMock(return_value=False)
+        command, model_mock = self.get_command(MagicMock())
+        model_mock.db_model.get.return_value = model_mock.db_model
+
+        command('1234', 'z')
+
+        model_mock.db_model.get.assert_called_once()
+        key_filters.record_lookup.assert_called_once_with(model_mock.db_model, True, found=True)
+
+    @patch('wavelength_py.dal.dao.commands.get_by_key_pynamo_command.KEY_FILTERS')
+    def test_misses_skip_dynamodb_when_opted_in(self, key_filters):
+        key_filters.is_missing = MagicMock(return_value=True)
+        key_filters.skips_reads = MagicMock(return_value=True)
+        command, model_mock = self.get_command(MagicMock())
+
+        with self.assertRaises(Base404Exception):
+            command('1234', 'z')
+        model_mock.db_model.get.assert_not_called()
+
+    @patch('wavelength_py.dal.dao.commands.get_by_key_pynamo_command.KEY_FILTERS')
+    def test_false_positives_are_counted(self, key_filters):
+        key_filters.is_missing = MagicMock(return_value=False)
+        command, model_mock = self.get_command(MagicMock(side_effect=DbModelTestMock.DoesNotExist()))
+
+        with self.assertRaises(Base404Exception):
+            command('1234', 'z')
+        key_filters.record_lookup.assert_called_once_with(model_mock.db_model, False, found=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
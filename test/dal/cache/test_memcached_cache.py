@@ -0,0 +1,220 @@
+# -*- coding: utf-8 - *-
+
+import unittest
+
+from mock import MagicMock, patch
+from pynamodb.attributes import UnicodeAttribute, NumberAttribute
+from pymemcache.exceptions import MemcacheUnexpectedCloseError
+
+from wavelength_py.dal.cache.memcached_cache import MemcachedCache
+from wavelength_py.dal.cache.model_cache import ModelCacheRegistry
+from wavelength_py.dal.pynamo_models.cachable_pynamo_model import CachingPynamoModel
+from test.dal.dao.test_platform_persistence_model import DbModelTestMock
+from test.dal.pynamo_models.test_cachable_pynamo_model import ManualTimer
+
+
+class FakeMemcacheClient:
+    """ In-process stand in for a pymemcache client """
+
+    def __init__(self):
+        self.data = {}
+        self.get_many_calls = 0
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def gets(self, key):
+        if key not in self.data:
+            return None, None
+        return self.data[key], str(hash(self.data[key])).encode('utf-8')
+
+    def gets_many(self, keys):
+        return {key: self.gets(key) for key in keys if key in self.data}
+
+    def cas(self, key, value, cas, expire=0, noreply=False):
+        if key not in self.data:
+            return None
+        if self.gets(key)[1] != cas:
+            return False
+        return self.set(key, value, expire)
+
+    def get_many(self, keys):
+        self.get_many_calls += 1
+        return {key: self.data[key] for key in keys if key in self.data}
+
+    def set(self, key, value, expire=0, noreply=None):
+        self.data[key] = value.encode('utf-8') if isinstance(value, str) else value
+        return True
+
+    def set_many(self, values, expire=0, noreply=None):
+        for key, value in values.items():
+            self.set(key, value, expire)
+        return True
+
+    def add(self, key, value, expire=0, noreply=None):
+        if key in self.data:
+            return False
+        return self.set(key, value, expire)
+
+    def delete(self, key, noreply=None):
+        return self.data.pop(key, None) is not None
+
+    def incr(self, key, value, noreply=False):
+        if key not in self.data:
+            return None
+        result = int(self.data[key]) + value
+        self.data[key] = str(result).encode('utf-8')
+        return result
+
+
+class CachingDbModelTestMock(CachingPynamoModel):
+    class Meta:
+        table_name = 'memcached-test-table'
+        cache_ttl = 10
+
+    account_id = UnicodeAttribute(hash_key=True)
+    range_id = UnicodeAttribute(range_key=True)
+    version = NumberAttribute(null=True)
+
+
+class ChangedDbModelTestMock(DbModelTestMock):
+    """ Same table, different layout, as another deploy would see it """
+    extra = UnicodeAttribute(null=True)
+
+
+def get_record(range_id, version=1):
+    return DbModelTestMock(account_id='1234', range_id=range_id, kind='k', blob='payload', version=version)
+
+
+class TestMemcachedCache(unittest.TestCase):
+
+    def test_disabled_without_client(self):
+        cache = MemcachedCache(client_factory=lambda: None)
+        cache.put_items([get_record('a')])
+
+        self.assertFalse(cache.available)
+        self.assertEqual(cache.get_items(DbModelTestMock, [('1234', 'a')]), {})
+
+    def test_items_round_trip_with_get_many(self):
+        client = FakeMemcacheClient()
+        cache = MemcachedCache(client_factory=lambda: client)
+        cache.put_items([get_record('a', 3), get_record('b')])
+
+        result = cache.get_items(DbModelTestMock, [('1234', 'a'), ('1234', 'b'), ('1234', 'c')])
+
+        self.assertEqual(client.get_many_calls, 1)
+        self.assertEqual(sorted(result), [('1234', 'a'), ('1234', 'b')])
+        self.assertEqual(result[('1234', 'a')].version, 3)
+        self.assertEqual(result[('1234', 'a')].blob, 'payload')
+        self.assertEqual(cache.stats.misses, 1)
+
+        cache.delete_item(get_record('a'))
+        self.assertEqual(list(cache.get_items(DbModelTestMock, [('1234', 'a')])), [])
+
+    def test_put_item_keeps_newer_version(self):
+        client = FakeMemcacheClient()
+        cache = MemcachedCache(client_factory=lambda: client)
+        cache.put_item(get_record('a', 3))
+        cache.put_item(get_record('a', 2))
+
+        self.assertEqual(cache.get_items(DbModelTestMock, [('1234', 'a')])[('1234', 'a')].version, 3)
+
+        cache.put_item(get_record('a', 4))
+        self.assertEqual(cache.get_items(DbModelTestMock, [('1234', 'a')])[('1234', 'a')].version, 4)
+
+    def test_put_items_keeps_newer_versions(self):
+        client = FakeMemcacheClient()
+        cache = MemcachedCache(client_factory=lambda: client)
+        cache.put_item(get_record('a', 3))
+        cache.put_items([get_record('a', 2), get_record('b', 1)])
+
+        result = cache.get_items(DbModelTestMock, [('1234', 'a'), ('1234', 'b')])
+        self.assertEqual(result[('1234', 'a')].version, 3)
+        self.assertEqual(result[('1234', 'b')].version, 1)
+
+        cache.put_items([get_record('a', 4)])
+        self.assertEqual(cache.get_items(DbModelTestMock, [('1234', 'a')])[('1234', 'a')].version, 4)
+
+    def test_keys_depend_on_model_layout(self):
+        client = FakeMemcacheClient()
+        cache = MemcachedCache(client_factory=lambda: client)
+        cache.put_items([get_record('a')])
+
+        self.assertEqual(cache.get_items(ChangedDbModelTestMock, [('1234', 'a')]), {})
+
+    def test_query_pages_are_invalidated_by_generation(self):
+        client = FakeMemcacheClient()
+        cache = MemcachedCache(client_factory=lambda: client)
+        page, generation = cache.get_query(DbModelTestMock, None, '1234', ('query',))
+        self.assertIsNone(page)
+        cache.put_query(DbModelTestMock, None, '1234', ('query',), [get_record('a')], 'token', generation)
+
+        page, _ = cache.get_query(DbModelTestMock, None, '1234', ('query',))
+        self.assertEqual([record.range_id for record in page[0]], ['a'])
+        self.assertEqual(page[1], 'token')
+
+        cache.put_query(DbModelTestMock, 'kind-index', 'k', ('query',), [get_record('a')], None, None)
+        cache.invalidate_partition(DbModelTestMock, '5678')
+        self.assertIsNotNone(cache.get_query(DbModelTestMock, None, '1234', ('query',))[0])
+        self.assertIsNone(cache.get_query(DbModelTestMock, 'kind-index', 'k', ('query',))[0])
+
+        cache.invalidate_partition(DbModelTestMock, '1234')
+        self.assertIsNone(cache.get_query(DbModelTestMock, None, '1234', ('query',))[0])
+
+    def test_page_stored_with_outdated_generation_is_ignored(self):
+        client = FakeMemcacheClient()
+        cache = MemcachedCache(client_factory=lambda: client)
+        cache.invalidate_partition(DbModelTestMock, '1234')
+        _, generation = cache.get_query(DbModelTestMock, None, '1234', ('query',))
+        cache.invalidate_partition(DbModelTestMock, '1234')  # a write lands while the query runs
+        cache.put_query(DbModelTestMock, None, '1234', ('query',), [get_record('a')], None, generation)
+
+        self.assertIsNone(cache.get_query(DbModelTestMock, None, '1234', ('query',))[0])
+
+    def test_falls_back_when_unreachable(self):
+        timer = ManualTimer()
+        client = MagicMock()
+        client.get_many.side_effect = ConnectionRefusedError()
+        client.gets_many.side_effect = MemcacheUnexpectedCloseError()
+        cache = MemcachedCache(client_factory=lambda: client, retry_interval=30, timer=timer)
+
+        cache.put_items([get_record('a')])
+        self.assertEqual(cache.get_items(DbModelTestMock, [('1234', 'a')]), {})
+        self.assertEqual(cache.get_query(DbModelTestMock, None, '1234', ('query',)), (None, None))
+
+        self.assertEqual(cache.errors, 1)
+        client.get_many.assert_not_called()
+
+        timer.now += 30
+        cache.get_items(DbModelTestMock, [('1234', 'a')])
+        client.get_many.assert_called_once()
+
+
+class TestCachingPynamoModelSecondLevel(unittest.TestCase):
+
+    def test_get_and_batch_get_read_through_memcached(self):
+        shared = MemcachedCache(client_factory=FakeMemcacheClient)
+        record = CachingDbModelTestMock(account_id='1234', range_id='a', version=2)
+        shared.put_items([record, CachingDbModelTestMock(account_id='1234', range_id='b', version=1)])
+        mock_get = MagicMock()
+        mock_batch_get = MagicMock(return_value=iter([CachingDbModelTestMock(account_id='1234', range_id='c', version=1)]))
+
+        with patch('wavelength_py.dal.pynamo_models.cachable_pynamo_model.MEMCACHED_CACHE', shared), \
+                patch('wavelength_py.dal.pynamo_models.cachable_pynamo_model.CACHE_REGISTRY', ModelCacheRegistry()), \
+                patch('wavelength_py.dal.pynamo_models.cachable_pynamo_model.PynamoModel.get', mock_get), \
+                patch('wavelength_py.dal.pynamo_models.cachable_pynamo_model.PynamoModel.batch_get', mock_batch_get):
+            self.assertEqual(CachingDbModelTestMock.get('1234', 'a').version, 2)
+            self.assertEqual(CachingDbModelTestMock.get_cache().stats.misses, 1)
+            CachingDbModelTestMock.get('1234', 'a')
+            self.assertEqual(CachingDbModelTestMock.get_cache().stats.hits, 1)
+
+            result = CachingDbModelTestMock.batch_get([('1234', 'a'), ('1234', 'b'), ('1234', 'c')])
+            self.assertEqual(sorted(item.range_id for item in result), ['a', 'b', 'c'])
+
+        mock_get.assert_not_called()
+        self.assertEqual(mock_batch_get.call_args[0][0], [('1234', 'c')])
+        self.assertEqual(shared.get_items(CachingDbModelTestMock, [('1234', 'c')])[('1234', 'c')].version, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
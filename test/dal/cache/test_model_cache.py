@@ -0,0 +1,118 @@
+# -*- coding: utf-8 - *-
+
+import unittest
+
+from wavelength_py.dal.cache.model_cache import ModelCache, ModelCacheRegistry, NOT_FOUND
+from wavelength_py.dal.cache.record_codec import CompactRecord
+from test.dal.dao.test_platform_persistence_model import DbModelTestMock
+from test.dal.pynamo_models.test_cachable_pynamo_model import ManualTimer
+
+
+class ModelTestMock:
+    class Meta:
+        table_name = 'test-table'
+        cache_maxsize = 2
+        cache_ttl = 10
+        cache_policy = 'lfu'
+
+
+class TestModelCache(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        cache = ModelCache(maxsize=2, ttl=10)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertEqual(cache.stats.evictions, 1)
+
+    def test_lfu_eviction(self):
+        cache = ModelCache(maxsize=2, ttl=10, policy='LFU')
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.get('a')
+        cache.get('b')
+        cache.put('c', 3)
+
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+
+    def test_ttl(self):
+        timer = ManualTimer()
+        cache = ModelCache(maxsize=2, ttl=10, timer=timer)
+        cache.put('a', 1)
+
+        self.assertEqual(cache.get('a'), 1)
+        timer.now += 10
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats.to_dict(), {'hits': 1, 'misses': 1, 'negative_hits': 0, 'stale_hits': 0,
+                                                 'evictions': 0, 'expirations': 1, 'hit_rate': 0.5})
+
+    def test_negative_entries(self):
+        timer = ManualTimer()
+        disabled = ModelCache(maxsize=2, ttl=10)
+        cache = ModelCache(maxsize=2, ttl=10, negative_ttl=1, timer=timer)
+        disabled.put_missing('a')
+        cache.put_missing('a')
+
+        self.assertIsNone(disabled.get('a'))
+        self.assertIs(cache.get('a'), NOT_FOUND)
+        timer.now += 1
+        self.assertIsNone(cache.get('a'))
+
+    def test_min_version(self):
+        cache = ModelCache(maxsize=2, ttl=10, negative_ttl=10)
+        cache.put('a', 'v2', version=2)
+        cache.put_missing('b')
+
+        self.assertEqual(cache.get('a', min_version=2), 'v2')
+        self.assertIsNone(cache.get('a', min_version=3))
+        self.assertIsNone(cache.get('b', min_version=1))
+        self.assertEqual(cache.stats.stale_hits, 2)
+
+    def test_put_never_downgrades(self):
+        timer = ManualTimer()
+        cache = ModelCache(maxsize=2, ttl=10, timer=timer)
+        cache.put('a', 'v3', version=3)
+        cache.put('a', 'v2', version=2)
+
+        self.assertEqual(cache.get('a'), 'v3')
+        timer.now += 11
+        cache.put('a', 'v2', version=2)
+        self.assertEqual(cache.get('a'), 'v2')
+
+    def test_records_are_stored_compact(self):
+        cache = ModelCache(maxsize=2, ttl=10)
+        record = DbModelTestMock(account_id='1234', range_id='abcd', blob='x' * 4096, version=1)
+        cache.put('a', record)
+
+        self.assertIsInstance(cache._cache['a'][1], CompactRecord)
+        self.assertLess(cache.memory_size, 1024)
+        self.assertIsNot(cache.get('a'), record)
+        self.assertEqual(cache.get('a').blob, record.blob)
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            ModelCache(maxsize=2, ttl=10, policy='FIFO')
+
+
+class TestModelCacheRegistry(unittest.TestCase):
+
+    def test_builds_cache_from_meta(self):
+        registry = ModelCacheRegistry()
+        cache = registry.get(ModelTestMock)
+
+        self.assertIs(registry.get(ModelTestMock), cache)
+        self.assertEqual((cache.maxsize, cache.ttl, cache.policy), (2, 10, 'LFU'))
+        self.assertIn('test-table', registry.stats())
+
+        registry.reset(ModelTestMock)
+        self.assertIsNot(registry.get(ModelTestMock), cache)
+
+
+if __name__ == '__main__':
+    unittest.main()
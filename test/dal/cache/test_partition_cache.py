@@ -0,0 +1,134 @@
+# -*- coding: utf-8 - *-
+
+import unittest
+
+from mock import MagicMock, patch
+
+from wavelength_py.dal.cache.partition_cache import PartitionCache
+from wavelength_py.dal.cache.query_cache import QueryResultCache
+from wavelength_py.dal.dal_config import DalConfig
+from wavelength_py.dal.dao.commands.pynamo_command import FilterModel, always_pass
+from wavelength_py.dal.dao.commands.pynamo_query_args import PynamoQueryArguments
+from wavelength_py.dal.dao.commands.query_pynamo_command import PynamoQueryCommand
+from wavelength_py.dal.pynamo_models.cachable_pynamo_model import CachingPynamoModel
+from wavelength_py.errors.exceptions import CircuitOpenException
+from test.dal.dao.test_platform_persistence_model import DbModelTestMock
+from test.dal.pynamo_models.test_cachable_pynamo_model import ManualTimer
+
+
+class PartitionCachedDbModelTestMock(CachingPynamoModel, DbModelTestMock):
+    class Meta:
+        table_name = 'partition-test-table'
+        partition_cache_max_items = 3
+        partition_cache_ttl = 60
+
+    def to_json(self):
+        return {'range_id': self.range_id}
+
+
+def get_records(*range_ids):
+    return [PartitionCachedDbModelTestMock(account_id='1234', range_id=range_id,
+                                           kind='odd' if index % 2 == 0 else 'even',
+                                           table_state=DalConfig.table_state_new)
+            for index, range_id in enumerate(range_ids)]
+
+
+partition_cache = PartitionCache(ManualTimer())
+query_mock = MagicMock()
+
+
+@patch('wavelength_py.dal.pynamo_models.cachable_pynamo_model.PARTITION_CACHE', partition_cache)
+@patch('wavelength_py.dal.dao.commands.pynamo_command.PARTITION_CACHE', partition_cache)
+@patch('wavelength_py.dal.pynamo_models.cachable_pynamo_model.PynamoModel.query', query_mock)
+@patch('wavelength_py.dal.pynamo_models.cachable_pynamo_model.PynamoModel.save', MagicMock(return_value=None))
+class TestPartitionCache(unittest.TestCase):
+
+    def setUp(self):
+        partition_cache.clear()
+        query_mock.reset_mock()
+        query_mock.side_effect = lambda *args, **kwargs: iter(get_records('a', 'b', 'c'))
+
+    def get_command(self):
+        mock_parent = MagicMock()
+        mock_parent.db_model = PartitionCachedDbModelTestMock
+        mock_parent.db_hash_key = 'account_id'
+        mock_parent.db_range_key = 'range_id'
+        mock_parent.get_key = MagicMock(return_value=['1234', 'a'])
+        mock_parent.build_trusted = MagicMock(side_effect=lambda source, fields=None: source['range_id'])
+        return PynamoQueryCommand(mock_parent, post_filter=always_pass), mock_parent
+
+    def test_opt_in(self):
+        self.assertEqual(partition_cache.get_max_items(PartitionCachedDbModelTestMock), 3)
+        self.assertIsNone(partition_cache.get_max_items(DbModelTestMock))
+        self.assertIsNone(partition_cache.get(DbModelTestMock, '1234'))
+
+    def test_partition_is_loaded_once(self):
+        first = PartitionCachedDbModelTestMock.get_partition('1234')
+        second = PartitionCachedDbModelTestMock.get_partition('1234')
+
+        self.assertEqual([record.range_id for record in second], ['a', 'b', 'c'])
+        self.assertIsNot(first[0], second[0])
+        query_mock.assert_called_once_with('1234', scan_index_forward=True)
+
+    def test_oversized_partitions_are_not_cached(self):
+        query_mock.side_effect = lambda *args, **kwargs: iter(get_records('a', 'b', 'c', 'd'))
+
+        self.assertIsNone(PartitionCachedDbModelTestMock.get_partition('1234'))
+        self.assertIsNone(PartitionCachedDbModelTestMock.get_partition('1234'))
+        query_mock.assert_called_once()
+
+    def test_writes_invalidate_the_partition(self):
+        PartitionCachedDbModelTestMock.get_partition('1234')
+        PartitionCachedDbModelTestMock(account_id='1234', range_id='d').save()
+        PartitionCachedDbModelTestMock.get_partition('1234')
+
+        self.assertEqual(query_mock.call_count, 2)
+
+    def test_loads_racing_a_write_are_discarded(self):
+        generation = partition_cache.get_generation(PartitionCachedDbModelTestMock)
+        partition_cache.invalidate(PartitionCachedDbModelTestMock, '1234')
+        partition_cache.put(PartitionCachedDbModelTestMock, '1234', get_records('a'), generation)
+
+        self.assertIsNone(partition_cache.get(PartitionCachedDbModelTestMock, '1234'))
+
+    def test_query_is_answered_from_the_partition(self):
+        command, _ = self.get_command()
+        query = PynamoQueryArguments('1234', range_key_filter=[FilterModel('range_id', 'gte', 'a')],
+                                     filters=[FilterModel('kind', 'eq', 'odd')], scan_index_forward=True, limit=2)
+
+        first = command(query)
+        second = command(PynamoQueryArguments('1234', range_key_filter=[FilterModel('range_id', 'gte', 'a')],
+                                              filters=[FilterModel('kind', 'eq', 'odd')], scan_index_forward=True,
+                                              limit=2, start_token=first.start_token))
+
+        self.assertEqual(list(first.items), ['a'])
+        self.assertEqual(list(second.items), ['c'])
+        self.assertIsNone(second.start_token)
+        query_mock.assert_called_once()
+
+    def test_query_after_a_write_reloads_the_partition(self):
+        command, _ = self.get_command()
+        command(PynamoQueryArguments('1234', scan_index_forward=True))
+        command._invalidate_queries()
+        result = command(PynamoQueryArguments('1234', scan_index_forward=False))
+
+        self.assertEqual(list(result.items), ['c', 'b', 'a'])
+        self.assertEqual(query_mock.call_count, 2)
+
+    def test_open_breakers_are_answered_from_the_stale_partition(self):
+        command, _ = self.get_command()
+        command(PynamoQueryArguments('1234', scan_index_forward=True))
+        partition_cache._timer.now += 61
+        query_mock.side_effect = CircuitOpenException('open')
+
+        with patch('wavelength_py.dal.dao.commands.query_pynamo_command.QUERY_CACHE', QueryResultCache(ttl=0)):
+            result = command(PynamoQueryArguments('1234', scan_index_forward=False))
+
+            self.assertEqual(list(result.items), ['c', 'b', 'a'])
+            command._invalidate_queries()
+            with self.assertRaises(CircuitOpenException):
+                command(PynamoQueryArguments('1234', scan_index_forward=False))
+
+
+if __name__ == '__main__':
+    unittest.main()
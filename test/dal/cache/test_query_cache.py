@@ -0,0 +1,118 @@
+# -*- coding: utf-8 - *-
+
+import unittest
+
+from mock import MagicMock
+
+from wavelength_py.dal.cache.query_cache import QueryResultCache, QueryCacheEntry
+from wavelength_py.dal.cache.record_codec import get_deep_size
+from test.dal.pynamo_models.test_cachable_pynamo_model import ManualTimer
+
+
+def get_db_model_mock(table_name):
+    result = MagicMock()
+    result.Meta.table_name = table_name
+    return result
+
+
+def get_entry(payload_size=10):
+    record = MagicMock()
+    record.attribute_values = {'account_id': '1234', 'payload': 'x' * payload_size}
+    return QueryCacheEntry([record], None)
+
+
+class TestQueryResultCache(unittest.TestCase):
+
+    def test_entries_expire(self):
+        timer = ManualTimer()
+        cache = QueryResultCache(max_bytes=1024 * 1024, ttl=10, timer=timer)
+        key = cache.get_key(get_db_model_mock('table'), None, '1234', ('query',))
+        entry = get_entry()
+        cache.put(key, entry)
+
+        self.assertEqual(cache.get(key).records, entry.records)
+        timer.now += 11
+        self.assertIsNone(cache.get(key))
+
+    def test_bounded_by_bytes(self):
+        entry_size = get_entry(1000).size
+        cache = QueryResultCache(max_bytes=entry_size * 2, ttl=10)
+        db_model = get_db_model_mock('table')
+        for query in range(3):
+            cache.put(cache.get_key(db_model, None, '1234', (query,)), get_entry(1000))
+
+        self.assertIsNone(cache.get(cache.get_key(db_model, None, '1234', (0,))))
+        self.assertIsNotNone(cache.get(cache.get_key(db_model, None, '1234', (2,))))
+        self.assertLessEqual(cache.size, entry_size * 2)
+
+        cache.put(cache.get_key(db_model, None, '1234', ('huge',)), get_entry(entry_size * 2))
+        self.assertIsNone(cache.get(cache.get_key(db_model, None, '1234', ('huge',))))
+
+    def test_invalidate_partition(self):
+        cache = QueryResultCache(max_bytes=1024 * 1024, ttl=10)
+        table, other_table = get_db_model_mock('table'), get_db_model_mock('other-table')
+        keys = {
+            'written': cache.get_key(table, None, '1234', ('query',)),
+            'other_partition': cache.get_key(table, None, '5678', ('query',)),
+            'index': cache.get_key(table, 'kind-index', 'abcd', ('query',)),
+            'other_table': cache.get_key(other_table, None, '1234', ('query',)),
+        }
+        for key in keys.values():
+            cache.put(key, get_entry())
+
+        cache.invalidate(table, '1234')
+
+        self.assertIsNone(cache.get(keys['written']))
+        self.assertIsNone(cache.get(keys['index']))
+        self.assertIsNotNone(cache.get(keys['other_partition']))
+        self.assertIsNotNone(cache.get(keys['other_table']))
+
+    def test_entries_loaded_under_an_older_generation_are_dropped(self):
+        cache = QueryResultCache(max_bytes=1024 * 1024, ttl=10)
+        db_model = get_db_model_mock('table')
+        stale, fresh = (cache.get_key(db_model, None, '1234', (query,)) for query in ('stale', 'fresh'))
+
+        cache.put(stale, QueryCacheEntry(get_entry().records, None, generation=1), generation=2)
+        self.assertIsNone(cache.get(stale, 2))
+
+        cache.put(fresh, QueryCacheEntry(get_entry().records, None, generation=2), generation=2)
+        self.assertIsNotNone(cache.get(fresh, 2))
+        self.assertIsNone(cache.get(fresh, 3))
+
+    def test_invalidate_after_evicted_keys_were_pruned(self):
+        cache = QueryResultCache(max_bytes=get_entry().size * 2, ttl=10)
+        db_model = get_db_model_mock('table')
+        for query in range(40):
+            cache.put(cache.get_key(db_model, None, str(query), ('query',)), get_entry())
+        key = cache.get_key(db_model, None, '1234', ('query',))
+        cache.put(key, get_entry())
+
+        self.assertLessEqual(sum(len(keys) for keys in cache._partitions.values()), 2 * 2 + 16)
+        cache.invalidate(db_model, '1234')
+        self.assertIsNone(cache.get(key))
+        self.assertIsNone(cache.peek(key))
+
+    def test_peek_ignores_ttl_and_generation(self):
+        timer = ManualTimer()
+        cache = QueryResultCache(max_bytes=1024 * 1024, ttl=10, timer=timer)
+        key = cache.get_key(get_db_model_mock('table'), None, '1234', ('query',))
+        cache.put(key, get_entry(), generation=0)
+        timer.now += 11
+
+        self.assertIsNone(cache.get(key, 1))
+        self.assertIsNotNone(cache.peek(key))
+        self.assertEqual(cache.stats.stale_hits, 1)
+
+    def test_disabled(self):
+        cache = QueryResultCache(max_bytes=1024, ttl=0)
+        key = cache.get_key(get_db_model_mock('table'), None, '1234', ('query',))
+        cache.put(key, get_entry())
+
+        self.assertIsNone(cache.get(key))
+
+    def test_get_deep_size(self):
+        self.assertGreater(get_deep_size({'a': ['x' * 100]}), get_deep_size({'a': ['x']}) + 90)
+
+
+if __name__ == '__main__':
+    unittest.main()
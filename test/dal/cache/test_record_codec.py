@@ -0,0 +1,90 @@
+# -*- coding: utf-8 - *-
+
+import unittest
+
+from mock import patch
+from pynamodb.attributes import ListAttribute, MapAttribute, UnicodeAttribute
+from pynamodb.models import Model as PynamoModel
+
+from wavelength_py.dal.cache.record_codec import CompactRecord, FrozenMap, compact, dumps, expand, get_deep_size, \
+    get_encoded_size, serialize_record
+from test.dal.dao.test_platform_persistence_model import DbModelTestMock
+
+
+class NestedModel(PynamoModel):
+    class Meta:
+        table_name = 'nested-table'
+
+    key = UnicodeAttribute(hash_key=True)
+    tags = ListAttribute()
+    settings = MapAttribute()
+
+
+def get_record(blob='payload'):
+    return DbModelTestMock(account_id='1234', range_id='abcd', kind='k', blob=blob, version=2)
+
+
+class TestRecordCodec(unittest.TestCase):
+
+    def test_round_trip(self):
+        record = get_record()
+        entry = CompactRecord(record)
+
+        self.assertFalse(entry.compressed)
+        self.assertIsInstance(entry.payload, tuple)
+        self.assertLess(entry.size, get_deep_size(record.attribute_values) + get_deep_size(record.__dict__))
+
+        result = entry.decode()
+        self.assertIsNot(result, record)
+        self.assertIsNot(result, entry.decode())
+        self.assertEqual(serialize_record(result), serialize_record(record))
+
+    def test_attribute_names_are_interned(self):
+        first, second = CompactRecord(get_record()), CompactRecord(get_record())
+
+        self.assertIs(first.payload[0][0], second.payload[0][0])
+
+    def test_compresses_above_threshold(self):
+        record = get_record('x' * 4096)
+        entry = CompactRecord(record, compress_threshold=1024)
+
+        self.assertTrue(entry.compressed)
+        self.assertLess(entry.size, 1024)
+        self.assertEqual(entry.decode().blob, 'x' * 4096)
+        self.assertFalse(CompactRecord(record, compress_threshold=0).compressed)
+
+    def test_encoded_size_is_estimated(self):
+        raw = serialize_record(get_record('x' * 100))
+
+        self.assertEqual(get_encoded_size(raw), len(dumps(raw)))
+
+    def test_small_records_are_not_encoded(self):
+        with patch('wavelength_py.dal.cache.record_codec.dumps') as dumps:
+            self.assertFalse(CompactRecord(get_record(), compress_threshold=1024).compressed)
+        dumps.assert_not_called()
+
+    def test_nested_values_are_frozen(self):
+        record = NestedModel(key='1', tags=['a', 'b'], settings={'colors': {'fg': 'red'}})
+        entry = CompactRecord(record, compress_threshold=0)
+
+        payload = dict((name, value) for name, _, value in entry.payload)
+        self.assertIsInstance(payload['tags'], tuple)
+        self.assertIsInstance(payload['settings'], FrozenMap)
+
+        result = entry.decode()
+        result.tags.append('c')
+        result.settings['colors']['fg'] = 'blue'
+        fresh = entry.decode()
+        self.assertEqual(fresh.tags, ['a', 'b'])
+        self.assertEqual(fresh.settings['colors']['fg'], 'red')
+
+    def test_other_values_are_unchanged(self):
+        value = {'not': 'a record'}
+
+        self.assertIs(compact(value), value)
+        self.assertIs(expand(value), value)
+        self.assertEqual(expand(compact(get_record())).kind, 'k')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,6 +7,7 @@ from pynamodb.exceptions import DoesNotExist, PynamoDBConnectionError
 
 from wavelength_py.dal.dal_config import DalConfig
 from wavelength_py.dal.dao.commands.base_update_pynamo_command import BaseUpdatePynamoCommand
+from wavelength_py.dal.dao.commands.post_filter_pynamo_command import filter_deleted_items
 from wavelength_py.errors.exceptions import Base422Exception, Base404Exception, Base409Exception, Base5xxException
 from test.dal.dao.commands.test_pynamo_command import get_persitence_model_mock, always_filter_out
 
@@ -97,5 +98,68 @@ class TestPostFilterPynamoCommand(unittest.TestCase):
 
         self.assertEqual(str(err.exception), 'Not Available')
 
-    if __name__ == '__main__':
-        unittest.main()
+    def test_optimistic_update_skips_read(self):
+        template = {
+            'table_state': DalConfig.table_state_new,
+            'kind': 'abcd'
+        }
+        mock_parent = get_persitence_model_mock(template, template)
+        mock_parent.version = 3
+        mock_parent.db_hash_key = 'kind'
+        mock_parent.db_model.update = MagicMock(return_value={})
+
+        command = BaseUpdatePynamoCommand(mock_parent, filter_deleted_items, optimistic=True)
+        command._execute()
+
+        mock_parent.db_model.get.assert_not_called()
+        mock_parent.db_model.update.assert_called_once()
+        mock_parent.db_model.version.set.assert_called_with(4)
+        mock_parent.push.assert_called_once()
+        mock_parent.flush_changes.assert_called_once()
+
+    def test_optimistic_update_maps_condition_failure_to_404(self):
+        template = {
+            'table_state': DalConfig.table_state_deleted,
+            'kind': 'abcd'
+        }
+        mock_parent = get_persitence_model_mock(template, template)
+        mock_parent.version = 3
+        mock_parent.db_hash_key = 'kind'
+        mock_parent.db_model.update = MagicMock(side_effect=get_condition_failure())
+        mock_parent.db_model.get = MagicMock(return_value=mock_parent)
+
+        command = BaseUpdatePynamoCommand(mock_parent, filter_deleted_items, optimistic=True)
+
+        with self.assertRaises(Base404Exception):
+            command._execute()
+        mock_parent.push.assert_not_called()
+
+    def test_optimistic_update_maps_condition_failure_to_409(self):
+        template = {
+            'table_state': DalConfig.table_state_modified,
+            'kind': 'abcd'
+        }
+        mock_parent = get_persitence_model_mock(template, template)
+        mock_parent.version = 3
+        mock_parent.db_hash_key = 'kind'
+        mock_parent.db_model.update = MagicMock(side_effect=get_condition_failure())
+        mock_parent.db_model.get = MagicMock(return_value=mock_parent)
+
+        command = BaseUpdatePynamoCommand(mock_parent, filter_deleted_items, optimistic=True)
+
+        with self.assertRaises(Base409Exception) as err:
+            command._execute()
+        self.assertEqual(str(err.exception), 'Model version conflict')
+
+
+def get_condition_failure():
+    return PynamoDBConnectionError(cause=ClientError({
+        'Error': {
+            'Code': 'ConditionalCheckFailedException',
+            'Message': 'The conditional request failed'
+        }
+    }, 'UpdateItem'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import logging
+import unittest
+
+from mock import MagicMock, patch
+
+from wavelength_py.dal.dal_config import DalConfig
+from wavelength_py.dal.dao.commands.batch_get_pynamo_command import PynamoBatchGetCommand
+from wavelength_py.errors.exceptions import Base429Exception, DeadlineExceededException
+from test.dal.dao.commands.test_pynamo_command import get_persitence_model_mock
+
+logging.basicConfig()
+log = logging.getLogger('logger')
+log.setLevel(logging.DEBUG)
+
+
+def raw_item(hash_id, table_state=DalConfig.table_state_new):
+    return {'hash_id': {'S': hash_id}, 'table_state': {'S': table_state}}
+
+
+def get_batch_model_mock():
+    template = {
+        'table_state': DalConfig.table_state_new,
+        'kind': 'abcd'
+    }
+    model_mock = get_persitence_model_mock(template, template)
+    model_mock.db_hash_key = 'hash_id'
+    model_mock.db_range_key = None
+    hash_attribute = MagicMock()
+    hash_attribute.attr_name = 'hash_id'
+    model_mock.db_model.get_attributes = MagicMock(return_value={'hash_id': hash_attribute})
+    model_mock.db_model._serialize_keys = MagicMock(side_effect=lambda hash_key, range_key=None: (hash_key, range_key))
+
+    def from_raw_data(data):
+        item = MagicMock()
+        item.table_state = data['table_state']['S']
+        item.to_json = MagicMock(return_value={'hashId': data['hash_id']['S']})
+        return item
+
+    model_mock.db_model.from_raw_data = MagicMock(side_effect=from_raw_data)
+    model_mock.build_trusted = MagicMock(side_effect=lambda source, fields=None: source['hashId'])
+    return model_mock
+
+
+class TestPynamoBatchGetCommand(unittest.TestCase):
+
+    def test_returns_items_in_key_order(self):
+        model_mock = get_batch_model_mock()
+        model_mock.db_model._batch_get_page = MagicMock(return_value=([raw_item('b'), raw_item('a')], None))
+
+        command = PynamoBatchGetCommand(model_mock)
+        result = command('a', 'missing', 'b', 'a')
+
+        self.assertEqual(result, ['a', 'b', 'a'])
+        model_mock.db_model._batch_get_page.assert_called_once()
+        requested = model_mock.db_model._batch_get_page.call_args[0][0]
+        self.assertEqual(requested, [{'hash_id': 'a'}, {'hash_id': 'missing'}, {'hash_id': 'b'}])
+
+    def test_filters_deleted_items(self):
+        model_mock = get_batch_model_mock()
+        model_mock.db_model._batch_get_page = MagicMock(
+            return_value=([raw_item('a'), raw_item('b', DalConfig.table_state_deleted)], None))
+
+        command = PynamoBatchGetCommand(model_mock)
+
+        self.assertEqual(command('a', 'b'), ['a'])
+
+    def test_chunks_requests(self):
+        model_mock = get_batch_model_mock()
+        model_mock.db_model._batch_get_page = MagicMock(return_value=([], None))
+
+        command = PynamoBatchGetCommand(model_mock)
+        command(*[str(i) for i in range(DalConfig.batch_get_page_limit + 1)])
+
+        self.assertEqual(model_mock.db_model._batch_get_page.call_count, 2)
+
+    @patch('wavelength_py.dal.dao.commands.batch_get_pynamo_command.time.sleep')
+    def test_retries_unprocessed_keys(self, mock_sleep):
+        model_mock = get_batch_model_mock()
+        model_mock.db_model._batch_get_page = MagicMock(side_effect=[
+            ([raw_item('a')], [{'hash_id': {'S': 'b'}}]),
+            ([raw_item('b')], None)
+        ])
+
+        command = PynamoBatchGetCommand(model_mock)
+
+        self.assertEqual(command('a', 'b'), ['a', 'b'])
+        mock_sleep.assert_called_once()
+        self.assertEqual(model_mock.db_model._batch_get_page.call_args[0][0], [{'hash_id': {'S': 'b'}}])
+
+    @patch('wavelength_py.dal.dao.commands.batch_get_pynamo_command.time.sleep')
+    def test_raises_429_when_keys_stay_unprocessed(self, _mock_sleep):
+        model_mock = get_batch_model_mock()
+        model_mock.db_model._batch_get_page = MagicMock(return_value=([], [{'hash_id': {'S': 'a'}}]))
+
+        command = PynamoBatchGetCommand(model_mock)
+
+        with self.assertRaises(Base429Exception):
+            command._gather_chunk([('a',)])
+
+    @patch('wavelength_py.dal.dao.commands.batch_get_pynamo_command.check_deadline',
+           side_effect=DeadlineExceededException())
+    def test_raises_503_before_the_next_chunk_at_the_deadline(self, mock_check_deadline):
+        model_mock = get_batch_model_mock()
+        model_mock.db_model._batch_get_page = MagicMock(return_value=([], None))
+
+        command = PynamoBatchGetCommand(model_mock)
+
+        with self.assertRaises(DeadlineExceededException):
+            command(*[str(i) for i in range(DalConfig.batch_get_page_limit + 1)])
+        model_mock.db_model._batch_get_page.assert_called_once()
+        mock_check_deadline.assert_called_once_with('batch_get')
+
+
+if __name__ == '__main__':
+    unittest.main()
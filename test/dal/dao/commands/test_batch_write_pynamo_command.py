@@ -0,0 +1,171 @@
+import logging
+import threading
+import unittest
+
+from mock import MagicMock, patch
+from pynamodb.attributes import UnicodeAttribute
+
+from wavelength_py.dal.cache.model_cache import NOT_FOUND
+from wavelength_py.dal.dal_config import DalConfig
+from wavelength_py.dal.dao.commands.batch_write_pynamo_command import PynamoBatchWriteCommand
+from wavelength_py.dal.pynamo_models.cachable_pynamo_model import CachingPynamoModel
+from wavelength_py.errors.exceptions import Base404Exception, Base422Exception, Base429Exception, DeadlineExceededException
+from test.dal.dao.commands.test_pynamo_command import get_persitence_model_mock
+
+logging.basicConfig()
+log = logging.getLogger('logger')
+log.setLevel(logging.DEBUG)
+
+
+class BatchCachedDbModelTestMock(CachingPynamoModel):
+    class Meta:
+        table_name = 'table'
+        cache_ttl = 10
+
+    hash_id = UnicodeAttribute(hash_key=True)
+
+
+def get_parent_mock(unprocessed=None):
+    parent = get_persitence_model_mock({}, {})
+    parent.db_hash_key = 'hash_id'
+    parent.db_range_key = None
+    hash_attribute = MagicMock()
+    hash_attribute.attr_name = 'hash_id'
+    parent.db_model.get_attributes = MagicMock(return_value={'hash_id': hash_attribute})
+    parent.db_model.Meta.table_name = 'table'
+    connection = MagicMock()
+    connection.batch_write_item = MagicMock(side_effect=unprocessed or [{}])
+    parent.db_model._get_connection = MagicMock(return_value=connection)
+    return parent, connection
+
+
+def get_item_mock(hash_id, fail=False):
+    model = MagicMock()
+    model.version = 1
+    record = MagicMock()
+    if fail:
+        record._serialize = MagicMock(side_effect=ValueError('Attribute cannot be None'))
+    else:
+        record._serialize = MagicMock(return_value={'attributes': {'hash_id': {'S': hash_id}}})
+    model.db_model = MagicMock(return_value=record)
+    return model
+
+
+def unprocessed_response(*hash_ids):
+    return {'UnprocessedItems': {'table': [{'PutRequest': {'Item': {'hash_id': {'S': hash_id}}}}
+                                           for hash_id in hash_ids]}}
+
+
+class TestPynamoBatchWriteCommand(unittest.TestCase):
+
+    def test_signs_and_chunks_items(self):
+        parent, connection = get_parent_mock([{}, {}])
+        models = [get_item_mock(str(i)) for i in range(DalConfig.batch_write_page_limit + 1)]
+
+        report = PynamoBatchWriteCommand(parent)(models)
+
+        self.assertEqual(connection.batch_write_item.call_count, 2)
+        self.assertEqual(len(report.succeeded), len(models))
+        self.assertEqual(report.failed, [])
+        fields = [call[0][0] for call in models[0].override_protected_field.call_args_list]
+        self.assertEqual(fields, ['created_at', 'modified_at'])
+
+    @patch('wavelength_py.dal.dao.commands.batch_write_pynamo_command.PynamoBlindSoftDeleteCommand')
+    def test_soft_deletes_are_conditional_updates(self, mock_soft_delete):
+        parent, connection = get_parent_mock()
+        models = [get_item_mock('a'), get_item_mock('b')]
+        mock_soft_delete.return_value.side_effect = [None, Base404Exception('Model does not exist')]
+
+        report = PynamoBatchWriteCommand(parent, max_workers=1)(models, soft_delete=True)
+
+        connection.batch_write_item.assert_not_called()
+        self.assertEqual([call[0][0] for call in mock_soft_delete.call_args_list], models)
+        self.assertEqual([item.model for item in report.succeeded], models[:1])
+        self.assertIsInstance(report.failed[0].error, Base404Exception)
+        models[0].override_protected_field.assert_not_called()
+
+    @patch('wavelength_py.dal.dao.commands.batch_write_pynamo_command.PynamoBlindSoftDeleteCommand')
+    def test_soft_deletes_keep_max_workers_in_flight(self, mock_soft_delete):
+        parent, _ = get_parent_mock()
+        lock = threading.Lock()
+        counts = {'deleted': 0, 'in_flight': []}
+
+        def soft_delete():
+            with lock:
+                counts['deleted'] += 1
+
+        def models():
+            for index in range(20):
+                with lock:
+                    counts['in_flight'].append(index - counts['deleted'])
+                yield get_item_mock(str(index))
+
+        mock_soft_delete.return_value.side_effect = soft_delete
+        report = PynamoBatchWriteCommand(parent, max_workers=3)(models(), soft_delete=True)
+
+        self.assertEqual(len(report.succeeded), 20)
+        self.assertLessEqual(max(counts['in_flight']), 3)
+
+    @patch('wavelength_py.dal.dao.commands.batch_write_pynamo_command.time.sleep')
+    def test_retries_unprocessed_items(self, mock_sleep):
+        parent, connection = get_parent_mock([unprocessed_response('b'), {}])
+        models = [get_item_mock('a'), get_item_mock('b')]
+
+        report = PynamoBatchWriteCommand(parent)(models)
+
+        self.assertEqual(len(report.succeeded), 2)
+        mock_sleep.assert_called_once()
+        self.assertEqual(connection.batch_write_item.call_args[1]['put_items'], [{'hash_id': {'S': 'b'}}])
+
+    @patch('wavelength_py.dal.dao.commands.batch_write_pynamo_command.time.sleep')
+    def test_reports_failures(self, _mock_sleep):
+        parent, _connection = get_parent_mock([unprocessed_response('b')] * (DalConfig.max_retries + 1))
+        models = [get_item_mock('a'), get_item_mock('b'), get_item_mock('c', fail=True)]
+
+        report = PynamoBatchWriteCommand(parent)(models)
+
+        self.assertEqual([item.model for item in report.succeeded], [models[0]])
+        errors = {id(item.model): item.error for item in report.failed}
+        self.assertIsInstance(errors[id(models[1])], Base429Exception)
+        self.assertIsInstance(errors[id(models[2])], Base422Exception)
+
+    @patch('wavelength_py.dal.dao.commands.batch_write_pynamo_command.check_deadline',
+           side_effect=DeadlineExceededException())
+    def test_reports_chunks_left_at_the_deadline(self, _mock_check_deadline):
+        parent, connection = get_parent_mock([{}, {}])
+        models = [get_item_mock(str(i)) for i in range(DalConfig.batch_write_page_limit + 1)]
+
+        report = PynamoBatchWriteCommand(parent)(models)
+
+        connection.batch_write_item.assert_called_once()
+        self.assertEqual(len(report.succeeded), DalConfig.batch_write_page_limit)
+        self.assertEqual([item.model for item in report.failed], [models[-1]])
+        self.assertIsInstance(report.failed[0].error, DeadlineExceededException)
+
+    def test_created_items_are_written_through_the_caches(self):
+        parent, connection = get_parent_mock([unprocessed_response('b'), {}])
+        parent.db_model = BatchCachedDbModelTestMock
+        cache = BatchCachedDbModelTestMock.get_cache()
+        cache.put_missing('a')
+
+        with patch.object(BatchCachedDbModelTestMock, '_get_connection', return_value=connection), \
+                patch('wavelength_py.dal.dao.commands.batch_write_pynamo_command.time.sleep'):
+            report = PynamoBatchWriteCommand(parent)([get_item_mock('a'), get_item_mock('b')])
+
+        self.assertEqual(len(report.succeeded), 2)
+        self.assertIsNot(cache.get('a'), NOT_FOUND)
+        self.assertEqual([cache.get(key).hash_id for key in ('a', 'b')], ['a', 'b'])
+        cache.clear()
+
+    def test_parallel_batches(self):
+        parent, connection = get_parent_mock([{}] * 4)
+        models = [get_item_mock(str(i)) for i in range(DalConfig.batch_write_page_limit * 4)]
+
+        report = PynamoBatchWriteCommand(parent, max_workers=2)(models)
+
+        self.assertEqual(connection.batch_write_item.call_count, 4)
+        self.assertEqual(len(report.succeeded), len(models))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import logging
+import unittest
+
+from botocore.exceptions import ClientError
+from mock import MagicMock
+from pynamodb.exceptions import PynamoDBConnectionError
+
+from wavelength_py.dal.dal_config import DalConfig
+from wavelength_py.dal.dao.commands.blind_soft_delete_pynamo_command import PynamoBlindSoftDeleteCommand
+from wavelength_py.errors.exceptions import Base404Exception, Base422Exception
+from test.dal.dao.commands.test_pynamo_command import get_persitence_model_mock
+
+logging.basicConfig()
+log = logging.getLogger('logger')
+log.setLevel(logging.DEBUG)
+
+
+def get_model_mock(update_error=None):
+    template = {
+        'table_state': DalConfig.table_state_new,
+        'kind': 'abcd'
+    }
+    model_mock = get_persitence_model_mock(template, template)
+    model_mock.db_hash_key = 'kind'
+    model_mock.db_model.update = MagicMock(side_effect=update_error, return_value={})
+    return model_mock
+
+
+def get_client_error(code):
+    return PynamoDBConnectionError(cause=ClientError({
+        'Error': {
+            'Code': code,
+            'Message': code
+        }
+    }, 'UpdateItem'))
+
+
+class TestPynamoBlindSoftDeleteCommand(unittest.TestCase):
+
+    def test_execute(self):
+        model_mock = get_model_mock()
+
+        PynamoBlindSoftDeleteCommand(model_mock)()
+
+        model_mock.db_model.get.assert_not_called()
+        model_mock.db_model.update.assert_called_once()
+        model_mock.db_model.table_state.set.assert_called_once_with(DalConfig.table_state_deleted)
+        model_mock.db_model.modified_at.set.assert_called_once()
+        model_mock.db_model.version.set.assert_called_once()
+        model_mock.push.assert_called_once()
+
+    def test_condition_failure_raises_404(self):
+        model_mock = get_model_mock(get_client_error('ConditionalCheckFailedException'))
+
+        with self.assertRaises(Base404Exception):
+            PynamoBlindSoftDeleteCommand(model_mock)()
+
+        model_mock.db_model.get.assert_not_called()
+        model_mock.push.assert_not_called()
+
+    def test_other_errors_pass_through(self):
+        model_mock = get_model_mock(get_client_error('ValidationException'))
+
+        with self.assertRaises(Base422Exception):
+            PynamoBlindSoftDeleteCommand(model_mock)()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,7 +2,7 @@ import logging
 import unittest
 
 from botocore.exceptions import ClientError
-from mock import MagicMock
+from mock import MagicMock, patch
 from pynamodb.exceptions import PynamoDBConnectionError
 
 from wavelength_py.dal.dao.commands.create_pynamo_command import PynamoCreateCommand
@@ -25,6 +25,15 @@ class TestPynamoCreateCommand(unittest.TestCase):
         mock_parent.db_model.assert_called_once()
         mock_parent.db_model.save.assert_called_once()
 
+    @patch('wavelength_py.dal.dao.commands.create_pynamo_command.KEY_FILTERS')
+    def test_execute_adds_key_to_filter(self, key_filters):
+        mock_parent = get_persitence_model_mock({}, {})
+        mock_parent.get_key = MagicMock(return_value=['1234', 'a'])
+
+        PynamoCreateCommand(mock_parent)()
+
+        key_filters.add.assert_called_once_with(mock_parent.db_model, ['1234', 'a'])
+
     def test_execute_raises_500(self):
         mock_parent = get_persitence_model_mock({}, {})
 
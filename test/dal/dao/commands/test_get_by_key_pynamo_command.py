@@ -1,17 +1,38 @@
 import logging
 import unittest
 
-from mock import MagicMock
+from mock import MagicMock, ANY, patch
 
+from wavelength_py.dal.cache.model_cache import ModelCacheRegistry
 from wavelength_py.dal.dal_config import DalConfig
 from wavelength_py.dal.dao.commands.get_by_key_pynamo_command import PynamoGetByIdCommand
+from wavelength_py.dal.pynamo_models.cachable_pynamo_model import CachingPynamoModel
+from wavelength_py.errors.exceptions import CircuitOpenException
+from wavelength_py.logging.log_lambda_metrics import LogLambdaMetrics
 from test.dal.dao.commands.test_pynamo_command import get_persitence_model_mock
+from test.dal.dao.test_platform_persistence_model import DbModelTestMock
+from test.dal.pynamo_models.test_cachable_pynamo_model import ManualTimer
 
 logging.basicConfig()
 log = logging.getLogger('logger')
 log.setLevel(logging.DEBUG)
 
 
+class CachingDbModelTestMock(CachingPynamoModel):
+    class Meta:
+        table_name = 'get-by-key-test-table'
+
+
+class CachedReadsDbModelTestMock(CachingPynamoModel, DbModelTestMock):
+    class Meta:
+        table_name = 'cached-reads-test-table'
+        cache_ttl = 60
+        cache_reads = True
+
+    def to_json(self):
+        return {'kind': self.kind}
+
+
 class TestPynamoGetByIdCommand(unittest.TestCase):
 
     def test_execute(self):
@@ -30,6 +51,91 @@ class TestPynamoGetByIdCommand(unittest.TestCase):
         model_mock.db_model.get.assert_called_once()
         self.assertIsNotNone(result)
 
+    def test_execute_with_projection(self):
+        template = {
+            'table_state': DalConfig.table_state_new,
+            'kind': 'abcd'
+        }
+
+        model_mock = get_persitence_model_mock(template, template)
+        model_mock.db_model.get = MagicMock(return_value=model_mock.db_model)
+        model_mock.get_projection = MagicMock(return_value=['hash_id', 'kind'])
+        model_mock.get_projected_fields = MagicMock(return_value=['hash_id', 'kind'])
+
+        command = PynamoGetByIdCommand(model_mock, post_filter=MagicMock(return_value=True))
+        command('1234', projection=['kind'])
+
+        model_mock.get_projection.assert_called_once_with(['kind'])
+        model_mock.db_model.get.assert_called_once_with('1234', consistent_read=True,
+                                                        attributes_to_get=['hash_id', 'kind'])
+        model_mock.build_trusted.assert_called_once_with(ANY, fields=['hash_id', 'kind'])
+
+        command('1234')
+        model_mock.db_model.get.assert_called_with('1234', consistent_read=True, attributes_to_get=None)
+
+    def test_execute_with_min_version(self):
+        template = {
+            'table_state': DalConfig.table_state_new,
+            'kind': 'abcd'
+        }
+
+        model_mock = get_persitence_model_mock(template, template)
+        command = PynamoGetByIdCommand(model_mock, post_filter=MagicMock(return_value=True))
+        model_mock.db_model.get = MagicMock(return_value=model_mock.db_model)
+
+        # plain models ignore the version and keep reading consistently
+        command('1234', min_version=3)
+        model_mock.db_model.get.assert_called_once_with('1234', consistent_read=True, attributes_to_get=None)
+
+        model_mock.db_model = CachingDbModelTestMock
+        with patch.object(CachingDbModelTestMock, 'get', MagicMock()) as get_mock:
+            command('1234', min_version=3)
+            command('1234')
+
+        get_mock.assert_any_call('1234', consistent_read=False, attributes_to_get=None, min_version=3)
+        get_mock.assert_called_with('1234', consistent_read=True, attributes_to_get=None)
+
+    def test_models_caching_reads_are_read_through_their_caches(self):
+        template = {'table_state': DalConfig.table_state_new}
+        model_mock = get_persitence_model_mock(template, template)
+        model_mock.db_model = CachedReadsDbModelTestMock
+        command = PynamoGetByIdCommand(model_mock, post_filter=MagicMock(return_value=True))
+        get_mock = MagicMock(side_effect=lambda hash_key, range_key, *args: CachedReadsDbModelTestMock(
+            account_id=hash_key, range_id=range_key, kind='cached'))
+
+        with patch('wavelength_py.dal.pynamo_models.cachable_pynamo_model.CACHE_REGISTRY',
+                   ModelCacheRegistry(ManualTimer())), \
+                patch('wavelength_py.dal.pynamo_models.cachable_pynamo_model.PynamoModel.get', get_mock):
+            command('1234', 'a')
+            command('1234', 'a')
+
+        get_mock.assert_called_once_with('1234', 'a', False, None)
+        self.assertEqual(model_mock.build_trusted.call_args[0][0]['kind'], 'cached')
+
+    def test_open_circuit_falls_back_to_the_container_cache(self):
+        LogLambdaMetrics.reset_metrics()
+        template = {'table_state': DalConfig.table_state_new}
+        model_mock = get_persitence_model_mock(template, template)
+        model_mock.db_model = CachingDbModelTestMock
+        command = PynamoGetByIdCommand(model_mock, post_filter=MagicMock(return_value=True))
+        stale = MagicMock(version=2)
+
+        with patch.object(CachingDbModelTestMock, 'get', MagicMock(side_effect=CircuitOpenException('open'))), \
+                patch.object(CachingDbModelTestMock, 'get_stale', MagicMock(return_value=stale)) as get_stale:
+            command('1234')
+            model_mock.build_trusted.assert_called_once_with(stale.to_json())
+            get_stale.assert_called_once_with('1234')
+
+            # a copy older than the version asked for is no answer
+            with self.assertRaises(CircuitOpenException):
+                command('1234', min_version=3)
+
+            get_stale.return_value = None
+            with self.assertRaises(CircuitOpenException):
+                command('1234')
+
+        self.assertEqual(LogLambdaMetrics.metrics['counters']['dal.circuit.stale.get-by-key-test-table'], 1)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+
+from wavelength_py.dal.dao.commands.local_query import build_local_filter, query_partition
+from wavelength_py.dal.dao.commands.pynamo_command import FilterModel
+from wavelength_py.errors.exceptions import Base422Exception
+from test.dal.dao.test_platform_persistence_model import DbModelTestMock
+
+
+def get_record(range_id, kind=None, version=None):
+    return DbModelTestMock(account_id='1234', range_id=range_id, kind=kind, version=version)
+
+
+def or_filter(model_attribute, operator, parameters):
+    result = FilterModel(model_attribute, operator, parameters)
+    result.combinator = 'or'
+    return result
+
+
+class TestBuildLocalFilter(unittest.TestCase):
+
+    def assertMatches(self, filters, record, expected=True):
+        self.assertEqual(build_local_filter(DbModelTestMock, filters)(record), expected)
+
+    def test_operators(self):
+        record = get_record('abc', kind='settings', version=3)
+
+        self.assertMatches([FilterModel('kind', 'eq', 'settings')], record)
+        self.assertMatches([FilterModel('kind', 'ne', 'settings')], record, False)
+        self.assertMatches([FilterModel('version', 'gt', 2), FilterModel('version', 'lte', 3)], record)
+        self.assertMatches([FilterModel('version', 'lt', 'not a number')], record, False)
+        self.assertMatches([FilterModel('range_id', 'begins_with', 'ab')], record)
+        self.assertMatches([FilterModel('version', 'between', [1, 2])], record, False)
+        self.assertMatches([FilterModel('kind', 'is_in', ['profile', 'settings'])], record)
+        self.assertMatches([FilterModel('kind', 'contains', 'sett')], record)
+        self.assertMatches([FilterModel('blob', 'does_not_exist', [])], record)
+        self.assertMatches([FilterModel('blob', 'exists', [])], record, False)
+        self.assertMatches([], record)
+
+    def test_missing_attributes_never_compare(self):
+        record = get_record('abc')
+
+        self.assertMatches([FilterModel('kind', 'ne', 'settings')], record, False)
+        self.assertMatches([FilterModel('version', 'lt', 5)], record, False)
+
+    def test_combinators_fold_left(self):
+        record = get_record('abc', kind='settings')
+
+        self.assertMatches([FilterModel('kind', 'eq', 'profile'), or_filter('kind', 'eq', 'settings')], record)
+        self.assertMatches([FilterModel('kind', 'eq', 'profile'), or_filter('kind', 'eq', 'settings'),
+                            FilterModel('range_id', 'eq', 'xyz')], record, False)
+
+    def test_unknown_attribute(self):
+        with self.assertRaises(Base422Exception):
+            build_local_filter(DbModelTestMock, [FilterModel('missing', 'eq', 'x')])
+
+    def test_unsupported_operator(self):
+        self.assertIsNone(build_local_filter(DbModelTestMock, [FilterModel('kind', 'is_type', 'S')]))
+
+
+class TestQueryPartition(unittest.TestCase):
+
+    def setUp(self):
+        self.records = [get_record(range_id, kind='even' if index % 2 else 'odd')
+                        for index, range_id in enumerate(['a', 'b', 'c', 'd', 'e'])]
+
+    def query(self, key_filters=(), filters=(), **kwargs):
+        page, last = query_partition(self.records, 'range_id', build_local_filter(DbModelTestMock, list(key_filters)),
+                                     build_local_filter(DbModelTestMock, list(filters)), **kwargs)
+        return [record.range_id for record in page], last.range_id if last is not None else None
+
+    def test_order_and_range_condition(self):
+        self.assertEqual(self.query([FilterModel('range_id', 'gte', 'b')], scan_index_forward=True),
+                         (['b', 'c', 'd', 'e'], None))
+        self.assertEqual(self.query([FilterModel('range_id', 'lt', 'd')], scan_index_forward=False),
+                         (['c', 'b', 'a'], None))
+
+    def test_limit_counts_evaluated_items(self):
+        filters = [FilterModel('kind', 'eq', 'odd')]
+
+        self.assertEqual(self.query(filters=filters, scan_index_forward=True, limit=2), (['a'], 'b'))
+        self.assertEqual(self.query(filters=filters, scan_index_forward=True, start_range_key='b', limit=2),
+                         (['c'], 'd'))
+        self.assertEqual(self.query(filters=filters, scan_index_forward=True, start_range_key='c', limit=2),
+                         (['e'], None))
+        self.assertEqual(self.query(scan_index_forward=False, start_range_key='c', limit=2), (['b', 'a'], None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,13 +1,19 @@
 import logging
 import unittest
 
-from mock import MagicMock, ANY
+from mock import MagicMock, ANY, patch
 
+from wavelength_py.dal.cache.query_cache import QueryResultCache
 from wavelength_py.dal.dal_config import DalConfig
+from wavelength_py.dal.dao.commands.create_pynamo_command import PynamoCreateCommand
 from wavelength_py.dal.dao.commands.pynamo_command import always_pass
 from wavelength_py.dal.dao.commands.pynamo_query_args import PynamoQueryArguments
 from wavelength_py.dal.dao.commands.query_pynamo_command import PynamoQueryCommand, PynamoQueryResult
+from wavelength_py.dal.dynamodb.util import decode_start_token, encode_start_token
+from wavelength_py.errors.exceptions import CircuitOpenException, DeadlineExceededException
+from wavelength_py.logging.log_lambda_metrics import LogLambdaMetrics
 from test.dal.dao.commands.test_pynamo_command import get_persitence_model_mock
+from test.dal.pynamo_models.test_cachable_pynamo_model import ManualTimer
 
 logging.basicConfig()
 log = logging.getLogger('logger')
@@ -91,7 +97,8 @@ class TestPynamoQueryCommand(unittest.TestCase):
             limit=30,
             scan_index_forward=False,
             consistent_read=False,
-            last_evaluated_key=None)
+            last_evaluated_key=None,
+            attributes_to_get=None)
 
         query_kwargs = {
             'index_name': 'test-index-name',
@@ -115,7 +122,312 @@ class TestPynamoQueryCommand(unittest.TestCase):
             limit=30,
             scan_index_forward=False,
             consistent_read=True,
-            last_evaluated_key=None)
+            last_evaluated_key=None,
+            attributes_to_get=None)
+
+    def test_query_arguments_hash_with_start_token(self):
+        token = encode_start_token({'account_id': {'S': '1234'}, 'range_id': {'S': 'a'}})
+
+        query = PynamoQueryArguments('1234', start_token=token, projection=['kind'])
+
+        self.assertEqual(hash(query), hash(PynamoQueryArguments('1234', start_token=token, projection=['kind'])))
+        self.assertEqual(query, PynamoQueryArguments('1234', start_token=token, projection=['kind']))
+        self.assertNotEqual(query, PynamoQueryArguments('1234', projection=['kind']))
+
+    def test_next_token_resumes_the_query(self):
+        template = {
+            'table_state': DalConfig.table_state_new,
+            'kind': 'abcd'
+        }
+        last_key = {'account_id': {'S': '1234'}, 'range_id': {'S': 'a'}}
+        mock_parent = get_persitence_model_mock(template, template)
+        build_pynamo_mock_query_interface(mock_parent.db_model, get_model_mock(template))
+        mock_parent.db_model.query.return_value.last_evaluated_key = encode_start_token(last_key)
+
+        first = PynamoQueryCommand(mock_parent, post_filter=always_pass)(
+            PynamoQueryArguments('1234', consistent_read=True))
+        self.assertEqual(decode_start_token(first.start_token), last_key)
+
+        PynamoQueryCommand(mock_parent, post_filter=always_pass)(
+            PynamoQueryArguments('1234', start_token=first.start_token, consistent_read=True))
+        self.assertEqual(mock_parent.db_model.query.call_args[1]['last_evaluated_key'], last_key)
+
+    def test_query_results_are_cached_until_the_partition_is_written(self):
+        query_cache = QueryResultCache(max_bytes=1024 * 1024, ttl=10, timer=ManualTimer())
+        template = {
+            'table_state': DalConfig.table_state_new,
+            'kind': 'abcd'
+        }
+        mock_parent = get_persitence_model_mock(template, template)
+        mock_parent.get_key = MagicMock(return_value=['1234', 'abcde'])
+        build_pynamo_mock_query_interface(mock_parent.db_model, get_model_mock(template))
+        command = PynamoQueryCommand(mock_parent, post_filter=always_pass)
+
+        with patch('wavelength_py.dal.dao.commands.query_pynamo_command.QUERY_CACHE', query_cache), \
+                patch('wavelength_py.dal.dao.commands.pynamo_command.QUERY_CACHE', query_cache):
+            first = command(PynamoQueryArguments('1234', post_filter=always_pass))
+            second = command(PynamoQueryArguments('1234', post_filter=always_pass))
+            command(PynamoQueryArguments('1234', post_filter=always_pass, consistent_read=True))
+            self.assertEqual(mock_parent.db_model.query.call_count, 2)
+
+            PynamoCreateCommand(mock_parent)()
+            command(PynamoQueryArguments('1234', post_filter=always_pass))
+
+        self.assertEqual(mock_parent.db_model.query.call_count, 3)
+        self.assertEqual(len(second.items), 1)
+        self.assertIsNot(first.items, second.items)
+        self.assertEqual(query_cache.stats.hits, 1)
+
+    def test_pages_racing_a_write_are_not_cached(self):
+        query_cache = QueryResultCache(max_bytes=1024 * 1024, ttl=10, timer=ManualTimer())
+        template = {'table_state': DalConfig.table_state_new}
+        mock_parent = get_persitence_model_mock(template, template)
+        mock_parent.get_key = MagicMock(return_value=['1234', 'abcde'])
+        build_pynamo_mock_query_interface(mock_parent.db_model, get_model_mock(template))
+        command = PynamoQueryCommand(mock_parent, post_filter=always_pass)
+        query_result = mock_parent.db_model.query.return_value
+
+        def written_while_querying(*args, **kwargs):
+            command._invalidate_queries()
+            return query_result
+
+        mock_parent.db_model.query.side_effect = written_while_querying
+        with patch('wavelength_py.dal.dao.commands.query_pynamo_command.QUERY_CACHE', query_cache), \
+                patch('wavelength_py.dal.dao.commands.pynamo_command.QUERY_CACHE', query_cache):
+            command(PynamoQueryArguments('1234', post_filter=always_pass))
+            command(PynamoQueryArguments('1234', post_filter=always_pass))
+
+        self.assertEqual(mock_parent.db_model.query.call_count, 2)
+        self.assertEqual(query_cache.stats.hits, 0)
+
+    def test_open_breakers_are_answered_from_stale_pages(self):
+        LogLambdaMetrics.reset_metrics()
+        timer = ManualTimer()
+        query_cache = QueryResultCache(max_bytes=1024 * 1024, ttl=10, timer=timer)
+        template = {'table_state': DalConfig.table_state_new}
+        mock_parent = get_persitence_model_mock(template, template)
+        mock_parent.db_model.Meta.table_name = 'query-table'
+        build_pynamo_mock_query_interface(mock_parent.db_model, get_model_mock(template))
+        command = PynamoQueryCommand(mock_parent, post_filter=always_pass)
+
+        with patch('wavelength_py.dal.dao.commands.query_pynamo_command.QUERY_CACHE', query_cache):
+            command(PynamoQueryArguments('1234', post_filter=always_pass))
+            timer.now += 11
+            mock_parent.db_model.query.side_effect = CircuitOpenException('open')
+
+            result = command(PynamoQueryArguments('1234', post_filter=always_pass))
+            with self.assertRaises(CircuitOpenException):
+                command(PynamoQueryArguments('5678', post_filter=always_pass))
+
+        self.assertEqual(len(result.items), 1)
+        self.assertEqual(LogLambdaMetrics.metrics['counters']['dal.circuit.stale.query-table'], 1)
+
+    def test_cached_pages_are_post_filtered_per_caller(self):
+        def make_filter(owner):
+            return lambda record: record.to_json()['owner'] == owner
+
+        query_cache = QueryResultCache(max_bytes=1024 * 1024, ttl=10, timer=ManualTimer())
+        template = {'table_state': DalConfig.table_state_new}
+        mock_parent = get_persitence_model_mock(template, template)
+        mock_parent.db_model.query = MagicMock(return_value=MagicMock(
+            items=[get_model_mock({'owner': 'a'}), get_model_mock({'owner': 'b'})], last_evaluated_key=None))
+        mock_parent.build_trusted = MagicMock(side_effect=lambda json, fields=None: json['owner'])
+
+        with patch('wavelength_py.dal.dao.commands.query_pynamo_command.QUERY_CACHE', query_cache):
+            first = PynamoQueryCommand(mock_parent)(PynamoQueryArguments('1234', post_filter=make_filter('a')))
+            second = PynamoQueryCommand(mock_parent)(PynamoQueryArguments('1234', post_filter=make_filter('b')))
+
+        self.assertEqual(list(first.items), ['a'])
+        self.assertEqual(list(second.items), ['b'])
+        mock_parent.db_model.query.assert_called_once()
+
+
+def raw_page(ids, last_key=None, capacity=1.0, table_state=DalConfig.table_state_new):
+    page = {
+        'Items': [{'account_id': {'S': '1234'}, 'range_id': {'S': item_id}, 'table_state': {'S': table_state}}
+                  for item_id in ids],
+        'ConsumedCapacity': {'CapacityUnits': capacity}
+    }
+    if last_key:
+        page['LastEvaluatedKey'] = {'account_id': {'S': '1234'}, 'range_id': {'S': last_key}}
+    return page
+
+
+def get_pager_mock(pages):
+    pager = MagicMock()
+    pager.last_evaluated_key = None
+    pager.exhausted = False
+    pager.key_names = ['account_id', 'range_id']
+    remaining = list(pages)
+
+    def fetch():
+        page = remaining.pop(0)
+        pager.last_evaluated_key = page.get('LastEvaluatedKey')
+        pager.exhausted = not remaining
+        return page
+
+    pager.fetch = MagicMock(side_effect=fetch)
+    return pager
+
+
+def get_stream_parent_mock():
+    template = {
+        'table_state': DalConfig.table_state_new,
+        'kind': 'abcd'
+    }
+    mock_parent = get_persitence_model_mock(template, template)
+
+    def from_raw_data(data):
+        item = MagicMock()
+        item.table_state = data['table_state']['S']
+        item.to_json = MagicMock(return_value={'rangeId': data['range_id']['S']})
+        return item
+
+    mock_parent.db_model.from_raw_data = MagicMock(side_effect=from_raw_data)
+    mock_parent.build_trusted = MagicMock(side_effect=lambda source, fields=None: source['rangeId'])
+    return mock_parent
+
+
+class TestPynamoQueryResult(unittest.TestCase):
+
+    def test_items_are_built_on_access(self):
+        parent = MagicMock()
+        parent.build_trusted = MagicMock(side_effect=lambda source, fields=None: source['rangeId'])
+        records = [get_model_mock({'rangeId': item_id}) for item_id in 'abc']
+
+        result = PynamoQueryResult(records, parent)
+
+        self.assertEqual(len(result.items), 3)
+        parent.build_trusted.assert_not_called()
+        self.assertEqual(result.items[1], 'b')
+        self.assertEqual(result.items[1], 'b')
+        parent.build_trusted.assert_called_once()
+        self.assertEqual(result.items[-2:], ['b', 'c'])
+        self.assertEqual(list(result.items), ['a', 'b', 'c'])
+        self.assertEqual(parent.build_trusted.call_count, 3)
+
+    def test_to_json_skips_building(self):
+        parent = MagicMock()
+        parent.build_json = MagicMock(side_effect=lambda source, fields: source)
+        records = [get_model_mock({'rangeId': item_id}) for item_id in 'ab']
+
+        result = PynamoQueryResult(records, parent, fields=['range_id'])
+
+        self.assertEqual(result.to_json(), [{'rangeId': 'a'}, {'rangeId': 'b'}])
+        parent.build_trusted.assert_not_called()
+        parent.build_json.assert_called_with({'rangeId': 'b'}, ['range_id'])
+
+
+@patch('wavelength_py.dal.dao.commands.query_pynamo_command.get_query_pager')
+class TestPynamoQueryStream(unittest.TestCase):
+
+    def test_stream_walks_all_pages(self, mock_get_pager):
+        mock_get_pager.return_value = get_pager_mock([raw_page(['a', 'b'], 'b'), raw_page(['c'])])
+        command = PynamoQueryCommand(get_stream_parent_mock())
+
+        stream = command.stream(PynamoQueryArguments('1234', limit=2))
+
+        self.assertEqual(list(stream), ['a', 'b', 'c'])
+        self.assertEqual(stream.count, 3)
+        self.assertEqual(stream.consumed_capacity, 2.0)
+        self.assertIsNone(stream.start_token)
+        self.assertEqual(mock_get_pager.call_args[1]['limit'], 2)
+
+    def test_stream_skips_filtered_items(self, mock_get_pager):
+        mock_get_pager.return_value = get_pager_mock([raw_page(['a'], 'a'),
+                                                      raw_page(['b'], table_state=DalConfig.table_state_deleted)])
+        command = PynamoQueryCommand(get_stream_parent_mock())
+
+        self.assertEqual(list(command.stream(PynamoQueryArguments('1234'))), ['a'])
+
+    def test_stream_uses_query_post_filter(self, mock_get_pager):
+        mock_get_pager.return_value = get_pager_mock([raw_page(['a', 'b'])])
+        command = PynamoQueryCommand(get_stream_parent_mock())
+
+        query = PynamoQueryArguments('1234', post_filter=lambda item: item.to_json()['rangeId'] == 'b')
+        self.assertEqual(list(command.stream(query)), ['b'])
+
+    def test_stream_stops_at_max_items_with_resume_token(self, mock_get_pager):
+        pager = get_pager_mock([raw_page(['a', 'b', 'c'], 'c'), raw_page(['d'])])
+        mock_get_pager.return_value = pager
+        command = PynamoQueryCommand(get_stream_parent_mock())
+
+        stream = command.stream(PynamoQueryArguments('1234'), max_items=2)
+
+        self.assertEqual(list(stream), ['a', 'b'])
+        self.assertEqual(pager.fetch.call_count, 1)
+        self.assertEqual(decode_start_token(stream.start_token),
+                         {'account_id': {'S': '1234'}, 'range_id': {'S': 'b'}})
+
+    def test_stream_stops_at_max_capacity(self, mock_get_pager):
+        pager = get_pager_mock([raw_page(['a'], 'a', capacity=5), raw_page(['b'])])
+        mock_get_pager.return_value = pager
+        command = PynamoQueryCommand(get_stream_parent_mock())
+
+        stream = command.stream(PynamoQueryArguments('1234'), max_capacity=5)
+
+        self.assertEqual(list(stream), ['a'])
+        self.assertEqual(pager.fetch.call_count, 1)
+        self.assertEqual(decode_start_token(stream.start_token),
+                         {'account_id': {'S': '1234'}, 'range_id': {'S': 'a'}})
+
+    @patch('wavelength_py.dal.dao.commands.query_pynamo_command.can_continue', return_value=False)
+    def test_stream_stops_at_the_deadline_with_resume_token(self, mock_can_continue, mock_get_pager):
+        pager = get_pager_mock([raw_page(['a'], 'a'), raw_page(['b'])])
+        mock_get_pager.return_value = pager
+        command = PynamoQueryCommand(get_stream_parent_mock())
+
+        stream = command.stream(PynamoQueryArguments('1234'))
+
+        self.assertEqual(list(stream), ['a'])
+        self.assertEqual(pager.fetch.call_count, 1)
+        mock_can_continue.assert_called_once_with('query_stream')
+        self.assertEqual(decode_start_token(stream.start_token),
+                         {'account_id': {'S': '1234'}, 'range_id': {'S': 'a'}})
+
+
+@patch('wavelength_py.dal.dao.commands.query_pynamo_command.get_query_pager')
+class TestPynamoQueryCount(unittest.TestCase):
+
+    def test_count_walks_all_pages(self, mock_get_pager):
+        pager = get_pager_mock([
+            {'Count': 3, 'ScannedCount': 5, 'ConsumedCapacity': {'CapacityUnits': 1.0},
+             'LastEvaluatedKey': {'account_id': {'S': '1234'}, 'range_id': {'S': 'c'}}},
+            {'Count': 1, 'ScannedCount': 1, 'ConsumedCapacity': {'CapacityUnits': 0.5}}
+        ])
+        mock_get_pager.return_value = pager
+        parent = get_stream_parent_mock()
+        command = PynamoQueryCommand(parent)
+
+        query = PynamoQueryArguments('1234', limit=2)
+        result = command.count(query)
+
+        self.assertEqual(result.count, 4)
+        self.assertEqual(result.scanned_count, 6)
+        self.assertEqual(result.consumed_capacity, 1.5)
+        self.assertEqual(pager.fetch.call_count, 2)
+        parent.db_model.from_raw_data.assert_not_called()
+        parent.build_trusted.assert_not_called()
+
+        kwargs = mock_get_pager.call_args[1]
+        self.assertEqual(kwargs['select'], 'COUNT')
+        self.assertIsNone(kwargs['limit'])
+        self.assertIsNotNone(kwargs['filter_condition'])
+        self.assertEqual(query.filters[-1].model_attribute, 'table_state')
+
+    @patch('wavelength_py.dal.dao.commands.query_pynamo_command.check_deadline',
+           side_effect=DeadlineExceededException())
+    def test_count_raises_503_at_the_deadline(self, _mock_check_deadline, mock_get_pager):
+        pager = get_pager_mock([
+            {'Count': 3, 'LastEvaluatedKey': {'account_id': {'S': '1234'}, 'range_id': {'S': 'c'}}},
+            {'Count': 1}
+        ])
+        mock_get_pager.return_value = pager
+        command = PynamoQueryCommand(get_stream_parent_mock())
+
+        with self.assertRaises(DeadlineExceededException):
+            command.count(PynamoQueryArguments('1234'))
+        self.assertEqual(pager.fetch.call_count, 1)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,109 @@
+import gc
+import logging
+import threading
+import time
+import unittest
+
+from mock import patch
+
+from wavelength_py.dal.dal_config import DalConfig
+from wavelength_py.dal.dao.commands.scan_pynamo_command import PynamoScanCommand
+from wavelength_py.dal.dynamodb.util import decode_start_token, encode_start_token
+from wavelength_py.errors.exceptions import Base422Exception, Base5xxException
+from test.dal.dao.commands.test_query_pynamo_command import raw_page, get_pager_mock, get_stream_parent_mock
+
+logging.basicConfig()
+log = logging.getLogger('logger')
+log.setLevel(logging.DEBUG)
+
+
+@patch('wavelength_py.dal.dao.commands.scan_pynamo_command.get_scan_pager')
+class TestPynamoScanCommand(unittest.TestCase):
+
+    def test_scans_every_segment(self, mock_get_pager):
+        pagers = {
+            0: get_pager_mock([raw_page(['a', 'b'], 'b'), raw_page(['c'])]),
+            1: get_pager_mock([raw_page(['d'])]),
+        }
+        mock_get_pager.side_effect = lambda db_model, segment, **kwargs: pagers[segment]
+        command = PynamoScanCommand(get_stream_parent_mock(), total_segments=2)
+
+        with command() as stream:
+            result = sorted(stream)
+
+        self.assertEqual(result, ['a', 'b', 'c', 'd'])
+        self.assertEqual(stream.start_tokens, {})
+        self.assertEqual(stream.count, 4)
+        self.assertEqual({call[1]['total_segments'] for call in mock_get_pager.call_args_list}, {2})
+
+    def test_resume_tokens_track_consumed_items(self, mock_get_pager):
+        pager = get_pager_mock([raw_page(['a', 'b', 'c'], 'c'), raw_page(['d'])])
+        mock_get_pager.return_value = pager
+        command = PynamoScanCommand(get_stream_parent_mock(), total_segments=4, queue_size=1)
+
+        stream = command(start_tokens={'2': None})
+        self.assertEqual(next(stream), 'a')
+        stream.close()
+
+        self.assertEqual(mock_get_pager.call_args[1]['segment'], 2)
+        self.assertEqual(decode_start_token(stream.start_tokens[2]),
+                         {'account_id': {'S': '1234'}, 'range_id': {'S': 'a'}})
+
+    def test_resumes_from_token(self, mock_get_pager):
+        mock_get_pager.return_value = get_pager_mock([raw_page(['b'])])
+        command = PynamoScanCommand(get_stream_parent_mock(), total_segments=2)
+        token = {'account_id': {'S': '1234'}, 'range_id': {'S': 'a'}}
+
+        self.assertEqual(list(command(start_tokens={1: encode_start_token(token)})), ['b'])
+        self.assertEqual(mock_get_pager.call_args[1]['last_evaluated_key'], token)
+
+    def test_rejects_unknown_segments(self, _mock_get_pager):
+        command = PynamoScanCommand(get_stream_parent_mock(), total_segments=2)
+
+        with self.assertRaises(Base422Exception):
+            command(start_tokens={2: None})
+
+    @patch('wavelength_py.dal.dao.commands.scan_pynamo_command.can_continue', return_value=False)
+    def test_stops_at_the_deadline_with_resume_tokens(self, _mock_can_continue, mock_get_pager):
+        mock_get_pager.return_value = get_pager_mock([raw_page(['a'], 'a'), raw_page(['b'])])
+        command = PynamoScanCommand(get_stream_parent_mock(), total_segments=1)
+
+        stream = command()
+
+        self.assertEqual(list(stream), ['a'])
+        self.assertEqual(decode_start_token(stream.start_tokens[0]),
+                         {'account_id': {'S': '1234'}, 'range_id': {'S': 'a'}})
+
+    def test_segment_errors_are_raised(self, mock_get_pager):
+        pager = get_pager_mock([])
+        pager.fetch.side_effect = Base5xxException('boom')
+        mock_get_pager.return_value = pager
+        command = PynamoScanCommand(get_stream_parent_mock(), total_segments=1)
+
+        with self.assertRaises(Base5xxException):
+            list(command())
+
+    @patch.object(DalConfig, 'scan_queue_timeout', 0.01)
+    def test_abandoned_streams_stop_their_workers(self, mock_get_pager):
+        mock_get_pager.side_effect = lambda db_model, segment, **kwargs: get_pager_mock(
+            [raw_page(['a', 'b', 'c'], 'c'), raw_page(['d'])])
+        command = PynamoScanCommand(get_stream_parent_mock(), total_segments=2, queue_size=1)
+        threads = threading.active_count()
+
+        for model in command():
+            self.assertEqual(model, 'a')
+            break
+        stream = command()
+        self.assertEqual(next(stream), 'a')
+        del stream
+        gc.collect()
+
+        for _ in range(100):
+            if threading.active_count() <= threads:
+                break
+            time.sleep(0.01)
+        self.assertEqual(threading.active_count(), threads)
+
+
+if __name__ == '__main__':
+    unittest.main()
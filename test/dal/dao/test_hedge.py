@@ -0,0 +1,224 @@
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from mock import MagicMock, patch
+
+from wavelength_py.dal.dal_config import DalConfig
+from wavelength_py.dal.dao.commands.get_by_key_pynamo_command import PynamoGetByIdCommand
+from wavelength_py.dal.dao.hedge import HedgedReads
+from wavelength_py.dal.dynamodb.rate_limiter import RATE_LIMITER
+from wavelength_py.logging.log_lambda_metrics import LogLambdaMetrics
+from test.dal.dao.commands.test_pynamo_command import get_persitence_model_mock
+
+
+class HedgedModel:
+    class Meta:
+        table_name = 'hedged-table'
+        hedge_reads = True
+
+
+class PlainModel:
+    class Meta:
+        table_name = 'plain-table'
+
+
+class SlowFirstCall:
+    """ Callable whose first call hangs until release is called, later calls answer at once """
+
+    def __init__(self):
+        self.calls = 0
+        self._released = threading.Event()
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.calls += 1
+            first = self.calls == 1
+        if first:
+            self._released.wait(5)
+            return 'primary'
+        return 'hedge'
+
+    def release(self):
+        self._released.set()
+
+
+@patch.object(DalConfig, 'hedge_initial_delay', 0.01)
+class TestHedgedReads(unittest.TestCase):
+
+    def setUp(self):
+        LogLambdaMetrics.reset_metrics()
+        self.executor = ThreadPoolExecutor(max_workers=4)
+        self.hedges = HedgedReads('get', executor=self.executor)
+
+    def tearDown(self):
+        self.executor.shutdown(wait=True)
+
+    def test_models_not_opting_in_are_read_inline(self):
+        executor = MagicMock()
+        hedges = HedgedReads('get', executor=executor)
+
+        self.assertEqual(hedges.call(PlainModel, lambda: 'item'), 'item')
+        executor.submit.assert_not_called()
+
+    def test_fast_reads_are_not_hedged(self):
+        func = MagicMock(return_value='item')
+
+        with patch.object(DalConfig, 'hedge_initial_delay', 1.0):
+            self.assertEqual(self.hedges.call(HedgedModel, func), 'item')
+        func.assert_called_once()
+        self.assertEqual(self.hedges.fired, 0)
+        self.assertEqual(self.hedges.calls, 1)
+
+    def test_errors_of_the_primary_are_raised(self):
+        with self.assertRaises(ValueError):
+            self.hedges.call(HedgedModel, MagicMock(side_effect=ValueError()))
+
+    def test_primaries_run_on_the_calling_thread(self):
+        threads = []
+
+        def read():
+            threads.append(threading.current_thread())
+            return 'item'
+
+        self.assertEqual(self.hedges.call(HedgedModel, read), 'item')
+        self.assertEqual(threads, [threading.current_thread()])
+
+    def test_slow_reads_are_hedged_and_the_primary_answers(self):
+        func = SlowFirstCall()
+        threading.Timer(0.1, func.release).start()
+
+        self.assertEqual(self.hedges.call(HedgedModel, func), 'primary')
+
+        self.assertEqual(func.calls, 2)
+        self.assertEqual((self.hedges.fired, self.hedges.won), (1, 0))
+        self.assertEqual(LogLambdaMetrics.metrics['counters']['dal.hedge.fired.get'], 1)
+
+    def test_failed_primaries_are_answered_by_the_hedge(self):
+        func = FailingPrimary()
+        threading.Timer(0.1, func.release).start()
+
+        self.assertEqual(self.hedges.call(HedgedModel, func), 'hedge')
+
+        self.assertEqual((self.hedges.fired, self.hedges.won), (1, 1))
+        self.assertEqual(LogLambdaMetrics.metrics['counters']['dal.hedge.won.get'], 1)
+
+    def test_hedge_rate_is_capped(self):
+        first = SlowFirstCall()
+        threading.Timer(0.05, first.release).start()
+        self.hedges.call(HedgedModel, first)
+
+        second = SlowFirstCall()
+        threading.Timer(0.05, second.release).start()
+        self.assertEqual(self.hedges.call(HedgedModel, second), 'primary')
+        self.assertEqual(second.calls, 1)
+        self.assertEqual(self.hedges.fired, 1)
+
+        with patch.object(DalConfig, 'hedge_initial_delay', 1.0):
+            for _ in range(int(1 / DalConfig.hedge_max_rate)):
+                self.hedges.call(HedgedModel, lambda: 'item')
+        third = SlowFirstCall()
+        threading.Timer(0.2, third.release).start()
+        self.hedges.call(HedgedModel, third)
+        self.assertEqual(self.hedges.fired, 2)
+
+    def test_delay_follows_the_observed_percentile(self):
+        self.assertEqual(self.hedges.get_delay(HedgedModel), 0.01)
+
+        for latency in range(1, 101):
+            self.hedges._record(HedgedModel, latency / 1000.0)
+
+        self.assertEqual(self.hedges.get_delay(HedgedModel), 0.095)
+        self.assertEqual(self.hedges.stats()['delay_ms'], {'hedged-table': 95})
+
+        self.hedges.reset()
+        self.assertEqual(self.hedges.get_delay(HedgedModel), 0.01)
+        self.assertEqual(self.hedges.stats(), {'calls': 0, 'fired': 0, 'won': 0, 'delay_ms': {}})
+
+
+class FailingPrimary(SlowFirstCall):
+    """ The first call fails once released, later calls answer at once """
+
+    def __call__(self):
+        result = super().__call__()
+        if result == 'primary':
+            raise ValueError()
+        return result
+
+
+class FailingHedge(SlowFirstCall):
+    """ The first call answers once released, later calls fail at once """
+
+    def __call__(self):
+        result = super().__call__()
+        if result == 'hedge':
+            raise ValueError()
+        return result
+
+
+@patch.object(DalConfig, 'hedge_initial_delay', 0.01)
+class TestHedgedReadsFallback(unittest.TestCase):
+
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=4)
+        self.hedges = HedgedReads('get', executor=self.executor)
+
+    def tearDown(self):
+        self.executor.shutdown(wait=True)
+
+    def test_failed_hedges_wait_for_the_primary(self):
+        func = FailingHedge()
+        threading.Timer(0.1, func.release).start()
+
+        self.assertEqual(self.hedges.call(HedgedModel, func), 'primary')
+        self.assertEqual(func.calls, 2)
+        self.assertEqual((self.hedges.fired, self.hedges.won), (1, 0))
+
+    def test_failed_hedges_leave_the_primary_error(self):
+        calls = []
+
+        def read():
+            calls.append(threading.current_thread())
+            time.sleep(0.1)
+            raise ValueError()
+
+        with self.assertRaises(ValueError):
+            self.hedges.call(HedgedModel, read)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual((self.hedges.fired, self.hedges.won), (1, 0))
+
+    def test_bulk_reads_stay_bulk_on_the_workers(self):
+        func = SlowFirstCall()
+        threading.Timer(0.1, func.release).start()
+        marks = []
+
+        def read():
+            marks.append(RATE_LIMITER.is_bulk())
+            return func()
+
+        with RATE_LIMITER.bulk():
+            self.assertEqual(self.hedges.call(HedgedModel, read), 'primary')
+
+        self.assertEqual(marks, [True, True])
+        self.assertFalse(RATE_LIMITER.is_bulk())
+
+
+class TestHedgedGetById(unittest.TestCase):
+
+    @patch('wavelength_py.dal.dao.commands.get_by_key_pynamo_command.GET_HEDGES')
+    def test_reads_go_through_the_hedges(self, hedges):
+        template = {'table_state': DalConfig.table_state_new}
+        parent = get_persitence_model_mock(template, template)
+        hedges.call = MagicMock(side_effect=lambda db_model, read: read())
+
+        PynamoGetByIdCommand(parent)('1234')
+
+        hedges.call.assert_called_once()
+        self.assertIs(hedges.call.call_args[0][0], parent.db_model)
+        parent.db_model.get.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 - *-
+
+import logging
+import unittest
+
+from pynamodb.attributes import UnicodeAttribute, NumberAttribute
+from pynamodb.models import Model as PynamoModel
+from schematics.types import StringType, IntType, ModelType
+
+from wavelength_py.dal.dao.models.platform_persistence_model import PynamoPersistenceModel
+from wavelength_py.errors.exceptions import Base422Exception
+from wavelength_py.model.model_base import BaseModel
+
+logging.basicConfig()
+log = logging.getLogger('logger')
+log.setLevel(logging.DEBUG)
+
+
+class DbModelTestMock(PynamoModel):
+    class Meta:
+        table_name = 'test-table'
+
+    account_id = UnicodeAttribute(hash_key=True)
+    range_id = UnicodeAttribute(range_key=True)
+    kind = UnicodeAttribute(null=True)
+    blob = UnicodeAttribute(null=True, attr_name='b')
+    created_at = NumberAttribute(null=True)
+    modified_at = NumberAttribute(null=True)
+    version = NumberAttribute(null=True)
+    table_state = UnicodeAttribute(null=True)
+
+
+class SettingsTestMock(BaseModel):
+    page_size = IntType()
+
+
+class ModelTestMock(PynamoPersistenceModel):
+    account_id = StringType()
+    range_id = StringType()
+    kind = StringType()
+    payload = StringType()
+    settings = ModelType(SettingsTestMock)
+
+    def __init__(self, source_model: dict, **kwargs):
+        super().__init__(source_model, DbModelTestMock, column_mapping={'blob': 'payload'}, **kwargs)
+
+
+def get_model():
+    return ModelTestMock({})
+
+
+class TestPynamoPersistenceModel(unittest.TestCase):
+
+    def test_get_projection_maps_domain_fields(self):
+        projection = get_model().get_projection(['kind', 'payload'])
+
+        self.assertEqual(projection, ['account_id', 'range_id', 'created_at', 'modified_at',
+                                      'version', 'table_state', 'kind', 'b'])
+
+    def test_get_projection_rejects_unknown_fields(self):
+        with self.assertRaises(Base422Exception):
+            get_model().get_projection(['missing'])
+
+    def test_build_hydrates_projected_fields(self):
+        model = get_model()
+        source = {'accountId': '1', 'rangeId': 'a', 'kind': 'k', 'blob': 'large'}
+
+        projected = model.build(source, fields=model.get_projected_fields(['kind']))
+        full = model.build(source)
+
+        self.assertEqual(projected.account_id, '1')
+        self.assertEqual(projected.kind, 'k')
+        self.assertIsNone(projected.payload)
+        self.assertEqual(full.payload, 'large')
+
+    def test_build_json_matches_model_json(self):
+        model = get_model()
+        source = {'accountId': '1', 'rangeId': 'a', 'kind': 'k', 'blob': 'large', 'unmapped': 'x'}
+
+        self.assertEqual(model.build_json(source), {'accountId': '1', 'rangeId': 'a', 'kind': 'k', 'payload': 'large'})
+        self.assertEqual(model.build_json(source, fields=['kind']), {'kind': 'k'})
+
+    def test_build_trusted_matches_build(self):
+        model = get_model()
+        source = {'accountId': '1', 'rangeId': 'a', 'kind': 'k', 'blob': 'large', 'version': 3,
+                  'settings': {'pageSize': 20}}
+
+        trusted = model.build_trusted(source)
+        built = model.build(source)
+
+        self.assertEqual(trusted.to_json(), built.to_json())
+        self.assertEqual(trusted.settings.page_size, 20)
+        self.assertEqual(trusted.table_state, built.table_state)
+        self.assertIsNot(trusted._data, model._data)
+
+        trusted.kind = 'changed'
+        self.assertEqual(trusted._changes, {'kind': 'changed'})
+        self.assertEqual(model._changes, {})
+
+    def test_build_trusted_hydrates_projected_fields(self):
+        model = get_model()
+        source = {'accountId': '1', 'rangeId': 'a', 'kind': 'k', 'blob': 'large'}
+
+        projected = model.build_trusted(source, fields=model.get_projected_fields(['kind']))
+
+        self.assertEqual(projected.kind, 'k')
+        self.assertIsNone(projected.payload)
+
+
+if __name__ == '__main__':
+    unittest.main()
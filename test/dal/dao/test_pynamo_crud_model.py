@@ -22,13 +22,14 @@ class ModelTestMock(ObservablePersistenceModel):
 
 class TestPynamoCrudModel(unittest.TestCase):
 
+    @patch('wavelength_py.dal.dao.models.pynamo_crud_model.PynamoBatchGetCommand')
     @patch('wavelength_py.dal.dao.models.pynamo_crud_model.PynamoCreateCommand')
     @patch('wavelength_py.dal.dao.models.pynamo_crud_model.PynamoGetByIdCommand')
     @patch('wavelength_py.dal.dao.models.pynamo_crud_model.PynamoQueryCommand')
     @patch('wavelength_py.dal.dao.models.pynamo_crud_model.PynamoSoftDeleteCommand')
     @patch('wavelength_py.dal.dao.models.pynamo_crud_model.PynamoUpdateCommand')
     def test_init(self, mock_PynamoCreateCommand, mock_PynamoGetByIdCommand, mock_PynamoQueryCommand,
-                  mock_PynamoSoftDeleteCommand, mock_PynamoUpdateCommand):
+                  mock_PynamoSoftDeleteCommand, mock_PynamoUpdateCommand, mock_PynamoBatchGetCommand):
         model = PynamoCrudModel({}, MagicMock())
         model.create()
         mock_PynamoCreateCommand.assert_called_once()
@@ -40,6 +41,8 @@ class TestPynamoCrudModel(unittest.TestCase):
         mock_PynamoSoftDeleteCommand.assert_called_once()
         model.query(MagicMock())
         mock_PynamoQueryCommand.assert_called_once()
+        model.read_many('a', 'b')
+        mock_PynamoBatchGetCommand.assert_called_once()
 
 
 if __name__ == '__main__':
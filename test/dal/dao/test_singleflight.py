@@ -0,0 +1,149 @@
+import threading
+import time
+import unittest
+
+from mock import MagicMock
+
+from wavelength_py.dal.dal_config import DalConfig
+from wavelength_py.dal.dao.commands.get_by_key_pynamo_command import PynamoGetByIdCommand
+from wavelength_py.dal.dao.singleflight import GET_FLIGHTS, SingleFlight
+from wavelength_py.logging.log_lambda_metrics import LogLambdaMetrics
+from test.dal.dao.commands.test_pynamo_command import get_persitence_model_mock
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('timed out')
+        time.sleep(0.001)
+
+
+class BlockingCall:
+    """ Callable holding its callers until release is called """
+
+    def __init__(self, result=None, error=None):
+        self.calls = 0
+        self.result = result
+        self.error = error
+        self.started = threading.Event()
+        self._released = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        self._released.wait(5)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+    def release(self):
+        self._released.set()
+
+
+def run_concurrently(flights, key, func, followers):
+    """ Starts a leader then followers that join its flight, returns their outcomes once func is released """
+    outcomes = []
+
+    def run():
+        try:
+            outcomes.append(flights.call(key, func))
+        except Exception as err:  # pylint: disable=broad-except
+            outcomes.append(err)
+
+    threads = [threading.Thread(target=run)]
+    threads[0].start()
+    func.started.wait(5)
+    coalesced = flights.coalesced
+    for _ in range(followers):
+        thread = threading.Thread(target=run)
+        thread.start()
+        threads.append(thread)
+    wait_for(lambda: flights.coalesced == coalesced + followers)
+    func.release()
+    for thread in threads:
+        thread.join(5)
+    return outcomes
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def setUp(self):
+        LogLambdaMetrics.reset_metrics()
+        self.flights = SingleFlight('test.coalesced')
+
+    def test_concurrent_calls_share_the_result(self):
+        result = object()
+        func = BlockingCall(result=result)
+
+        outcomes = run_concurrently(self.flights, 'a', func, followers=3)
+
+        self.assertEqual(outcomes, [result] * 4)
+        self.assertEqual(func.calls, 1)
+        self.assertEqual(self.flights.coalesced, 3)
+        self.assertEqual(LogLambdaMetrics.metrics['counters']['test.coalesced'], 3)
+        self.assertEqual(len(self.flights), 0)
+
+    def test_concurrent_calls_share_the_exception(self):
+        error = IOError('throttled')
+        func = BlockingCall(error=error)
+
+        outcomes = run_concurrently(self.flights, 'a', func, followers=2)
+
+        self.assertEqual(outcomes, [error] * 3)
+        self.assertEqual(func.calls, 1)
+
+    def test_sequential_calls_are_not_coalesced(self):
+        func = MagicMock(side_effect=['v1', 'v2'])
+
+        self.assertEqual(self.flights.call('a', func), 'v1')
+        self.assertEqual(self.flights.call('a', func), 'v2')
+        self.assertEqual(self.flights.coalesced, 0)
+
+    def test_keys_fly_separately(self):
+        func = BlockingCall(result='a')
+        thread = threading.Thread(target=self.flights.call, args=('a', func))
+        thread.start()
+        func.started.wait(5)
+
+        self.assertEqual(self.flights.call('b', MagicMock(return_value='b')), 'b')
+        func.release()
+        thread.join(5)
+        self.assertEqual(self.flights.coalesced, 0)
+
+
+class TestCoalescedGet(unittest.TestCase):
+
+    def test_concurrent_gets_share_one_read(self):
+        template = {
+            'table_state': DalConfig.table_state_new,
+            'kind': 'abcd'
+        }
+        model_mock = get_persitence_model_mock(template, template)
+        model_mock.get_key = MagicMock(return_value=['1234', 'a'])
+        record = MagicMock()
+        get = BlockingCall(result=record)
+        model_mock.db_model.get = MagicMock(side_effect=lambda *args, **kwargs: get())
+
+        def read():
+            command = PynamoGetByIdCommand(model_mock)
+            command._post_filter = MagicMock(return_value=True)
+            return command()
+
+        outcomes = []
+        threads = [threading.Thread(target=lambda: outcomes.append(read())) for _ in range(3)]
+        coalesced = GET_FLIGHTS.coalesced
+        for thread in threads:
+            thread.start()
+        wait_for(lambda: GET_FLIGHTS.coalesced == coalesced + 2)
+        get.release()
+        for thread in threads:
+            thread.join(5)
+
+        model_mock.db_model.get.assert_called_once()
+        self.assertEqual(len(outcomes), 3)
+        self.assertEqual(model_mock.build_trusted.call_count, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 - *-
+
+import logging
+import threading
+import unittest
+
+from mock import patch, MagicMock
+from schematics.types import StringType
+
+from wavelength_py.dal.dal_config import DalConfig
+from wavelength_py.dal.dao.models.pynamo_crud_model import PynamoCrudModel
+from wavelength_py.dal.dao.unit_of_work import UnitOfWork, get_unit_of_work, WRITE_CREATE, WRITE_UPDATE
+from wavelength_py.errors.exceptions import Base404Exception, Base409Exception
+from test.dal.dao.test_platform_persistence_model import DbModelTestMock
+
+logging.basicConfig()
+log = logging.getLogger('logger')
+log.setLevel(logging.DEBUG)
+
+
+class CrudModelTestMock(PynamoCrudModel):
+    account_id = StringType()
+    range_id = StringType()
+    kind = StringType()
+    payload = StringType()
+
+    def __init__(self, source_model: dict, **kwargs):
+        super().__init__(source_model, DbModelTestMock, column_mapping={'blob': 'payload'}, **kwargs)
+
+
+def get_record_mock(range_id='a'):
+    record = MagicMock()
+    record.table_state = DalConfig.table_state_new
+    record.to_json = MagicMock(return_value={'account_id': '1', 'range_id': range_id, 'kind': 'k', 'version': 1,
+                                             'table_state': DalConfig.table_state_new})
+    return record
+
+
+def get_model(range_id='a'):
+    return CrudModelTestMock({'account_id': '1', 'range_id': range_id})
+
+
+@patch('wavelength_py.dal.dao.commands.post_filter_pynamo_command.PostFilteredPynamoCommand._gather')
+class TestUnitOfWork(unittest.TestCase):
+
+    def test_identity_map(self, mock_gather):
+        mock_gather.return_value = get_record_mock()
+
+        with UnitOfWork() as unit_of_work:
+            self.assertIs(get_unit_of_work(), unit_of_work)
+            model = get_model().read('1', 'a')
+            self.assertIs(get_model().read('1', 'a'), model)
+            self.assertIs(get_model().read(), model)
+
+        self.assertIsNone(get_unit_of_work())
+        mock_gather.assert_called_once()
+        self.assertIsNot(get_model().read(), model)
+
+    @patch('wavelength_py.dal.dao.commands.base_update_pynamo_command.BaseUpdatePynamoCommand._update_record')
+    def test_updates_are_coalesced(self, mock_update_record, mock_gather):
+        mock_gather.return_value = get_record_mock()
+        changes = []
+        with UnitOfWork() as unit_of_work:
+            model = get_model().read()
+            mock_update_record.side_effect = lambda record: changes.append(model.get_mapped_changes())
+            model.kind = 'changed'
+            model.update()
+            model.payload = 'large'
+            model.update()
+            other = get_model()
+            other.kind = 'changed again'
+            other.update()
+
+            self.assertEqual([write.operation for write in unit_of_work.pending], [WRITE_UPDATE])
+            mock_update_record.assert_not_called()
+
+        mock_update_record.assert_called_once()
+        self.assertEqual(changes, [{'kind': 'changed again', 'payload': 'large'}])
+
+    @patch('wavelength_py.dal.dao.commands.base_update_pynamo_command.BaseUpdatePynamoCommand._update_record',
+           autospec=True)
+    def test_updates_of_other_instances_write_the_mapped_model(self, mock_update_record, mock_gather):
+        mock_gather.return_value = get_record_mock()
+        written = []
+        mock_update_record.side_effect = lambda command, record: written.append(
+            (command._parent, command._parent.get_mapped_changes()))
+        with UnitOfWork():
+            model = get_model().read()
+            other = get_model()
+            other.kind = 'changed'
+            other.update()
+            model.payload = 'large'
+            model.update()
+
+        self.assertEqual(len(written), 1)
+        self.assertIs(written[0][0], model)
+        self.assertEqual(written[0][1], {'kind': 'changed', 'payload': 'large'})
+
+    @patch('wavelength_py.dal.dao.unit_of_work.PynamoBatchWriteCommand')
+    def test_creates_are_batched(self, mock_batch_write, mock_gather):
+        first, second = get_model('a'), get_model('b')
+        with UnitOfWork() as unit_of_work:
+            self.assertIs(first.create(), first)
+            second.create()
+            second.kind = 'k'
+            second.update()
+            self.assertIs(get_model('b').read(), second)
+            self.assertEqual([write.operation for write in unit_of_work.pending], [WRITE_CREATE, WRITE_CREATE])
+
+        mock_gather.assert_not_called()
+        mock_batch_write.assert_called_once_with(first)
+        mock_batch_write.return_value.assert_called_once_with([first, second])
+
+    @patch('wavelength_py.dal.dao.unit_of_work.PynamoBatchWriteCommand')
+    def test_deletes(self, mock_batch_write, mock_gather):
+        mock_gather.return_value = get_record_mock()
+        with UnitOfWork() as unit_of_work:
+            created = get_model('b')
+            created.create()
+            created.delete()
+            self.assertEqual(unit_of_work.pending, [])
+
+            model = get_model().read()
+            model.delete()
+            with self.assertRaises(Base404Exception):
+                get_model().read()
+            with self.assertRaises(Base409Exception):
+                model.update()
+            self.assertEqual(get_model().read_many(('1', 'a')), [])
+            unit_of_work.rollback()
+
+        mock_batch_write.assert_not_called()
+
+    @patch('wavelength_py.dal.dao.commands.base_update_pynamo_command.BaseUpdatePynamoCommand._update_record')
+    def test_writes_are_discarded_on_error(self, mock_update_record, mock_gather):
+        mock_gather.return_value = get_record_mock()
+        with self.assertRaises(ValueError):
+            with UnitOfWork():
+                model = get_model().read()
+                model.kind = 'changed'
+                model.update()
+                raise ValueError('boom')
+
+        mock_update_record.assert_not_called()
+
+    @patch('wavelength_py.dal.dao.commands.base_update_pynamo_command.BaseUpdatePynamoCommand._update_record')
+    def test_updates_are_sent_in_parallel(self, mock_update_record, mock_gather):
+        mock_gather.return_value = get_record_mock()
+        barrier = threading.Barrier(2, timeout=5)
+        mock_update_record.side_effect = lambda record: barrier.wait()
+        with UnitOfWork(max_workers=2):
+            for range_id in ('a', 'b'):
+                model = get_model(range_id)
+                model.kind = 'changed'
+                model.update()
+
+        self.assertEqual(mock_update_record.call_count, 2)
+
+    @patch('wavelength_py.dal.dao.unit_of_work.log')
+    @patch('wavelength_py.dal.dao.commands.base_update_pynamo_command.BaseUpdatePynamoCommand._update_record')
+    def test_every_failed_write_is_logged(self, mock_update_record, mock_log, mock_gather):
+        mock_gather.return_value = get_record_mock()
+        mock_update_record.side_effect = Base409Exception('Version conflict')
+        with self.assertRaises(Base409Exception):
+            with UnitOfWork():
+                for range_id in ('a', 'b', 'c'):
+                    model = get_model(range_id)
+                    model.kind = 'changed'
+                    model.update()
+
+        self.assertEqual(mock_update_record.call_count, 3)
+        self.assertEqual(sorted(call[1]['key'] for call in mock_log.warn.call_args_list),
+                         [['1', 'a'], ['1', 'b'], ['1', 'c']])
+
+    @patch('wavelength_py.dal.dao.commands.batch_get_pynamo_command.PynamoBatchGetCommand._read')
+    def test_batch_get_reads_missing_keys(self, mock_read, mock_gather):
+        mock_gather.return_value = get_record_mock()
+        with UnitOfWork():
+            model = get_model().read()
+            other = get_model('b')
+            mock_read.return_value = [other]
+
+            self.assertEqual(get_model().read_many(('1', 'a'), ('1', 'b')), [model, other])
+            self.assertEqual(get_model().read_many(('1', 'b')), [other])
+
+        mock_read.assert_called_once_with((('1', 'b'),))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+import unittest
+
+from mock import MagicMock, patch
+
+from wavelength_py.dal.dynamodb.circuit_breaker import CIRCUIT_BREAKERS, CircuitBreakerRegistry, is_failure, \
+    STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN
+from wavelength_py.errors.exceptions import Base404Exception, Base429Exception, Base5xxException, \
+    CircuitOpenException, DeadlineExceededException
+from wavelength_py.logging.log_lambda_metrics import LogLambdaMetrics
+from test.dal.pynamo_models.test_cachable_pynamo_model import ManualTimer
+
+
+class CircuitModel:
+    class Meta:
+        table_name = 'circuit-table'
+
+
+class CircuitCommand:
+    """ Stands in for a DAL command, its db_model gives the table guarded """
+    db_model = CircuitModel
+
+    def __init__(self, func):
+        self.func = func
+
+    def read(self):
+        return self.func()
+
+
+@patch('wavelength_py.dal.dynamodb.circuit_breaker.CONFIG')
+class TestCircuitBreaker(unittest.TestCase):
+
+    def setUp(self):
+        LogLambdaMetrics.reset_metrics()
+        self.timer = ManualTimer()
+        self.breakers = CircuitBreakerRegistry(timer=self.timer)
+
+    @staticmethod
+    def configure(config):
+        config.CIRCUIT_BREAKER_ERROR_RATE = .5
+        config.CIRCUIT_BREAKER_MIN_CALLS = 4
+        config.CIRCUIT_BREAKER_WINDOW = 30
+        config.CIRCUIT_BREAKER_OPEN_TIME = 5000
+        config.CIRCUIT_BREAKER_PROBES = 2
+
+    def read(self, func):
+        return self.breakers.guard(CircuitCommand.read)(CircuitCommand(func))
+
+    def fail(self, times=1):
+        for _ in range(times):
+            with self.assertRaises(Base5xxException):
+                self.read(MagicMock(side_effect=Base5xxException('boom')))
+
+    def trip(self):
+        self.read(lambda: 'item')
+        self.read(lambda: 'item')
+        self.fail(2)
+
+    def test_failures_are_classified(self, config):
+        self.assertTrue(is_failure(Base5xxException('boom')))
+        self.assertTrue(is_failure(Base429Exception('throttled')))
+        self.assertFalse(is_failure(Base404Exception('missing')))
+        self.assertIsNone(is_failure(DeadlineExceededException('late')))
+        self.assertIsNone(is_failure(ValueError()))
+
+    def test_opens_at_the_error_rate_after_min_calls(self, config):
+        self.configure(config)
+        self.fail(3)
+        self.assertEqual(self.breakers.get('circuit-table').state, STATE_CLOSED)
+
+        self.fail()
+        breaker = self.breakers.get('circuit-table')
+        self.assertEqual(breaker.state, STATE_OPEN)
+        self.assertEqual(LogLambdaMetrics.metrics['counters']['dal.circuit.opened.circuit-table'], 1)
+
+    def test_errors_outside_the_window_are_forgotten(self, config):
+        self.configure(config)
+        self.fail(3)
+        self.timer.now += 30
+        self.read(lambda: 'item')
+
+        self.assertEqual(self.breakers.get('circuit-table').state, STATE_CLOSED)
+        self.assertEqual(self.breakers.get('circuit-table').error_rate, 0.0)
+
+    def test_open_breaker_fails_fast(self, config):
+        self.configure(config)
+        self.trip()
+        func = MagicMock()
+
+        with self.assertRaises(CircuitOpenException) as ctx:
+            self.read(func)
+        func.assert_not_called()
+        self.assertEqual(ctx.exception.get_response(MagicMock())['statusCode'], 503)
+        self.assertEqual(LogLambdaMetrics.metrics['counters']['dal.circuit.rejected.circuit-table'], 1)
+
+    def test_probes_close_the_breaker(self, config):
+        self.configure(config)
+        self.trip()
+        self.timer.now += 5
+
+        breaker = self.breakers.get('circuit-table')
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, STATE_HALF_OPEN)
+        self.assertFalse(breaker.allow())  # a single probe at a time
+        breaker.record(False)
+        self.assertEqual(breaker.state, STATE_HALF_OPEN)
+
+        self.read(lambda: 'item')
+        self.assertEqual(breaker.state, STATE_CLOSED)
+
+    def test_failed_probe_opens_the_breaker_again(self, config):
+        self.configure(config)
+        self.trip()
+        self.timer.now += 5
+
+        self.fail()
+        breaker = self.breakers.get('circuit-table')
+        self.assertEqual(breaker.state, STATE_OPEN)
+        self.assertEqual(breaker.opened, 2)
+        with self.assertRaises(CircuitOpenException):
+            self.read(lambda: 'item')
+
+    def test_neutral_outcomes_do_not_count(self, config):
+        self.configure(config)
+        for _ in range(4):
+            with self.assertRaises(Base404Exception):
+                self.read(MagicMock(side_effect=Base404Exception('missing')))
+            with self.assertRaises(DeadlineExceededException):
+                self.read(MagicMock(side_effect=DeadlineExceededException('late')))
+
+        self.fail(3)
+        self.assertEqual(self.breakers.get('circuit-table').state, STATE_CLOSED)
+
+    def test_calls_without_a_table_are_not_guarded(self, config):
+        self.configure(config)
+        func = MagicMock(side_effect=Base5xxException('boom'))
+        guarded = self.breakers.guard(func)
+
+        for _ in range(5):
+            with self.assertRaises(Base5xxException):
+                guarded()
+        self.assertEqual(self.breakers.states(), {})
+
+    def test_states_are_reported_in_the_metrics(self, config):
+        self.configure(config)
+        CIRCUIT_BREAKERS.reset()
+        CIRCUIT_BREAKERS.get('circuit-table')
+
+        gauges = LogLambdaMetrics.sanitized()['gauges']
+
+        self.assertEqual(gauges['dal.circuit'],
+                         {'circuit-table': {'state': STATE_CLOSED, 'error_rate': 0.0, 'opened': 0}})
+        CIRCUIT_BREAKERS.reset()
+
+
+if __name__ == '__main__':
+    unittest.main()
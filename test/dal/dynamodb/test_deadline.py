@@ -0,0 +1,149 @@
+import unittest
+
+from mock import MagicMock, patch
+
+from wavelength_py.dal.dynamodb.deadline import apply_request_timeout, can_continue, check_deadline, \
+    get_request_timeout, has_time_for
+from wavelength_py.dal.dynamodb.retry import Retrier, RetryBudget
+from wavelength_py.errors.exceptions import DeadlineExceededException
+from wavelength_py.logging.log_lambda_metrics import LogLambdaMetrics
+from wavelength_py.logging.slog import LogLambda
+
+
+def set_remaining_time(millis):
+    LogLambda.context = MagicMock()
+    LogLambda.context.get_remaining_time_in_millis = MagicMock(return_value=millis)
+
+
+def get_pynamo_model_mock(request_timeout_seconds=60):
+    db_model = MagicMock()
+    db_model.Meta.request_timeout_seconds = request_timeout_seconds
+    connection = MagicMock()
+    connection.connection._request_timeout_seconds = request_timeout_seconds
+    db_model._get_connection = MagicMock(return_value=connection)
+    return db_model, connection.connection
+
+
+@patch('wavelength_py.dal.dynamodb.deadline.CONFIG')
+class TestDeadline(unittest.TestCase):
+
+    def setUp(self):
+        LogLambdaMetrics.reset_metrics()
+
+    def tearDown(self):
+        LogLambda.context = None
+
+    @staticmethod
+    def configure(config):
+        config.DEFAULT_LAMBDA_EXEC_MIN_TIME = 5000
+        config.CLIENT_RETRY_MIN_REMAINING_TIME = 1000
+        config.DEFAULT_REQUEST_TIMEOUT = 10
+
+    def test_everything_is_allowed_outside_of_an_invocation(self, config):
+        self.configure(config)
+
+        self.assertTrue(can_continue('query_stream'))
+        self.assertTrue(has_time_for(100000))
+        check_deadline('batch_get')
+        self.assertEqual(get_request_timeout(60), 60)
+
+    def test_multi_request_work_stops_under_the_exec_min_time(self, config):
+        self.configure(config)
+        set_remaining_time(5000)
+        self.assertTrue(can_continue('query_stream'))
+
+        set_remaining_time(4999)
+        self.assertFalse(can_continue('query_stream'))
+        with self.assertRaises(DeadlineExceededException) as ctx:
+            check_deadline('batch_get')
+        self.assertEqual(ctx.exception.get_response(MagicMock())['statusCode'], 503)
+        counters = LogLambdaMetrics.metrics['counters']
+        self.assertEqual(counters['dal.deadline.stop.query_stream'], 1)
+        self.assertEqual(counters['dal.deadline.stop.batch_get'], 1)
+
+    def test_retries_keep_the_min_remaining_time(self, config):
+        self.configure(config)
+        set_remaining_time(1500)
+
+        self.assertTrue(has_time_for(500))
+        self.assertFalse(has_time_for(501))
+
+    def test_socket_timeout_is_sized_to_the_time_left(self, config):
+        self.configure(config)
+        db_model, connection = get_pynamo_model_mock()
+
+        set_remaining_time(3500)
+        restore = apply_request_timeout(db_model)
+        self.assertEqual(connection._request_timeout_seconds, 2.5)
+        restore()
+
+        set_remaining_time(120000)
+        apply_request_timeout(db_model)()
+        self.assertEqual(connection._request_timeout_seconds, 60)
+
+        set_remaining_time(1000)
+        with self.assertRaises(DeadlineExceededException):
+            apply_request_timeout(db_model)
+        self.assertEqual(LogLambdaMetrics.metrics['counters']['dal.deadline.stop.request'], 1)
+
+    def test_socket_timeout_is_put_back_after_the_last_call_in_flight(self, config):
+        self.configure(config)
+        db_model, connection = get_pynamo_model_mock()
+        set_remaining_time(3500)
+
+        first = apply_request_timeout(db_model)
+        set_remaining_time(3000)
+        second = apply_request_timeout(db_model)
+        self.assertEqual(connection._request_timeout_seconds, 2)
+
+        first()
+        self.assertEqual(connection._request_timeout_seconds, 2)
+        second()
+        self.assertEqual(connection._request_timeout_seconds, 60)
+
+    def test_retrier_puts_the_socket_timeout_back(self, config):
+        self.configure(config)
+        db_model, connection = get_pynamo_model_mock()
+        set_remaining_time(3500)
+        command = MagicMock(db_model=db_model)
+        seen = []
+
+        def read(_):
+            seen.append(connection._request_timeout_seconds)
+            if len(seen) == 1:
+                raise ValueError()
+            return 'item'
+
+        retrier = Retrier(lambda err: True, settings=lambda: (2, 1, 1), budget=RetryBudget(10, 1), sleep=MagicMock())
+        with patch('wavelength_py.dal.dynamodb.retry.RATE_LIMITER'):
+            self.assertEqual(retrier(read)(command), 'item')
+            self.assertEqual(connection._request_timeout_seconds, 60)
+
+            with self.assertRaises(ValueError):
+                retrier(MagicMock(side_effect=ValueError()))(command)
+        self.assertEqual(seen, [2.5, 2.5])
+        self.assertEqual(connection._request_timeout_seconds, 60)
+
+    def test_socket_timeout_is_untouched_outside_of_an_invocation(self, config):
+        self.configure(config)
+        db_model, connection = get_pynamo_model_mock()
+
+        apply_request_timeout(db_model)
+
+        db_model._get_connection.assert_not_called()
+        self.assertEqual(connection._request_timeout_seconds, 60)
+
+    def test_retrier_does_not_start_a_call_without_time_left(self, config):
+        self.configure(config)
+        set_remaining_time(900)
+        retrier = Retrier(lambda err: False, settings=lambda: (5, 100, 1000), budget=RetryBudget(10, 1),
+                          sleep=MagicMock())
+        func = MagicMock()
+
+        with self.assertRaises(DeadlineExceededException):
+            retrier(func)()
+        func.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
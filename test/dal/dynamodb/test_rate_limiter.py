@@ -0,0 +1,186 @@
+import unittest
+
+from mock import MagicMock, patch
+
+from wavelength_py.dal.dynamodb.rate_limiter import AdaptiveRateLimiter, AdaptiveTokenBucket, OPERATION_WRITE, \
+    get_consumed_units
+from wavelength_py.dal.dynamodb.retry import ExponentialBackoff, Retrier, RetryBudget, get_call_target
+from wavelength_py.logging.log_lambda_metrics import LogLambdaMetrics
+from wavelength_py.logging.slog import LogLambda
+from test.dal.pynamo_models.test_cachable_pynamo_model import ManualTimer
+
+
+class LimitedModel:
+    class Meta:
+        table_name = 'limited-table'
+        read_rate_limit = 10
+        write_rate_limit = 4
+
+
+class UnlimitedModel:
+    class Meta:
+        table_name = 'unlimited-table'
+
+
+class Throttled(Exception):
+    pass
+
+
+class TestAdaptiveTokenBucket(unittest.TestCase):
+
+    def test_calls_beyond_the_burst_wait_for_tokens(self):
+        timer = ManualTimer()
+        bucket = AdaptiveTokenBucket(10, timer)
+
+        self.assertEqual([bucket.reserve() for _ in range(10)], [0.0] * 10)
+        self.assertAlmostEqual(bucket.reserve(), 0.1)
+        self.assertAlmostEqual(bucket.reserve(), 0.2)
+        timer.now = 1.0
+        self.assertEqual(bucket.reserve(), 0.0)
+
+    def test_reserve_keeps_part_of_the_burst(self):
+        bucket = AdaptiveTokenBucket(10, ManualTimer())
+
+        self.assertEqual([bucket.reserve(0.2) for _ in range(8)], [0.0] * 8)
+        self.assertAlmostEqual(bucket.reserve(0.2), 0.1)
+        self.assertEqual(bucket.reserve(), 0.0)
+
+    def test_throttles_halve_the_rate_once_a_second(self):
+        timer = ManualTimer()
+        bucket = AdaptiveTokenBucket(100, timer)
+
+        bucket.on_throttle()
+        bucket.on_throttle()
+        self.assertEqual(bucket.rate, 50)
+        timer.now = 1.0
+        bucket.on_throttle()
+        self.assertEqual(bucket.rate, 25)
+        for _ in range(10):
+            timer.now += 1
+            bucket.on_throttle()
+        self.assertEqual(bucket.rate, 1)
+
+    def test_successes_raise_the_rate_up_to_max(self):
+        timer = ManualTimer()
+        bucket = AdaptiveTokenBucket(10, timer)
+        bucket.on_throttle()
+
+        bucket.on_success()
+        self.assertAlmostEqual(bucket.rate, 5.2)
+        for _ in range(100):
+            bucket.on_success()
+        self.assertEqual(bucket.rate, 10)
+
+    def test_cost_follows_consumed_capacity(self):
+        bucket = AdaptiveTokenBucket(10, ManualTimer())
+
+        for _ in range(50):
+            bucket.on_success(5)
+        self.assertAlmostEqual(bucket.cost, 5, places=3)
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertAlmostEqual(bucket.reserve(), 0.5, places=3)
+
+    def test_consumed_units(self):
+        self.assertEqual(get_consumed_units({'ConsumedCapacity': {'CapacityUnits': 2}}), 2.0)
+        self.assertEqual(get_consumed_units({'ConsumedCapacity': [{'CapacityUnits': 1.5}]}), 1.5)
+        self.assertIsNone(get_consumed_units({'Items': []}))
+        self.assertIsNone(get_consumed_units(MagicMock()))
+
+
+class TestAdaptiveRateLimiter(unittest.TestCase):
+
+    def setUp(self):
+        LogLambdaMetrics.reset_metrics()
+        self.timer = ManualTimer()
+        self.limiter = AdaptiveRateLimiter(self.timer, MagicMock())
+
+    def tearDown(self):
+        LogLambda.context = None
+
+    def test_buckets_are_opt_in_per_table_index_and_operation(self):
+        read = self.limiter.get_bucket(LimitedModel)
+
+        self.assertEqual(read.max_rate, 10)
+        self.assertIs(self.limiter.get_bucket(LimitedModel), read)
+        self.assertIsNot(self.limiter.get_bucket(LimitedModel, 'by-kind'), read)
+        self.assertEqual(self.limiter.get_bucket(LimitedModel, operation=OPERATION_WRITE).max_rate, 4)
+        self.assertIsNone(self.limiter.get_bucket(UnlimitedModel))
+        self.assertIsNone(self.limiter.get_bucket(None))
+        self.assertEqual(self.limiter.acquire(UnlimitedModel), 0.0)
+
+    def test_acquire_waits_and_counts_the_wait(self):
+        for _ in range(10):
+            self.limiter.acquire(LimitedModel, 'by-kind')
+        self.limiter._sleep.assert_not_called()
+
+        self.assertAlmostEqual(self.limiter.acquire(LimitedModel, 'by-kind'), 0.1)
+        self.limiter._sleep.assert_called_once()
+        self.assertEqual(LogLambdaMetrics.metrics['counters']['dal.rate_limit.wait_ms.limited-table/by-kind'], 100)
+
+    def test_bulk_calls_leave_a_reserve(self):
+        with self.limiter.bulk():
+            waits = [self.limiter.acquire(LimitedModel) for _ in range(9)]
+
+        self.assertEqual(waits[:8], [0.0] * 8)
+        self.assertGreater(waits[8], 0)
+
+    @patch('wavelength_py.dal.dynamodb.rate_limiter.CONFIG')
+    def test_waits_are_capped(self, config):
+        config.RATE_LIMIT_BULK_RESERVE = 0.2
+        config.RATE_LIMIT_MAX_WAIT = 150
+        config.CLIENT_RETRY_MIN_REMAINING_TIME = 1000
+        for _ in range(12):
+            self.limiter.acquire(LimitedModel)
+        self.assertAlmostEqual(self.limiter.acquire(LimitedModel), 0.15)
+
+        LogLambda.context = MagicMock()
+        LogLambda.context.get_remaining_time_in_millis = MagicMock(return_value=1050)
+        self.assertAlmostEqual(self.limiter.acquire(LimitedModel), 0.05)
+
+    def test_throttles_and_successes_tune_the_rate(self):
+        self.limiter.on_throttle(LimitedModel)
+        self.assertEqual(self.limiter.rates(), {'limited-table:read': 5})
+
+        self.limiter.on_success(LimitedModel, result={'ConsumedCapacity': {'CapacityUnits': 1}})
+        self.assertAlmostEqual(self.limiter.rates()['limited-table:read'], 5.2)
+        self.limiter.on_throttle(UnlimitedModel)
+        self.limiter.on_success(UnlimitedModel)
+
+        self.limiter.reset()
+        self.assertEqual(self.limiter.rates(), {})
+
+
+class TestRetrierRateLimiting(unittest.TestCase):
+
+    @patch('wavelength_py.dal.dynamodb.retry.RATE_LIMITER')
+    def test_every_attempt_acquires_and_reports(self, limiter):
+        retrier = Retrier(lambda err: isinstance(err, Throttled), settings=lambda: (5, 100, 1000),
+                          policy=ExponentialBackoff, budget=RetryBudget(capacity=10, refill=1), sleep=MagicMock(),
+                          operation=OPERATION_WRITE)
+        func = MagicMock(side_effect=[Throttled(), 'ok'])
+        pager = MagicMock()
+        pager.db_model = LimitedModel
+        pager.index_name = 'by-kind'
+
+        self.assertEqual(retrier(func)(pager), 'ok')
+        self.assertEqual(limiter.acquire.call_count, 2)
+        limiter.acquire.assert_called_with(LimitedModel, 'by-kind', OPERATION_WRITE)
+        limiter.on_throttle.assert_called_once_with(LimitedModel, 'by-kind', OPERATION_WRITE)
+        limiter.on_success.assert_called_once_with(LimitedModel, 'by-kind', OPERATION_WRITE, result='ok')
+
+    def test_call_target(self):
+        command = MagicMock()
+        command.db_model = None
+        command.index_name = None
+        command._parent.db_model = LimitedModel
+        query = MagicMock()
+        query.index_name = 'by-kind'
+
+        self.assertEqual(get_call_target([command]), (LimitedModel, None))
+        self.assertEqual(get_call_target([command, query]), (LimitedModel, 'by-kind'))
+        self.assertEqual(get_call_target([]), (None, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
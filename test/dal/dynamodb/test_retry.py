@@ -0,0 +1,155 @@
+import unittest
+
+from mock import MagicMock, patch
+
+from wavelength_py.dal.dynamodb.retry import DecorrelatedJitterBackoff, DEFAULT_RETRY_SCOPE, ExponentialBackoff, \
+    FullJitterBackoff, Retrier, RetryBudget, get_retry_scope
+from wavelength_py.logging.log_lambda_metrics import LogLambdaMetrics
+from wavelength_py.logging.slog import LogLambda
+from test.dal.dao.test_platform_persistence_model import DbModelTestMock
+
+
+class Throttled(Exception):
+    pass
+
+
+def is_throttle(error):
+    return isinstance(error, Throttled)
+
+
+def get_retrier(budget=None, max_attempts=5):
+    return Retrier(is_throttle, settings=lambda: (max_attempts, 100, 1000), policy=ExponentialBackoff,
+                   budget=budget or RetryBudget(capacity=10, refill=1), sleep=MagicMock())
+
+
+class TestRetryPolicies(unittest.TestCase):
+
+    def test_exponential(self):
+        policy = ExponentialBackoff()
+
+        self.assertEqual([policy.get_delay(attempt, 0, 100, 1000) for attempt in range(5)],
+                         [100, 200, 400, 800, 1000])
+
+    def test_full_jitter(self):
+        policy = FullJitterBackoff()
+
+        for attempt in range(6):
+            self.assertTrue(0 <= policy.get_delay(attempt, 0, 100, 1000) <= min(1000, 100 * 2 ** attempt))
+
+    def test_decorrelated_jitter(self):
+        policy = DecorrelatedJitterBackoff()
+        previous = 0
+        for attempt in range(6):
+            delay = policy.get_delay(attempt, previous, 100, 1000)
+            self.assertTrue(100 <= delay <= min(1000, max(100, previous) * 3))
+            previous = delay
+
+
+class TestRetryBudget(unittest.TestCase):
+
+    def test_tokens_are_per_scope_and_refilled_by_successes(self):
+        budget = RetryBudget(capacity=2, refill=0.5)
+
+        self.assertTrue(budget.acquire('a'))
+        self.assertTrue(budget.acquire('a'))
+        self.assertFalse(budget.acquire('a'))
+        self.assertTrue(budget.acquire('b'))
+
+        budget.refund('a')
+        self.assertFalse(budget.acquire('a'))
+        budget.refund('a')
+        self.assertTrue(budget.acquire('a'))
+        budget.refund('b')
+        budget.refund('b')
+        self.assertEqual(budget.get_tokens('b'), 2)
+
+
+class TestRetrier(unittest.TestCase):
+
+    def setUp(self):
+        LogLambdaMetrics.reset_metrics()
+
+    def tearDown(self):
+        LogLambda.context = None
+
+    def test_retries_throttles_until_success(self):
+        retrier = get_retrier()
+        func = MagicMock(side_effect=[Throttled(), Throttled(), 'ok'], __qualname__='read')
+
+        self.assertEqual(retrier(func)(), 'ok')
+        self.assertEqual(func.call_count, 3)
+        self.assertEqual([call[0][0] for call in retrier.sleep.call_args_list], [0.1, 0.2])
+        counters = LogLambdaMetrics.metrics['counters']
+        self.assertEqual(counters['dal.retry.count.read'], 2)
+        self.assertEqual(counters['dal.retry.backoff_ms.read'], 300)
+
+    def test_other_errors_are_raised_at_once(self):
+        retrier = get_retrier()
+        func = MagicMock(side_effect=ValueError())
+
+        with self.assertRaises(ValueError):
+            retrier(func)()
+        func.assert_called_once()
+
+    def test_gives_up_after_max_attempts(self):
+        retrier = get_retrier(max_attempts=3)
+        func = MagicMock(side_effect=Throttled())
+
+        with self.assertRaises(Throttled):
+            retrier(func)()
+        self.assertEqual(func.call_count, 3)
+
+    def test_exhausted_budget_fails_fast(self):
+        budget = RetryBudget(capacity=1, refill=1)
+        retrier = get_retrier(budget)
+        func = MagicMock(side_effect=Throttled())
+        command = MagicMock()
+        command.db_model = DbModelTestMock
+
+        with self.assertRaises(Throttled):
+            retrier(func)(command)
+        self.assertEqual(func.call_count, 2)
+        self.assertEqual(budget.get_tokens('test-table'), 0)
+        self.assertEqual(LogLambdaMetrics.metrics['counters']['dal.retry.budget_exhausted.test-table'], 1)
+
+    def test_stops_when_the_deadline_is_near(self):
+        LogLambda.context = MagicMock()
+        LogLambda.context.get_remaining_time_in_millis = MagicMock(return_value=1050)
+        retrier = get_retrier()
+        func = MagicMock(side_effect=Throttled(), __qualname__='read')
+
+        with self.assertRaises(Throttled):
+            retrier(func)()
+        self.assertEqual(func.call_count, 1)
+        self.assertEqual(LogLambdaMetrics.metrics['counters']['dal.retry.deadline_stop.read'], 1)
+
+    @patch('wavelength_py.dal.dynamodb.retry.CONFIG')
+    def test_settings_are_read_on_every_call(self, config):
+        config.MAX_NUMBER_OF_CLIENT_RETRIES = 2
+        config.CLIENT_RETRY_WAIT_EXPONENTIAL_MULTIPLIER = 10
+        config.CLIENT_RETRY_WAIT_EXPONENTIAL_MAX = 10
+        config.CLIENT_RETRY_POLICY = 'exponential'
+        config.CLIENT_RETRY_MIN_REMAINING_TIME = 0
+        retrier = Retrier(is_throttle, budget=RetryBudget(capacity=10, refill=1), sleep=MagicMock())
+        func = MagicMock(side_effect=Throttled())
+
+        with self.assertRaises(Throttled):
+            retrier(func)()
+        self.assertEqual(func.call_count, 2)
+        retrier.sleep.assert_called_once_with(0.01)
+
+    def test_retry_scope(self):
+        command = MagicMock()
+        command.db_model = None
+        command._parent.db_model = DbModelTestMock
+        pager = MagicMock()
+        pager.db_model = DbModelTestMock
+
+        self.assertEqual(get_retry_scope([command]), 'test-table')
+        self.assertEqual(get_retry_scope([pager]), 'test-table')
+        self.assertEqual(get_retry_scope([MagicMock()]), DEFAULT_RETRY_SCOPE)
+        self.assertEqual(get_retry_scope([]), DEFAULT_RETRY_SCOPE)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,12 +4,14 @@ import logging
 import random
 import string
 import unittest
-from time import sleep
 
+from pynamodb.attributes import NumberAttribute, UnicodeAttribute
+from pynamodb.constants import ATTRIBUTES
+from pynamodb.exceptions import DoesNotExist
 from wavelength_py.dal.dal_config import DalConfig
-from cachetools import TTLCache
 from mock import patch, MagicMock
 
+from wavelength_py.dal.cache.model_cache import ModelCache, ModelCacheRegistry
 from wavelength_py.dal.pynamo_models.cachable_pynamo_model import CachingPynamoModel
 from wavelength_py.dal.pynamo_models.util import QueryResult
 
@@ -22,13 +24,20 @@ def random_key():
     return ''.join([random.choice(string.ascii_letters + string.digits) for n in range(32)])
 
 
+KEY_ATTRIBUTES = {'hash_id': UnicodeAttribute(hash_key=True), 'range_id': UnicodeAttribute(range_key=True)}
+
+
+def set_keys(model, key):
+    model.hash_id, model.range_id = key
+    if isinstance(model, MagicMock):
+        model.get_attributes = MagicMock(return_value=KEY_ATTRIBUTES)
+
+
 def item_mock(template: dict):
     result = MagicMock()
     for key in template:
         setattr(result, key, template[key])
-    result.hash_id = random_key()
-    result.range_id = random_key()
-    result._get_keys = MagicMock(return_value=[result.hash_id, result.range_id])
+    set_keys(result, [random_key(), random_key()])
     result.toJSON = MagicMock(return_value=template)
     return result
 
@@ -59,50 +68,98 @@ def query_mock():
     return MagicMock(return_value=result)
 
 
+class ManualTimer:
+    """ Deterministic clock for TTL expiry """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def model_init(self, hash_key=None, range_key=None, **attributes):
+    """ Stands in for Model.__init__, which describes the table as soon as a key is passed """
+    self.attribute_values = {}
+    for name, value in attributes.items():
+        setattr(self, name, value)
+
+
+class CachingModelTestMock(CachingPynamoModel):
+    class Meta:
+        table_name = 'cache-test-table'
+        cache_maxsize = 3
+        cache_ttl = 0.001
+        cache_negative_ttl = 0.001
+
+    hash_id = UnicodeAttribute(hash_key=True)
+    range_id = UnicodeAttribute(range_key=True)
+    kind = UnicodeAttribute(null=True)
+    version = NumberAttribute(null=True)
+
+
 get_mock_result = item_mock({
     'table_state': DalConfig.table_state_new,
     'kind': 'abcd'
 })
 get_mock = MagicMock(return_value=get_mock_result)
+update_mock = MagicMock(return_value=None)
+timer = ManualTimer()
+registry = ModelCacheRegistry(timer)
 
 
-@patch('wavelength_py.dal.pynamo_models.cachable_pynamo_model.PynamoModel.__init__', MagicMock(return_value=None))
+@patch('wavelength_py.dal.pynamo_models.cachable_pynamo_model.PynamoModel.__init__', model_init)
 @patch('wavelength_py.dal.pynamo_models.cachable_pynamo_model.PynamoModel.query', query_mock())
 @patch('wavelength_py.dal.pynamo_models.cachable_pynamo_model.PynamoModel.get', get_mock)
 @patch('wavelength_py.dal.pynamo_models.cachable_pynamo_model.PynamoModel.save', MagicMock(return_value=None))
-@patch('wavelength_py.dal.pynamo_models.cachable_pynamo_model.PynamoModel.update', MagicMock(return_value=None))
+@patch('wavelength_py.dal.pynamo_models.cachable_pynamo_model.PynamoModel.update', update_mock)
 @patch('wavelength_py.dal.pynamo_models.cachable_pynamo_model.PynamoModel.delete', MagicMock(return_value=None))
+@patch('wavelength_py.dal.pynamo_models.cachable_pynamo_model.CACHE_REGISTRY', registry)
 class TestPynamoCacheModel(unittest.TestCase):
 
+    def setUp(self):
+        get_mock.reset_mock()
+        get_mock.side_effect = None
+        update_mock.return_value = None
+        registry.reset()
+
     def test_init(self):
-        model = CachingPynamoModel({})
-        self.assertIsInstance(model.cache, TTLCache)
+        model = CachingModelTestMock({})
+        cache = model.get_cache()
+
+        self.assertIsInstance(cache, ModelCache)
+        self.assertIs(cache, CachingModelTestMock.get_cache())
+        self.assertEqual(cache.maxsize, 3)
+        self.assertIsNot(cache, CachingPynamoModel.get_cache())
 
     def test_query_cache(self):
-        # TODO Stop this test from flapping.
-        get_mock.reset_mock()
-        model = CachingPynamoModel({})
-        CachingPynamoModel.cache = TTLCache(maxsize=128, ttl=0.001)
+        model = CachingModelTestMock({})
         result = model.query('1234')
 
         self.assertIsInstance(result, QueryResult)
         self.assertEqual(len(result.items), 4)
-        item = model.get(result.items[0].hash_id, result.items[0].range_id)
-        self.assertEqual(item.kind, 'abcd')
+        item = model.get(result.items[3].hash_id, result.items[3].range_id)
+        self.assertEqual(item.kind, 'wxyz')
         # Should have pulled from cache
         get_mock.assert_not_called()
-        self.assertEqual(len(model.cache), 4)
-        sleep(.05)
-        self.assertEqual(len(model.cache), 0)
+        # Bounded by Meta.cache_maxsize, the first item was evicted
+        self.assertEqual(len(model.get_cache()), 3)
+        self.assertEqual(model.get_cache().stats.evictions, 1)
+        timer.now += .05
+        self.assertEqual(len(model.get_cache()), 0)
 
-        item = model.get(result.items[0].hash_id, result.items[0].range_id)
+        item = model.get(result.items[3].hash_id, result.items[3].range_id)
         self.assertEqual(item, get_mock_result)
         get_mock.assert_called_once()
 
+    def test_projected_query_is_not_cached(self):
+        model = CachingModelTestMock({})
+        model.query('1234', attributes_to_get=['kind'])
+
+        self.assertEqual(len(model.get_cache()), 0)
+
     def test_get_cache(self):
-        get_mock.reset_mock()
-        model = CachingPynamoModel({})
-        CachingPynamoModel.cache = TTLCache(maxsize=128, ttl=0.001)
+        model = CachingModelTestMock({})
 
         item = model.get(get_mock_result.hash_id, get_mock_result.range_id)
 
@@ -116,64 +173,141 @@ class TestPynamoCacheModel(unittest.TestCase):
 
         # Should have pulled from cache
         get_mock.assert_called_once()
+        self.assertEqual(model.get_cache().stats.hits, 1)
+        self.assertEqual(model.get_cache().stats.misses, 1)
 
-        sleep(.005)
+        timer.now += .05
 
         model.get(get_mock_result.hash_id, get_mock_result.range_id)
 
         self.assertEqual(get_mock.call_count, 2)
 
+    def test_consistent_get_skips_cache_lookup(self):
+        model = CachingModelTestMock({})
+
+        model.get(get_mock_result.hash_id, get_mock_result.range_id)
+        model.get(get_mock_result.hash_id, get_mock_result.range_id, consistent_read=True)
+
+        self.assertEqual(get_mock.call_count, 2)
+
+    def test_negative_cache(self):
+        get_mock.side_effect = DoesNotExist()
+        model = CachingModelTestMock({})
+
+        with self.assertRaises(DoesNotExist):
+            model.get('missing')
+        with self.assertRaises(DoesNotExist):
+            model.get('missing')
+
+        get_mock.assert_called_once()
+        self.assertEqual(model.get_cache().stats.negative_hits, 1)
+
+        timer.now += .05
+
+        with self.assertRaises(DoesNotExist):
+            model.get('missing')
+        self.assertEqual(get_mock.call_count, 2)
+
     def test_save_cache(self):
-        get_mock.reset_mock()
-        model = CachingPynamoModel({})
-        CachingPynamoModel.cache = TTLCache(maxsize=128, ttl=0.001)
+        model = CachingModelTestMock({})
 
         key = [random_key(), random_key()]
 
-        model._get_keys = MagicMock(return_value=key)
+        set_keys(model, key)
 
+        model.kind = 'saved'
         model.save()
+        model.kind = 'changed after save'
 
         item = model.get(*key)
 
-        self.assertEqual(item, model)
+        self.assertIsNot(item, model)
+        self.assertEqual([item.hash_id, item.range_id, item.kind], key + ['saved'])
 
         get_mock.assert_not_called()
 
+    def test_save_replaces_negative_entry(self):
+        get_mock.side_effect = DoesNotExist()
+        model = CachingModelTestMock({})
+        key = [random_key(), random_key()]
+        set_keys(model, key)
+
+        with self.assertRaises(DoesNotExist):
+            model.get(*key)
+        model.save()
+
+        self.assertEqual(model.get(*key).hash_id, key[0])
+
     def test_update_cache(self):
-        get_mock.reset_mock()
-        model = CachingPynamoModel({})
-        CachingPynamoModel.cache = TTLCache(maxsize=128, ttl=0.001)
+        model = CachingModelTestMock({})
 
         key = [random_key(), random_key()]
 
-        model._get_keys = MagicMock(return_value=key)
+        set_keys(model, key)
 
         model.update(actions=[])
 
         item = model.get(*key)
 
-        self.assertEqual(item, model)
+        self.assertIsNot(item, model)
+        self.assertEqual([item.hash_id, item.range_id], key)
 
         get_mock.assert_not_called()
 
+    def test_update_caches_returned_attributes(self):
+        model = CachingModelTestMock({})
+        key = [random_key(), random_key()]
+        set_keys(model, key)
+        update_mock.return_value = {ATTRIBUTES: {'hash_id': {'S': key[0]}, 'range_id': {'S': key[1]},
+                                                 'kind': {'S': 'server'}, 'version': {'N': '4'}}}
+
+        model.update(actions=[])
+        item = model.get(*key, min_version=4)
+
+        self.assertEqual(item.kind, 'server')
+        self.assertEqual(item.version, 4)
+        get_mock.assert_not_called()
+
+    def test_min_version_get(self):
+        model = CachingModelTestMock({})
+        key = [random_key(), random_key()]
+        set_keys(model, key)
+        model.version = 1
+        model.save()
+        get_mock.return_value = stale = CachingModelTestMock(hash_id=key[0], range_id=key[1], version=1)
+        get_mock.side_effect = [stale, CachingModelTestMock(hash_id=key[0], range_id=key[1], version=2)]
+
+        try:
+            self.assertEqual(model.get(*key, min_version=1).version, 1)
+            get_mock.assert_not_called()
+
+            item = model.get(*key, min_version=2)
+        finally:
+            get_mock.return_value = get_mock_result
+
+        self.assertEqual(item.version, 2)
+        self.assertEqual(get_mock.call_count, 2)
+        self.assertTrue(get_mock.call_args[0][2])  # retried as a consistent read
+        self.assertEqual(model.get(*key, min_version=2).version, 2)
+        self.assertEqual(model.get_cache().stats.stale_hits, 1)
+
     def test_delete_cache(self):
-        get_mock.reset_mock()
-        model = CachingPynamoModel({})
-        CachingPynamoModel.cache = TTLCache(maxsize=128, ttl=0.001)
+        model = CachingModelTestMock({})
 
         key = [random_key(), random_key()]
 
-        model._get_keys = MagicMock(return_value=key)
+        set_keys(model, key)
 
         model.save()
 
         item = model.get(*key)
 
-        self.assertEqual(item, model)
+        self.assertEqual(item.hash_id, key[0])
 
         get_mock.assert_not_called()
 
+        model.delete()
+        # Deleting an uncached item is harmless
         model.delete()
 
         item = model.get(*key)
@@ -0,0 +1,92 @@
+import unittest
+
+from mock import MagicMock, patch
+
+from wavelength_py.dal.pynamo_models.util import ResultPager, pynamo_read_handler, pynamo_write_handler
+from wavelength_py.errors.exceptions import Base429Exception
+from wavelength_py.logging.log_lambda_metrics import LogLambdaMetrics
+
+
+def get_result_mock(pages, **kwargs):
+    result = MagicMock()
+    result.page_iter._operation = MagicMock(side_effect=pages)
+    result.page_iter._args = ('table',)
+    result.page_iter._kwargs = {'exclusive_start_key': None, **kwargs}
+    return result
+
+
+class TestResultPager(unittest.TestCase):
+
+    def test_fetch_advances_pages(self):
+        result = get_result_mock([
+            {'Items': [1], 'LastEvaluatedKey': {'id': {'S': '1'}}, 'ConsumedCapacity': {'CapacityUnits': 0.5}},
+            {'Items': [2]}
+        ])
+        pager = ResultPager(MagicMock(), result, select='COUNT')
+
+        first = pager.fetch()
+        self.assertFalse(pager.exhausted)
+        self.assertEqual(pager.last_evaluated_key, {'id': {'S': '1'}})
+        self.assertEqual(ResultPager.get_consumed_capacity(first), 0.5)
+
+        self.assertEqual(pager.fetch(), {'Items': [2]})
+        self.assertTrue(pager.exhausted)
+        self.assertIsNone(pager.fetch())
+
+        operation = result.page_iter._operation
+        self.assertEqual(operation.call_count, 2)
+        self.assertEqual(operation.call_args[1]['exclusive_start_key'], {'id': {'S': '1'}})
+        self.assertEqual(operation.call_args[1]['select'], 'COUNT')
+        self.assertEqual(operation.call_args[1]['return_consumed_capacity'], 'TOTAL')
+
+    def test_failed_fetch_can_be_retried(self):
+        result = get_result_mock([ValueError('throttled'), {'Items': [1]}])
+        pager = ResultPager(MagicMock(), result)
+
+        with self.assertRaises(ValueError):
+            pager.fetch()
+        self.assertFalse(pager.exhausted)
+        self.assertEqual(pager.fetch(), {'Items': [1]})
+
+
+
+def throttled_once():
+    calls = []
+
+    def call():
+        calls.append(1)
+        if len(calls) == 1:
+            raise Base429Exception('throttled')
+        return 'ok'
+    return call
+
+
+@pynamo_read_handler
+def read_items(call):
+    return call()
+
+
+@pynamo_write_handler
+def write_items(call):
+    return call()
+
+
+@patch.multiple('wavelength_py.dal.dynamodb.retry.CONFIG', CLIENT_RETRY_WAIT_EXPONENTIAL_MULTIPLIER=1,
+                CLIENT_RETRY_WAIT_EXPONENTIAL_MAX=1)
+class TestPynamoHandlers(unittest.TestCase):
+
+    def setUp(self):
+        LogLambdaMetrics.reset_metrics()
+
+    def test_retries_are_counted_per_handled_function(self):
+        self.assertEqual(read_items(throttled_once()), 'ok')
+        self.assertEqual(write_items(throttled_once()), 'ok')
+
+        counters = LogLambdaMetrics.metrics['counters']
+        self.assertEqual(counters['dal.retry.count.read_items'], 1)
+        self.assertEqual(counters['dal.retry.count.write_items'], 1)
+        self.assertEqual(read_items.__name__, 'read_items')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -75,6 +75,19 @@ class TestLogLambdaMetrics(unittest.TestCase):
 
         self.assertEqual(LogLambdaMetrics.metrics['gauges'].get('name'), 'something')
 
+    def test_registered_gauges_are_sampled(self):
+        LogLambdaMetrics.reset_metrics()
+        LogLambdaMetrics.register_gauge('test.bytes', lambda: 42)
+        LogLambdaMetrics.register_gauge('test.failing', lambda: 1 / 0)
+        try:
+            metrics = LogLambdaMetrics.sanitized()
+        finally:
+            LogLambdaMetrics.gauge_providers.pop('test.bytes')
+            LogLambdaMetrics.gauge_providers.pop('test.failing')
+
+        self.assertEqual(metrics['gauges'].get('test.bytes'), 42)
+        self.assertNotIn('test.failing', metrics['gauges'])
+
     def test_sets(self):
         LogLambdaMetrics.reset_metrics()
         LogLambdaMetrics.sets('name', 'something')
@@ -121,6 +121,35 @@ class TestSlog(unittest.TestCase):
         decorator(event_mock, context_mock)
         self.assertEqual(log_lambda._get_structured_logger(), None)
 
+    def test_log_lambda_warmup_runs_hooks(self):
+        hook, failing_hook = MagicMock(), MagicMock(side_effect=IOError('throttled'))
+        mock_lambda = MagicMock()
+        mock_lambda.__name__ = 'test-lambda'
+        slog.LogLambda.register_warmup(failing_hook)
+        slog.LogLambda.register_warmup(hook)
+        try:
+            result = slog.LogLambda('test_service')(mock_lambda)({'source': 'serverless-plugin-warmup'}, ctx)
+        finally:
+            slog.LogLambda.warmup_hooks.remove(failing_hook)
+            slog.LogLambda.warmup_hooks.remove(hook)
+
+        self.assertIsNone(result)
+        mock_lambda.assert_not_called()
+        hook.assert_called_once_with()
+
+    def test_log_lambda_exposes_remaining_time(self):
+        remaining = []
+        get_remaining_time = slog.LogLambda.get_remaining_time_in_millis
+        mock_lambda = MagicMock(side_effect=lambda *args: remaining.append(get_remaining_time()))
+        mock_lambda.__name__ = 'test-lambda'
+        context = MagicMock()
+        context.get_remaining_time_in_millis = MagicMock(return_value=2500)
+
+        slog.LogLambda('test_service')(mock_lambda)({}, context)
+
+        self.assertEqual(remaining, [2500])
+        self.assertIsNone(slog.LogLambda.get_remaining_time_in_millis())
+
     def test_filter_pii_info(self):
         event_mock = {
             'interim_desc': {
@@ -24,8 +24,25 @@ class Config:
     MAX_NUMBER_OF_CLIENT_RETRIES = 5, int
     CLIENT_RETRY_WAIT_EXPONENTIAL_MULTIPLIER = 500, int
     CLIENT_RETRY_WAIT_EXPONENTIAL_MAX = 10000, int
+    CLIENT_RETRY_POLICY = 'full_jitter', str  # exponential, full_jitter or decorrelated_jitter
+    CLIENT_RETRY_BUDGET = 10, float  # retries a table can take before its calls fail fast
+    CLIENT_RETRY_BUDGET_REFILL = .1, float  # retry tokens a successful call gives back
+    CLIENT_RETRY_MIN_REMAINING_TIME = 1000, int  # millis of the invocation a retry must leave
+    RATE_LIMIT_DECREASE = .5, float  # rate multiplier applied on a throttle
+    RATE_LIMIT_INCREASE = 1, float  # capacity units per second regained per second of successful calls
+    RATE_LIMIT_MIN = 1, float  # capacity units per second a limited table never goes under
+    RATE_LIMIT_MAX_WAIT = 2000, int  # millis a call waits for its tokens at most
+    RATE_LIMIT_BULK_RESERVE = .2, float  # share of a bucket bulk() calls leave to other calls
+    CIRCUIT_BREAKER_ERROR_RATE = .5, float  # share of failed reads that opens a table's breaker
+    CIRCUIT_BREAKER_MIN_CALLS = 20, int  # reads in the window before the error rate is trusted
+    CIRCUIT_BREAKER_WINDOW = 30, int  # seconds of reads the error rate is computed over
+    CIRCUIT_BREAKER_OPEN_TIME = 5000, int  # millis an open breaker fails reads fast before probing
+    CIRCUIT_BREAKER_PROBES = 3, int  # successful half open probes that close the breaker
 
     DATA_CACHE_TTL = .001, float
+    MEMCACHED_ENDPOINT = '', str  # host:port, the memcached L2 cache is off when empty
+    MEMCACHED_TIMEOUT = .05, float
+    MEMCACHED_TTL = 300, int
 
     def __init__(self):
         """
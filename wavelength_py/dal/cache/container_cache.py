@@ -0,0 +1,287 @@
+"""
+Container lifetime cache for reference style models, serves stale entries while they are refreshed in the background
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Optional, Type
+
+from cachetools import LRUCache
+from pynamodb.models import Model as PynamoModel
+
+from wavelength_py.dal.cache.model_cache import CacheStats, get_cache_name
+from wavelength_py.dal.cache.record_codec import compact, expand, get_compact_size
+from wavelength_py.dal.dal_config import DalConfig
+from wavelength_py.logging.log_lambda_metrics import LogLambdaMetrics
+from wavelength_py.logging.slog import LogLambda, StructLog as log
+
+
+class ContainerCacheEntry:
+    """
+    A cached value, when it was loaded and how to load it again
+    """
+
+    __slots__ = ('value', 'loaded_at', 'loader')
+
+    def __init__(self, value: Any, loaded_at: float, loader: Callable[[], Any]) -> None:
+        self.value = value
+        self.loaded_at = loaded_at
+        self.loader = loader
+
+
+class ContainerCache:  # pylint: disable=too-many-instance-attributes
+    """
+    Cache kept for the whole life of a Lambda container:
+
+        younger than soft_ttl       served from the cache
+        between soft and hard ttl   served stale, refreshed once in a background thread
+        older than hard_ttl         read through, the caller waits for the loader
+
+    A failed background refresh keeps serving the stale value until the hard TTL passes.
+    Items deleted by another container are seen once the hard TTL passed, writes through this container
+    replace or drop the entry right away. A load racing such a write is returned to its caller but not
+    stored, so it can't bring back the value the write replaced.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, soft_ttl: float, hard_ttl: float, maxsize: int = DalConfig.container_cache_maxsize,
+                 timer: Callable[[], float] = time.monotonic, executor: Any = None) -> None:
+        """
+        :param soft_ttl: float seconds an entry is served without a refresh
+        :param hard_ttl: float seconds after which an entry is never served
+        :param maxsize: int max number of entries, least recently used entries are evicted
+        :param timer: callable returning the current time in seconds
+        :param executor: object with a concurrent.futures submit method running the background refreshes,
+        a single worker thread by default
+        """
+        if hard_ttl < soft_ttl:
+            raise ValueError('hard_ttl must not be shorter than soft_ttl')
+        self.soft_ttl = soft_ttl
+        self.hard_ttl = hard_ttl
+        self.maxsize = maxsize
+        self.stats = CacheStats()
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self._timer = timer
+        self._executor = executor
+        self._lock = threading.RLock()
+        self._refreshing: set = set()
+        self._cache = LRUCache(maxsize)
+        # Sequence number of the last write of each recently written key, loads started before it are discarded
+        self._sequence = 0
+        self._written = LRUCache(max(maxsize, 1))
+
+    def get(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """
+        Looks up a key, calling the loader when the entry is missing or past its hard TTL
+        :param key: Hashable
+        :param loader: callable returning the current value, its errors are raised as is
+        :return: Any
+        """
+        with self._lock:
+            entry = self._cache.get(key)
+            now = self._timer()
+            if entry is not None and now - entry.loaded_at >= self.hard_ttl:
+                del self._cache[key]
+                self.stats.expirations += 1
+                entry = None
+
+            if entry is None:
+                self.stats.misses += 1
+            elif now - entry.loaded_at >= self.soft_ttl:
+                self.stats.stale_hits += 1
+                self._schedule_refresh(key, loader)
+            else:
+                self.stats.hits += 1
+
+        if entry is None:
+            return self._load(key, loader)
+        return expand(entry.value)
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        """
+        Looks up a key without loading or refreshing it, stale entries are returned until their hard TTL
+        :param key: Hashable
+        :return: Any, None if the key is not cached
+        """
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None or self._timer() - entry.loaded_at >= self.hard_ttl:
+                return None
+            self.stats.stale_hits += 1
+        return expand(entry.value)
+
+    def put(self, key: Hashable, value: Any, loader: Callable[[], Any]) -> None:
+        """
+        Stores the value just written, loads of the key already in flight are discarded
+        :param key: Hashable
+        :param value: Any
+        :param loader: callable used to refresh the value
+        :return: None
+        """
+        with self._lock:
+            self._record_write(key)
+        self._store(key, value, loader)
+
+    def pop(self, key: Hashable) -> None:
+        """
+        Drops an entry if present, loads of the key already in flight are discarded
+        :param key: Hashable
+        :return: None
+        """
+        with self._lock:
+            self._record_write(key)
+            self._cache.pop(key, None)
+
+    def clear(self) -> None:
+        """
+        Drops every entry
+        :return: None
+        """
+        with self._lock:
+            self._cache.clear()
+
+    def refresh(self) -> None:
+        """
+        Reloads every entry in the calling thread, entries that fail to load keep their stale value
+        :return: None
+        """
+        with self._lock:
+            entries = list(self._cache.items())
+        for key, entry in entries:
+            self._refresh(key, entry.loader)
+
+    @property
+    def memory_size(self) -> int:
+        """
+        Approximate bytes held by the cached values
+        :return: int
+        """
+        with self._lock:
+            return sum(get_compact_size(entry.value) for entry in self._cache.values())
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._cache)
+
+    def _load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        with self._lock:
+            sequence = self._sequence
+        value = loader()
+        self._store(key, value, loader, sequence)
+        return value
+
+    def _store(self, key: Hashable, value: Any, loader: Callable[[], Any], sequence: int = None) -> None:
+        """
+        Caches a value, unless it was loaded from sequence and the key was written since
+        """
+        if self.maxsize <= 0:
+            return
+        entry = ContainerCacheEntry(compact(value), self._timer(), loader)
+        with self._lock:
+            if sequence is not None and self._written.get(key, -1) > sequence:
+                return
+            self._cache[key] = entry
+
+    def _record_write(self, key: Hashable) -> None:
+        self._sequence += 1
+        self._written[key] = self._sequence
+
+    def _schedule_refresh(self, key: Hashable, loader: Callable[[], Any]) -> None:
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        self._executor.submit(self._refresh, key, loader)
+
+    def _refresh(self, key: Hashable, loader: Callable[[], Any]) -> None:
+        try:
+            self._load(key, loader)
+            self.refreshes += 1
+        except Exception as err:  # pylint: disable=broad-except
+            self.refresh_errors += 1
+            log.warn('CONTAINER_CACHE_REFRESH_FAILED', str(err), key=str(key))
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+
+class ContainerCacheRegistry:
+    """
+    One ContainerCache per pynamo model class that opts in through its Meta:
+
+        class Meta:
+            table_name = 'reference-data'
+            container_cache_soft_ttl = 60
+            container_cache_hard_ttl = 3600
+            container_cache_maxsize = 1024
+
+    DAL gets of these models are read through the container cache, see CachingPynamoModel.caches_reads
+    """
+
+    def __init__(self, timer: Callable[[], float] = time.monotonic, executor: Any = None) -> None:
+        self._timer = timer
+        self._executor = executor
+        self._caches: Dict[Type[PynamoModel], Optional[ContainerCache]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, model_class: Type[PynamoModel]) -> Optional[ContainerCache]:
+        """
+        Returns the container cache of a model class
+        :param model_class: Type[PynamoModel]
+        :return: ContainerCache or None if the model does not use one
+        """
+        if model_class not in self._caches:
+            with self._lock:
+                if model_class not in self._caches:
+                    self._caches[model_class] = self._create(model_class)
+        return self._caches[model_class]
+
+    def _create(self, model_class: Type[PynamoModel]) -> Optional[ContainerCache]:
+        meta = getattr(model_class, 'Meta', None)
+        soft_ttl = getattr(meta, 'container_cache_soft_ttl', None)
+        if soft_ttl is None:
+            return None
+        return ContainerCache(soft_ttl=soft_ttl,
+                              hard_ttl=getattr(meta, 'container_cache_hard_ttl', DalConfig.container_cache_hard_ttl),
+                              maxsize=getattr(meta, 'container_cache_maxsize', DalConfig.container_cache_maxsize),
+                              timer=self._timer,
+                              executor=self._executor)
+
+    def refresh(self) -> None:
+        """
+        Reloads every cached entry of every model, used by warmup invocations
+        :return: None
+        """
+        for cache in list(self._caches.values()):
+            if cache is not None:
+                cache.refresh()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Stats for every cache, keyed by table name
+        :return: dict
+        """
+        return {get_cache_name(model_class): cache.stats.to_dict()
+                for model_class, cache in self._caches.items() if cache is not None}
+
+    def memory_size(self) -> int:
+        """
+        Approximate bytes held by every cache
+        :return: int
+        """
+        return sum(cache.memory_size for cache in list(self._caches.values()) if cache is not None)
+
+    def reset(self) -> None:
+        """
+        Discards every cache so they are rebuilt from Meta on next use
+        :return: None
+        """
+        with self._lock:
+            self._caches.clear()
+
+
+CONTAINER_CACHES = ContainerCacheRegistry()
+LogLambdaMetrics.register_gauge('cache.container.bytes', CONTAINER_CACHES.memory_size)
+LogLambda.register_warmup(CONTAINER_CACHES.refresh)
@@ -0,0 +1,370 @@
+"""
+Bloom filters of the keys a table holds, used to measure or skip reads of keys that were never written
+"""
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Type
+
+from pynamodb.models import Model as PynamoModel
+
+from wavelength_py.dal.cache.model_cache import get_cache_name, get_record_key
+from wavelength_py.dal.dal_config import DalConfig
+from wavelength_py.logging.log_lambda_metrics import LogLambdaMetrics
+from wavelength_py.logging.slog import LogLambda, StructLog as log
+
+
+def get_key_token(key: Iterable[Any]) -> str:
+    """
+    Normalized string form of a hash key or (hash key, range key) pair
+    :param key: Iterable of python key values, None parts are ignored
+    :return: str
+    """
+    parts = []
+    for part in key:
+        if part is None:
+            continue
+        if isinstance(part, float) and part.is_integer():
+            part = int(part)
+        parts.append(str(part))
+    return '\x1f'.join(parts)
+
+
+class BloomFilter:
+    """
+    Fixed size Bloom filter over strings, sized for a capacity and a target false positive rate
+    """
+
+    def __init__(self, capacity: int, error_rate: float, built_at: float = 0.0) -> None:
+        """
+        :param capacity: int number of keys the filter is sized for
+        :param error_rate: float false positive rate expected at capacity
+        :param built_at: float epoch seconds of the scan the filter was built from
+        """
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.built_at = built_at
+        self.count = 0
+        self.num_bits = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.num_hashes = max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def add(self, token: str) -> None:
+        """
+        Adds a key
+        :param token: str
+        :return: None
+        """
+        for position in self._get_positions(token):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, token: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._get_positions(token))
+
+    @property
+    def estimated_fp_rate(self) -> float:
+        """
+        False positive rate expected for the number of keys added so far
+        :return: float
+        """
+        return (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+
+    def to_bytes(self) -> bytes:
+        """
+        Serializes the filter, see from_bytes
+        :return: bytes
+        """
+        header = {'capacity': self.capacity, 'error_rate': self.error_rate, 'built_at': self.built_at,
+                  'count': self.count}
+        return json.dumps(header).encode('utf-8') + b'\n' + bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'BloomFilter':
+        """
+        Rebuilds a filter serialized by to_bytes
+        :param data: bytes
+        :return: BloomFilter
+        :raise: ValueError if the data is not a serialized filter
+        """
+        header, _, bits = data.partition(b'\n')
+        try:
+            meta = json.loads(header.decode('utf-8'))
+            result = cls(meta['capacity'], meta['error_rate'], meta['built_at'])
+            result.count = meta['count']
+        except (KeyError, TypeError, UnicodeDecodeError) as err:
+            raise ValueError('Not a serialized bloom filter') from err
+        if len(bits) != len(result.bits):
+            raise ValueError('Bloom filter size does not match its header')
+        result.bits = bytearray(bits)
+        return result
+
+    def _get_positions(self, token: str) -> Iterable[int]:
+        digest = hashlib.blake2b(token.encode('utf-8'), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return ((first + index * second) % self.num_bits for index in range(self.num_hashes))
+
+
+class KeyFilterStats:
+    """
+    Lookups a key filter answered, how many of the keys it let through did not exist and how many
+    of the keys it did not hold existed after all
+    """
+
+    def __init__(self) -> None:
+        self.negatives = 0
+        self.false_positives = 0
+        self.stale_negatives = 0
+
+    @property
+    def observed_fp_rate(self) -> float:
+        """
+        Share of missing keys the filter let through to DynamoDB
+        :return: float
+        """
+        misses = self.negatives + self.false_positives
+        return self.false_positives / misses if misses else 0.0
+
+    @property
+    def observed_stale_rate(self) -> float:
+        """
+        Share of the keys missing from the filter that DynamoDB found, written since the filter was built
+        :return: float
+        """
+        negatives = self.negatives + self.stale_negatives
+        return self.stale_negatives / negatives if negatives else 0.0
+
+
+class KeyFilterRegistry:
+    """
+    One Bloom filter of existing keys per model opting in through Meta:
+
+        class Meta:
+            table_name = 'devices'
+            key_filter_capacity = 100000        # keys the filter is sized for
+            key_filter_error_rate = 0.01
+            key_filter_max_age = 3600           # seconds a filter is trusted after the scan it was built from
+            key_filter_skip_reads = False       # answer 404 for keys the filter does not hold without a read
+
+    Filters are built with a keys only scan (build), saved to DalConfig.key_filter_dir and loaded from there
+    by the next cold start of the container. Keys created through the DAL are added right away, keys created
+    by other containers or writers are only known after the next build.
+
+    Filters are not shared between containers, so by default a key the filter does not hold is still read
+    and the filter only feeds the dal.key_filter.fp_rate gauge: the observed false positive rate and the rate
+    of keys written since the build (stale). Models whose keys are only ever created through this container,
+    or that can live with a 404 for items created elsewhere since the build, opt into skipping those reads with
+    Meta.key_filter_skip_reads; their filters are then trusted for DalConfig.key_filter_skip_max_age at most.
+    Warmup invocations rebuild the filters in use that are missing or too old.
+    """
+
+    def __init__(self, timer: Callable[[], float] = time.time, directory: str = DalConfig.key_filter_dir) -> None:
+        self._timer = timer
+        self._directory = directory
+        self._filters: Dict[Type[PynamoModel], Optional[BloomFilter]] = {}
+        # Tokens of the keys written while a model's filter is built, merged into it once the scan is over
+        self._building: Dict[Type[PynamoModel], List[str]] = {}
+        self._stats: Dict[Type[PynamoModel], KeyFilterStats] = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def get_capacity(db_model: Type[PynamoModel]) -> Optional[int]:
+        """
+        Number of keys a model's filter is sized for
+        :param db_model: Type[PynamoModel]
+        :return: int, None if the model does not use a key filter
+        """
+        capacity = getattr(getattr(db_model, 'Meta', None), 'key_filter_capacity', None)
+        return capacity if isinstance(capacity, int) and capacity > 0 else None
+
+    @staticmethod
+    def skips_reads(db_model: Type[PynamoModel]) -> bool:
+        """
+        Checks whether keys missing from a model's filter are answered without a read
+        :param db_model: Type[PynamoModel]
+        :return: bool
+        """
+        return getattr(getattr(db_model, 'Meta', None), 'key_filter_skip_reads', False) is True
+
+    def get(self, db_model: Type[PynamoModel]) -> Optional[BloomFilter]:
+        """
+        The model's filter, loaded from disk on first use
+        :param db_model: Type[PynamoModel]
+        :return: BloomFilter, None if the model does not use one or it is missing or too old to be trusted
+        """
+        if self.get_capacity(db_model) is None:
+            return None
+        with self._lock:
+            if db_model not in self._filters:
+                self._filters[db_model] = self._load(db_model)
+            bloom = self._filters[db_model]
+        if bloom is None or self._timer() - bloom.built_at >= self._get_max_age(db_model):
+            return None
+        return bloom
+
+    def is_missing(self, db_model: Type[PynamoModel], key: Iterable[Any]) -> bool:
+        """
+        Checks whether a key was not in the table when the model's filter was built, nor created since
+        through this container. Only authoritative for models that skip reads, see skips_reads
+        :param db_model: Type[PynamoModel]
+        :param key: hash key and optional range key
+        :return: bool True only when the model's filter does not hold the key
+        """
+        bloom = self.get(db_model)
+        return bloom is not None and get_key_token(key) not in bloom
+
+    def record_lookup(self, db_model: Type[PynamoModel], missing: bool, found: bool) -> None:
+        """
+        Counts the outcome of a read the model's filter was checked for
+        :param db_model: Type[PynamoModel]
+        :param missing: bool what is_missing answered
+        :param found: bool whether DynamoDB found the key, False for reads skipped by the filter
+        :return: None
+        """
+        if self.get(db_model) is None:
+            return
+        stats = self.get_stats(db_model)
+        if missing and found:
+            stats.stale_negatives += 1
+        elif missing:
+            stats.negatives += 1
+        elif not found:
+            stats.false_positives += 1
+
+    def add(self, db_model: Type[PynamoModel], key: Iterable[Any]) -> None:
+        """
+        Adds a written key to the model's filter, and to the filter being built if any
+        :param db_model: Type[PynamoModel]
+        :param key: hash key and optional range key
+        :return: None
+        """
+        if self.get_capacity(db_model) is None:
+            return
+        token = get_key_token(key)
+        with self._lock:
+            bloom = self._filters.get(db_model)
+            if bloom is not None:
+                bloom.add(token)
+            if db_model in self._building:
+                self._building[db_model].append(token)
+
+    def build(self, db_model: Type[PynamoModel]) -> BloomFilter:
+        """
+        Builds a model's filter from a keys only scan of its table and saves it to disk.
+        The scan fills a private filter, keys written meanwhile are merged into it under the lock when it is published
+        :param db_model: Type[PynamoModel]
+        :return: BloomFilter
+        :raise: ValueError if the model does not use a key filter
+        """
+        capacity = self.get_capacity(db_model)
+        if capacity is None:
+            raise ValueError(f'{get_cache_name(db_model)} does not define Meta.key_filter_capacity')
+        meta = getattr(db_model, 'Meta', None)
+        bloom = BloomFilter(capacity, getattr(meta, 'key_filter_error_rate', DalConfig.key_filter_error_rate),
+                            self._timer())
+        with self._lock:
+            self._building[db_model] = []
+        try:
+            key_names = [attribute.attr_name for attribute in db_model.get_attributes().values()
+                         if attribute.is_hash_key or attribute.is_range_key]
+            for record in db_model.scan(attributes_to_get=key_names):
+                bloom.add(get_key_token(get_record_key(record)))
+        except Exception:
+            with self._lock:
+                self._building.pop(db_model, None)
+            raise
+        with self._lock:
+            for token in self._building.pop(db_model, ()):
+                bloom.add(token)
+            self._filters[db_model] = bloom
+            self._stats[db_model] = KeyFilterStats()
+        self._save(db_model, bloom)
+        return bloom
+
+    def refresh(self) -> None:
+        """
+        Rebuilds the filters in use that are missing or too old, used by warmup invocations
+        :return: None
+        """
+        for db_model in list(self._filters):
+            if self.get(db_model) is not None:
+                continue
+            try:
+                self.build(db_model)
+            except Exception as err:  # pylint: disable=broad-except
+                log.warn('KEY_FILTER_BUILD_FAILED', str(err), table=get_cache_name(db_model))
+
+    def get_stats(self, db_model: Type[PynamoModel]) -> KeyFilterStats:
+        """
+        Lookup counters of a model's filter
+        :param db_model: Type[PynamoModel]
+        :return: KeyFilterStats
+        """
+        with self._lock:
+            return self._stats.setdefault(db_model, KeyFilterStats())
+
+    def fp_rates(self) -> Dict[str, Dict[str, float]]:
+        """
+        Estimated and observed false positive rates and observed stale rate of every loaded filter,
+        keyed by table name
+        :return: dict
+        """
+        result = {}
+        for db_model, bloom in list(self._filters.items()):
+            if bloom is not None:
+                stats = self.get_stats(db_model)
+                result[get_cache_name(db_model)] = {'estimated': bloom.estimated_fp_rate,
+                                                    'observed': stats.observed_fp_rate,
+                                                    'stale': stats.observed_stale_rate}
+        return result
+
+    def reset(self) -> None:
+        """
+        Forgets every filter, they are loaded from disk again on next use
+        :return: None
+        """
+        with self._lock:
+            self._filters.clear()
+            self._stats.clear()
+
+    def get_path(self, db_model: Type[PynamoModel]) -> str:
+        """
+        File a model's filter is saved to
+        :param db_model: Type[PynamoModel]
+        :return: str
+        """
+        return os.path.join(self._directory, f'wavelength-key-filter-{get_cache_name(db_model)}.bin')
+
+    @classmethod
+    def _get_max_age(cls, db_model: Type[PynamoModel]) -> float:
+        max_age = getattr(getattr(db_model, 'Meta', None), 'key_filter_max_age', DalConfig.key_filter_max_age)
+        return min(max_age, DalConfig.key_filter_skip_max_age) if cls.skips_reads(db_model) else max_age
+
+    def _load(self, db_model: Type[PynamoModel]) -> Optional[BloomFilter]:
+        try:
+            with open(self.get_path(db_model), 'rb') as source:
+                bloom = BloomFilter.from_bytes(source.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as err:
+            log.warn('KEY_FILTER_LOAD_FAILED', str(err), table=get_cache_name(db_model))
+            return None
+        return bloom if bloom.capacity == self.get_capacity(db_model) else None
+
+    def _save(self, db_model: Type[PynamoModel], bloom: BloomFilter) -> None:
+        path = self.get_path(db_model)
+        try:
+            with open(f'{path}.tmp', 'wb') as target:
+                target.write(bloom.to_bytes())
+            os.replace(f'{path}.tmp', path)
+        except OSError as err:
+            log.warn('KEY_FILTER_SAVE_FAILED', str(err), table=get_cache_name(db_model))
+
+
+KEY_FILTERS = KeyFilterRegistry()
+LogLambdaMetrics.register_gauge('dal.key_filter.fp_rate', KEY_FILTERS.fp_rates)
+LogLambda.register_warmup(KEY_FILTERS.refresh)
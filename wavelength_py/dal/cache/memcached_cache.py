@@ -0,0 +1,311 @@
+"""
+Optional memcached second level cache shared by every Lambda container, enabled by setting MEMCACHED_ENDPOINT
+"""
+import hashlib
+import json
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple, Type
+
+from pymemcache.client.base import PooledClient
+from pymemcache.exceptions import MemcacheError
+from pynamodb.models import Model as PynamoModel
+
+from wavelength_py.config import CONFIG
+from wavelength_py.dal.cache.model_cache import CacheStats, get_cache_name, get_record_key, get_record_version
+from wavelength_py.dal.cache.record_codec import deserialize_record, dumps, serialize_record
+from wavelength_py.dal.dal_config import DalConfig
+from wavelength_py.logging.slog import StructLog as log
+
+# Bump when the layout of cached values changes so a deploy never reads the previous format
+KEY_FORMAT_VERSION = 1
+
+MEMCACHED_ERRORS = (MemcacheError, OSError, socket.timeout)
+
+
+def get_memcached_client() -> Optional[PooledClient]:
+    """
+    Builds a pooled client for CONFIG.MEMCACHED_ENDPOINT (host:port)
+    :return: PooledClient, None when no endpoint is configured
+    """
+    endpoint = CONFIG.MEMCACHED_ENDPOINT
+    if not endpoint:
+        return None
+    host, _, port = str(endpoint).partition(':')
+    return PooledClient((host, int(port or 11211)),
+                        connect_timeout=CONFIG.MEMCACHED_TIMEOUT,
+                        timeout=CONFIG.MEMCACHED_TIMEOUT,
+                        no_delay=True)
+
+
+class MemcachedCache:  # pylint: disable=too-many-instance-attributes
+    """
+    Caches raw attribute maps of items and query pages in memcached.
+
+    Keys carry KEY_FORMAT_VERSION and a fingerprint of the model's attributes, so a container running a
+    different model version never reads incompatible maps. Query pages remember the generation of their
+    partition, writes bump the generation to invalidate the pages in every container.
+
+    Memcached is strictly optional, any client error is logged, counted and the cache is skipped for
+    DalConfig.memcached_retry_interval seconds.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, client_factory: Callable[[], Any] = get_memcached_client,
+                 ttl: int = None, key_prefix: str = 'wl', retry_interval: float = None,
+                 timer: Callable[[], float] = time.monotonic) -> None:
+        """
+        :param client_factory: callable returning a pymemcache compatible client or None to disable the cache
+        :param ttl: int seconds entries live in memcached
+        :param key_prefix: str namespace for every key
+        :param retry_interval: float seconds to skip memcached after an error
+        :param timer: callable returning the current time in seconds
+        """
+        self._client_factory = client_factory
+        self._client: Any = None
+        self._resolved = False
+        self.ttl = ttl if ttl is not None else CONFIG.MEMCACHED_TTL
+        self.key_prefix = key_prefix
+        self.retry_interval = retry_interval if retry_interval is not None else DalConfig.memcached_retry_interval
+        self.stats = CacheStats()
+        self.errors = 0
+        self._timer = timer
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+        self._fingerprints: Dict[Type[PynamoModel], str] = {}
+
+    @property
+    def client(self) -> Any:
+        """
+        Lazily built memcached client
+        :return: client or None when memcached is not configured
+        """
+        if not self._resolved:
+            with self._lock:
+                if not self._resolved:
+                    self._client = self._client_factory() if self._client_factory else None
+                    self._resolved = True
+        return self._client
+
+    @property
+    def available(self) -> bool:
+        """
+        True if memcached is configured and did not fail recently
+        :return: bool
+        """
+        return self.client is not None and self._timer() >= self._retry_at
+
+    def get_items(self, db_model: Type[PynamoModel], keys: Iterable[Tuple]) -> Dict[Tuple, PynamoModel]:
+        """
+        Looks up many items with a single get_many
+        :param db_model: Type[PynamoModel]
+        :param keys: Iterable of (hash_key, range_key) tuples
+        :return: dict of key tuple to record, misses are left out
+        """
+        cache_keys = {self._get_item_key(db_model, key): key for key in keys}
+        if not cache_keys or not self.available:
+            return {}
+        values = self._call('get_many', list(cache_keys), default={})
+        result = {}
+        for cache_key, key in cache_keys.items():
+            record = self._load_record(db_model, values.get(cache_key))
+            if record is None:
+                self.stats.misses += 1
+            else:
+                self.stats.hits += 1
+                result[key] = record
+        return result
+
+    def put_items(self, records: Iterable[PynamoModel]) -> None:
+        """
+        Writes items through, versioned records are looked up with a single gets_many and stored with
+        add/cas like put_item so an older copy never replaces a newer one, unversioned records with a set_many
+        :param records: Iterable[PynamoModel]
+        :return: None
+        """
+        if not self.available:
+            return
+        values = {}
+        versioned = {}
+        for record in records:
+            key = self._get_item_key(type(record), get_record_key(record))
+            value = dumps(serialize_record(record))
+            version = get_record_version(record)
+            if version is None:
+                values[key] = value
+            else:
+                versioned[key] = (type(record), value, version)
+        if values:
+            self._call('set_many', values, expire=self.ttl)
+        if versioned:
+            current = self._call('gets_many', list(versioned), default={}) or {}
+            for key, (db_model, value, version) in versioned.items():
+                self._store_versioned(db_model, key, value, version, *current.get(key, (None, None)))
+
+    def put_item(self, record: PynamoModel) -> None:
+        """
+        Writes a single item through unless memcached holds a newer version of it, uses gets/cas so a
+        concurrent writer is never overwritten with an older copy
+        :param record: PynamoModel
+        :return: None
+        """
+        if not self.available:
+            return
+        db_model = type(record)
+        key = self._get_item_key(db_model, get_record_key(record))
+        value = dumps(serialize_record(record))
+        version = get_record_version(record)
+        if version is None:
+            self._call('set', key, value, expire=self.ttl)
+            return
+
+        current, cas_token = self._call('gets', key, default=(None, None))
+        self._store_versioned(db_model, key, value, version, current, cas_token)
+
+    def delete_item(self, record: PynamoModel) -> None:
+        """
+        Drops a cached item
+        :param record: PynamoModel
+        :return: None
+        """
+        if self.available:
+            self._call('delete', self._get_item_key(type(record), get_record_key(record)))
+
+    def get_query(self, db_model: Type[PynamoModel], index_name: Optional[str], hash_key: Any,
+                  query_key: Hashable) -> Tuple[Optional[Tuple[List[PynamoModel], Optional[str]]], Any]:
+        """
+        Looks up a query page and the current generation of its partition in one round trip.
+        The generation must be handed back to put_query, reading it before DynamoDB is queried guarantees
+        a page racing a write is stored under the outdated generation
+        :param db_model: Type[PynamoModel]
+        :param index_name: str
+        :param hash_key: Any
+        :param query_key: Hashable normalized query arguments
+        :return: ((records, start_token) or None on a miss, generation)
+        """
+        if not self.available:
+            return None, None
+        page_key = self._get_query_key(db_model, index_name, hash_key, query_key)
+        generation_key = self._get_generation_key(db_model, index_name, hash_key)
+        values = self._call('get_many', [page_key, generation_key], default={})
+        generation = self._loads(values.get(generation_key))
+        page = self._loads(values.get(page_key))
+        if page is None or page.get('g') != generation:
+            self.stats.misses += 1
+            return None, generation
+
+        records = [self._build_record(db_model, raw) for raw in page.get('i', [])]
+        if any(record is None for record in records):
+            self.stats.misses += 1
+            return None, generation
+        self.stats.hits += 1
+        return (records, page.get('t')), generation
+
+    # pylint: disable=too-many-arguments
+    def put_query(self, db_model: Type[PynamoModel], index_name: Optional[str], hash_key: Any, query_key: Hashable,
+                  records: List[PynamoModel], start_token: Optional[str], generation: Any) -> None:
+        """
+        Caches a query page under the partition generation returned by get_query
+        :param db_model: Type[PynamoModel]
+        :param index_name: str
+        :param hash_key: Any
+        :param query_key: Hashable normalized query arguments
+        :param records: List[PynamoModel]
+        :param start_token: str
+        :param generation: Any
+        :return: None
+        """
+        if not self.available:
+            return
+        page = {'g': generation, 't': start_token, 'i': [serialize_record(record) for record in records]}
+        self._call('set', self._get_query_key(db_model, index_name, hash_key, query_key), dumps(page),
+                   expire=self.ttl)
+
+    def invalidate_partition(self, db_model: Type[PynamoModel], hash_key: Any) -> None:
+        """
+        Bumps the generation of a table partition and of the table's index queries
+        :param db_model: Type[PynamoModel]
+        :param hash_key: Any table hash key that was written
+        :return: None
+        """
+        if not self.available:
+            return
+        for key in (self._get_generation_key(db_model, None, hash_key),
+                    self._get_generation_key(db_model, '*', None)):
+            if self._call('incr', key, 1) is None:
+                # A missing generation restarts from the clock so it can't collide with an evicted one
+                self._call('add', key, str(int(time.time() * 1000)), noreply=False)
+
+    def _call(self, method: str, *args, default: Any = None, **kwargs) -> Any:
+        if not self.available:
+            return default
+        try:
+            return getattr(self.client, method)(*args, **kwargs)
+        except MEMCACHED_ERRORS as err:
+            self.errors += 1
+            self._retry_at = self._timer() + self.retry_interval
+            log.warn('MEMCACHED_UNAVAILABLE', str(err), operation=method)
+            return default
+
+    def _store_versioned(self, db_model: Type[PynamoModel], key: str, value: bytes, version: int,
+                         current: Optional[bytes], cas_token: Any) -> None:
+        if current is None:
+            self._call('add', key, value, expire=self.ttl, noreply=False)
+            return
+        current_record = self._load_record(db_model, current)
+        if current_record is not None and (get_record_version(current_record) or 0) > version:
+            return
+        self._call('cas', key, value, cas_token, expire=self.ttl, noreply=False)
+
+    def _get_item_key(self, db_model: Type[PynamoModel], key: Tuple) -> str:
+        return self._build_key(db_model, 'i', key)
+
+    def _get_query_key(self, db_model: Type[PynamoModel], index_name: Optional[str], hash_key: Any,
+                       query_key: Hashable) -> str:
+        return self._build_key(db_model, 'q', (index_name, hash_key, query_key))
+
+    def _get_generation_key(self, db_model: Type[PynamoModel], index_name: Optional[str], hash_key: Any) -> str:
+        # every index of a table shares a generation, see invalidate_partition
+        return self._build_key(db_model, 'g', ('*', None) if index_name else (None, hash_key))
+
+    def _build_key(self, db_model: Type[PynamoModel], kind: str, parts: Tuple) -> str:
+        digest = hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+        return f'{self.key_prefix}:{KEY_FORMAT_VERSION}:{self._get_fingerprint(db_model)}:{kind}:{digest}'
+
+    def _get_fingerprint(self, db_model: Type[PynamoModel]) -> str:
+        """
+        Short digest of the table name and attribute layout of a model
+        :param db_model: Type[PynamoModel]
+        :return: str
+        """
+        fingerprint = self._fingerprints.get(db_model)
+        if fingerprint is None:
+            layout = sorted((attr.attr_name, attr.attr_type) for attr in db_model.get_attributes().values())
+            source = repr((get_cache_name(db_model), layout)).encode('utf-8')
+            fingerprint = self._fingerprints[db_model] = hashlib.sha1(source).hexdigest()[:12]
+        return fingerprint
+
+    def _load_record(self, db_model: Type[PynamoModel], value: Optional[bytes]) -> Optional[PynamoModel]:
+        return self._build_record(db_model, self._loads(value))
+
+    @staticmethod
+    def _build_record(db_model: Type[PynamoModel], raw: Optional[Dict[str, Any]]) -> Optional[PynamoModel]:
+        if raw is None:
+            return None
+        try:
+            return deserialize_record(db_model, raw)
+        except (AttributeError, KeyError, TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _loads(value: Optional[bytes]) -> Any:
+        if value is None:
+            return None
+        try:
+            return json.loads(value)
+        except ValueError:
+            return None
+
+
+MEMCACHED_CACHE = MemcachedCache()
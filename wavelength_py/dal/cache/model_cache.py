@@ -0,0 +1,358 @@
+"""
+Per-model item caches for pynamo models
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple, Type
+
+from cachetools import Cache, LFUCache, LRUCache
+from pynamodb.models import Model as PynamoModel
+
+from wavelength_py.config import CONFIG
+from wavelength_py.dal.cache.record_codec import compact, expand, get_compact_size
+from wavelength_py.dal.dal_config import DalConfig
+from wavelength_py.logging.log_lambda_metrics import LogLambdaMetrics
+
+CACHE_POLICY_LRU = 'LRU'
+CACHE_POLICY_LFU = 'LFU'
+
+# Marker stored for keys known not to exist (negative caching)
+NOT_FOUND = type('NotFound', (), {'__repr__': lambda self: 'NOT_FOUND'})()
+
+
+class CacheStats:
+    """
+    Hit/miss/eviction counters for a single cache
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.stale_hits = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """
+        Share of lookups answered from the cache, including negative hits
+        :return: float
+        """
+        lookups = self.hits + self.negative_hits + self.misses
+        return (self.hits + self.negative_hits) / lookups if lookups else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        JSON friendly view of the counters
+        :return: dict
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'negative_hits': self.negative_hits,
+            'stale_hits': self.stale_hits,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'hit_rate': self.hit_rate
+        }
+
+
+class _EvictionCounter:
+    """
+    Mixin counting cachetools evictions, Cache.__setitem__ calls popitem whenever it needs room
+    """
+
+    def __init__(self, maxsize, stats: CacheStats, getsizeof=None):
+        super().__init__(maxsize, getsizeof=getsizeof)
+        self._stats = stats
+
+    def popitem(self):
+        """
+        Evicts an item according to the cache's policy
+        :return: tuple
+        """
+        result = super().popitem()  # pylint: disable=no-member
+        self._stats.evictions += 1
+        return result
+
+
+class _CountingLRUCache(_EvictionCounter, LRUCache):
+    pass
+
+
+class _CountingLFUCache(_EvictionCounter, LFUCache):
+    pass
+
+
+CACHE_POLICIES = {
+    CACHE_POLICY_LRU: _CountingLRUCache,
+    CACHE_POLICY_LFU: _CountingLFUCache
+}
+
+
+class ModelCache:
+    """
+    Thread safe, size bounded item cache with a TTL per entry, an LRU or LFU eviction policy
+    and optional negative caching of missing keys.
+
+    Entries may carry the item's version: a put never replaces a newer version and readers can ask
+    for at least a given version.
+
+    Pynamo records are stored as CompactRecord and rehydrated on every hit, memory_size reports the
+    approximate bytes held. Expired entries stay until evicted, replaced or dropped by expire, see peek
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, maxsize: int, ttl: float, policy: str = CACHE_POLICY_LRU, negative_ttl: float = 0,
+                 timer: Callable[[], float] = time.monotonic,
+                 compress_threshold: int = DalConfig.cache_compress_threshold) -> None:
+        """
+        :param maxsize: int max number of entries
+        :param ttl: float seconds an item stays fresh
+        :param policy: str LRU or LFU
+        :param negative_ttl: float seconds a missing key is remembered, 0 disables negative caching
+        :param timer: callable returning the current time in seconds
+        :param compress_threshold: int bytes above which cached records are compressed, 0 disables compression
+        """
+        cache_type = CACHE_POLICIES.get(str(policy).upper())
+        if cache_type is None:
+            raise ValueError(f'Unknown cache policy "{policy}"')
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.policy = str(policy).upper()
+        self.negative_ttl = negative_ttl
+        self.compress_threshold = compress_threshold
+        self.stats = CacheStats()
+        self._timer = timer
+        self._lock = threading.RLock()
+        self._cache: Cache = cache_type(maxsize, self.stats)
+
+    def get(self, key: Hashable, default: Any = None, min_version: int = None) -> Any:
+        """
+        Looks up a fresh entry
+        :param key: Hashable
+        :param default: returned on a miss
+        :param min_version: int entries holding an older (or no) version and cached misses count as a miss
+        :return: the cached value, NOT_FOUND for a cached miss or default
+        """
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] <= self._timer():
+                # kept for peek until evicted, replaced or dropped by expire
+                self.stats.expirations += 1
+                entry = None
+
+            if entry is None:
+                self.stats.misses += 1
+                return default
+
+            if min_version is not None and (entry[1] is NOT_FOUND or (entry[2] or 0) < min_version):
+                self.stats.stale_hits += 1
+                return default
+
+            if entry[1] is NOT_FOUND:
+                self.stats.negative_hits += 1
+            else:
+                self.stats.hits += 1
+        return expand(entry[1])
+
+    def peek(self, key: Hashable) -> Any:
+        """
+        Looks up an entry however stale, expired entries are kept until evicted or replaced
+        :param key: Hashable
+        :return: the cached value, NOT_FOUND for a cached miss or None
+        """
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            self.stats.stale_hits += 1
+        return expand(entry[1])
+
+    def put(self, key: Hashable, value: Any, version: int = None) -> None:
+        """
+        Stores a value for the cache's TTL, unless a newer version of it is cached
+        :param key: Hashable
+        :param value: Any
+        :param version: int the item's version, if known
+        :return: None
+        """
+        self._store(key, value, self.ttl, version)
+
+    def put_missing(self, key: Hashable) -> None:
+        """
+        Remembers that a key does not exist, no-op unless negative caching is enabled
+        :param key: Hashable
+        :return: None
+        """
+        if self.negative_ttl > 0:
+            self._store(key, NOT_FOUND, self.negative_ttl)
+
+    def _store(self, key: Hashable, value: Any, ttl: float, version: int = None) -> None:
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        value = compact(value, self.compress_threshold)
+        with self._lock:
+            now = self._timer()
+            current = self._cache.get(key)
+            if version is not None and current is not None and current[0] > now and (current[2] or 0) > version:
+                return
+            self._cache[key] = (now + ttl, value, version)
+
+    def pop(self, key: Hashable) -> Any:
+        """
+        Removes an entry if present
+        :param key: Hashable
+        :return: the removed value or None
+        """
+        with self._lock:
+            entry = self._cache.pop(key, None)
+        return expand(entry[1]) if entry else None
+
+    def clear(self) -> None:
+        """
+        Drops every entry
+        :return: None
+        """
+        with self._lock:
+            self._cache.clear()
+
+    @property
+    def memory_size(self) -> int:
+        """
+        Approximate bytes held by the cached values
+        :return: int
+        """
+        with self._lock:
+            return sum(get_compact_size(entry[1]) for entry in self._cache.values())
+
+    def expire(self) -> None:
+        """
+        Drops stale entries
+        :return: None
+        """
+        with self._lock:
+            now = self._timer()
+            for key in [key for key, entry in self._cache.items() if entry[0] <= now]:
+                del self._cache[key]
+                self.stats.expirations += 1
+
+    def __len__(self) -> int:
+        self.expire()
+        return len(self._cache)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._cache.get(key)
+            return entry is not None and entry[0] > self._timer()
+
+
+class ModelCacheRegistry:
+    """
+    One ModelCache per pynamo model class, configured through the model's Meta:
+
+        class Meta:
+            table_name = 'reference-data'
+            cache_maxsize = 1024
+            cache_ttl = 300
+            cache_policy = 'LFU'
+            cache_negative_ttl = 30
+            cache_compress_threshold = 1024
+            cache_reads = True          # DAL gets may be answered from the caches, see CachingPynamoModel
+    """
+
+    def __init__(self, timer: Callable[[], float] = time.monotonic) -> None:
+        self._timer = timer
+        self._caches: Dict[Type[PynamoModel], ModelCache] = {}
+        self._lock = threading.Lock()
+
+    def get(self, model_class: Type[PynamoModel]) -> ModelCache:
+        """
+        Returns the cache for a model class, creating it from the model's Meta on first use
+        :param model_class: Type[PynamoModel]
+        :return: ModelCache
+        """
+        cache = self._caches.get(model_class)
+        if cache is None:
+            with self._lock:
+                cache = self._caches.get(model_class)
+                if cache is None:
+                    cache = self._create(model_class)
+                    self._caches[model_class] = cache
+        return cache
+
+    def _create(self, model_class: Type[PynamoModel]) -> ModelCache:
+        meta = getattr(model_class, 'Meta', None)
+        return ModelCache(maxsize=getattr(meta, 'cache_maxsize', DalConfig.cache_maxsize),
+                          ttl=getattr(meta, 'cache_ttl', CONFIG.DATA_CACHE_TTL),
+                          policy=getattr(meta, 'cache_policy', DalConfig.cache_policy),
+                          negative_ttl=getattr(meta, 'cache_negative_ttl', DalConfig.cache_negative_ttl),
+                          timer=self._timer,
+                          compress_threshold=getattr(meta, 'cache_compress_threshold',
+                                                     DalConfig.cache_compress_threshold))
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Stats for every cache, keyed by table name
+        :return: dict
+        """
+        return {get_cache_name(model_class): cache.stats.to_dict() for model_class, cache in self._caches.items()}
+
+    def memory_size(self) -> int:
+        """
+        Approximate bytes held by every cache
+        :return: int
+        """
+        return sum(cache.memory_size for cache in list(self._caches.values()))
+
+    def reset(self, model_class: Optional[Type[PynamoModel]] = None) -> None:
+        """
+        Discards the cache of one model class, or all of them, so it is rebuilt from Meta on next use
+        :param model_class: Type[PynamoModel]
+        :return: None
+        """
+        with self._lock:
+            if model_class is None:
+                self._caches.clear()
+            else:
+                self._caches.pop(model_class, None)
+
+
+def get_record_key(record: PynamoModel) -> Tuple[Any, Any]:
+    """
+    Python values of a record's hash and range key, the range key is None for hash-only tables
+    :param record: PynamoModel
+    :return: tuple
+    """
+    hash_key = range_key = None
+    for name, attribute in record.get_attributes().items():
+        if attribute.is_hash_key:
+            hash_key = getattr(record, name)
+        elif attribute.is_range_key:
+            range_key = getattr(record, name)
+    return hash_key, range_key
+
+
+def get_record_version(record: PynamoModel) -> Optional[int]:
+    """
+    The record's version attribute, None if it has none
+    :param record: PynamoModel
+    :return: int
+    """
+    version = getattr(record, 'version', None)
+    return version if isinstance(version, (int, float)) else None
+
+
+def get_cache_name(model_class: Type[PynamoModel]) -> str:
+    """
+    Table name of a model class, falls back to the class name
+    :param model_class: Type[PynamoModel]
+    :return: str
+    """
+    return getattr(getattr(model_class, 'Meta', None), 'table_name', None) or model_class.__name__
+
+
+CACHE_REGISTRY = ModelCacheRegistry()
+LogLambdaMetrics.register_gauge('cache.items.bytes', CACHE_REGISTRY.memory_size)
@@ -0,0 +1,154 @@
+"""
+Whole hash key partitions of small, opted-in tables, used to answer range queries without calling DynamoDB
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Type
+
+from pynamodb.models import Model as PynamoModel
+
+from wavelength_py.dal.cache.model_cache import ModelCache, NOT_FOUND
+from wavelength_py.dal.cache.record_codec import compact, expand
+from wavelength_py.dal.dal_config import DalConfig
+from wavelength_py.logging.log_lambda_metrics import LogLambdaMetrics
+
+
+class PartitionCache:
+    """
+    Caches every item of a hash key partition, sorted by range key, for models opting in through Meta:
+
+        class Meta:
+            table_name = 'user-settings'
+            partition_cache_max_items = 200     # larger partitions are never cached
+            partition_cache_maxsize = 256       # partitions kept per table
+            partition_cache_ttl = 300
+
+    Partitions larger than partition_cache_max_items are remembered as such for the TTL so they are not
+    loaded again on every query. Writes invalidate the written partition, a load racing a write of the
+    same table is discarded (see get_generation).
+    """
+
+    def __init__(self, timer: Callable[[], float] = time.monotonic) -> None:
+        self._timer = timer
+        self._caches: Dict[Type[PynamoModel], Optional[ModelCache]] = {}
+        self._generations: Dict[Type[PynamoModel], int] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def get_max_items(db_model: Type[PynamoModel]) -> Optional[int]:
+        """
+        Largest partition a model caches
+        :param db_model: Type[PynamoModel]
+        :return: int, None if the model does not cache partitions
+        """
+        max_items = getattr(getattr(db_model, 'Meta', None), 'partition_cache_max_items', None)
+        return max_items if isinstance(max_items, int) and max_items > 0 else None
+
+    def get(self, db_model: Type[PynamoModel], hash_key: Any) -> Any:
+        """
+        Looks up a partition
+        :param db_model: Type[PynamoModel]
+        :param hash_key: Any
+        :return: List[PynamoModel] sorted by range key, NOT_FOUND for a partition too large to cache,
+        None on a miss
+        """
+        cache = self._get_cache(db_model)
+        if cache is None:
+            return None
+        records = cache.get(hash_key)
+        if records is None or records is NOT_FOUND:
+            return records
+        return [expand(record) for record in records]
+
+    def peek(self, db_model: Type[PynamoModel], hash_key: Any) -> Optional[List[PynamoModel]]:
+        """
+        Looks up a partition however stale, written partitions are dropped and never returned
+        :param db_model: Type[PynamoModel]
+        :param hash_key: Any
+        :return: List[PynamoModel] sorted by range key, None if the partition is not cached
+        """
+        cache = self._get_cache(db_model)
+        records = cache.peek(hash_key) if cache is not None else None
+        if records is None or records is NOT_FOUND:
+            return None
+        return [expand(record) for record in records]
+
+    def get_generation(self, db_model: Type[PynamoModel]) -> int:
+        """
+        Counter bumped by every invalidation of a table, read it before loading a partition
+        :param db_model: Type[PynamoModel]
+        :return: int
+        """
+        return self._generations.get(db_model, 0)
+
+    def put(self, db_model: Type[PynamoModel], hash_key: Any, records: List[PynamoModel], generation: int) -> None:
+        """
+        Caches a partition unless the table was written since generation was read
+        :param db_model: Type[PynamoModel]
+        :param hash_key: Any
+        :param records: List[PynamoModel] sorted by range key
+        :param generation: int from get_generation
+        :return: None
+        """
+        cache = self._get_cache(db_model)
+        if cache is None or generation != self.get_generation(db_model):
+            return
+        cache.put(hash_key, tuple(compact(record, cache.compress_threshold) for record in records))
+
+    def put_oversized(self, db_model: Type[PynamoModel], hash_key: Any) -> None:
+        """
+        Remembers that a partition holds more than partition_cache_max_items
+        :param db_model: Type[PynamoModel]
+        :param hash_key: Any
+        :return: None
+        """
+        cache = self._get_cache(db_model)
+        if cache is not None:
+            cache.put_missing(hash_key)
+
+    def invalidate(self, db_model: Type[PynamoModel], hash_key: Any) -> None:
+        """
+        Drops a written partition
+        :param db_model: Type[PynamoModel]
+        :param hash_key: Any table hash key that was written
+        :return: None
+        """
+        with self._lock:
+            self._generations[db_model] = self._generations.get(db_model, 0) + 1
+        cache = self._caches.get(db_model)
+        if cache is not None:
+            cache.pop(hash_key)
+
+    def memory_size(self) -> int:
+        """
+        Approximate bytes held by every cached partition
+        :return: int
+        """
+        return sum(cache.memory_size for cache in list(self._caches.values()) if cache is not None)
+
+    def clear(self) -> None:
+        """
+        Drops every partition
+        :return: None
+        """
+        with self._lock:
+            self._caches.clear()
+
+    def _get_cache(self, db_model: Type[PynamoModel]) -> Optional[ModelCache]:
+        if db_model not in self._caches:
+            with self._lock:
+                if db_model not in self._caches:
+                    self._caches[db_model] = self._create(db_model)
+        return self._caches[db_model]
+
+    def _create(self, db_model: Type[PynamoModel]) -> Optional[ModelCache]:
+        if self.get_max_items(db_model) is None:
+            return None
+        meta = getattr(db_model, 'Meta', None)
+        ttl = getattr(meta, 'partition_cache_ttl', DalConfig.partition_cache_ttl)
+        return ModelCache(maxsize=getattr(meta, 'partition_cache_maxsize', DalConfig.partition_cache_maxsize),
+                          ttl=ttl, negative_ttl=ttl, timer=self._timer)
+
+
+PARTITION_CACHE = PartitionCache()
+LogLambdaMetrics.register_gauge('cache.partitions.bytes', PARTITION_CACHE.memory_size)
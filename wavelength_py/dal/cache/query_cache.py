@@ -0,0 +1,234 @@
+"""
+Query result cache shared by every PynamoQueryCommand, invalidated by writes to the queried partition
+"""
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional, Set, Tuple, Type
+
+from cachetools import LRUCache
+from pynamodb.models import Model as PynamoModel
+
+from wavelength_py.config import CONFIG
+from wavelength_py.dal.cache.model_cache import CacheStats, get_cache_name
+from wavelength_py.dal.cache.record_codec import CompactRecord, compact, expand, get_deep_size
+from wavelength_py.dal.dal_config import DalConfig
+from wavelength_py.logging.log_lambda_metrics import LogLambdaMetrics
+
+# Partition of the index queries of a table in QueryResultCache's key index, any write to the table drops them
+_INDEX_QUERIES = object()
+
+
+class QueryCacheEntry:
+    """
+    The db records of a query page, domain models are rebuilt for every hit so none are kept alive.
+    Cached entries hold compact copies of the records (see compacted), rehydrated on every read
+    """
+
+    __slots__ = ('_records', 'start_token', 'generation', 'size')
+
+    def __init__(self, records: List[PynamoModel], start_token: Optional[str], generation: int = 0) -> None:
+        """
+        :param records: List[PynamoModel] db records, before the post filter
+        :param start_token: str encoded token of the next page
+        :param generation: int PARTITION_CACHE generation of the table read before the page was loaded
+        """
+        self._records = records
+        self.start_token = start_token
+        self.generation = generation
+        self.size = sys.getsizeof(records) + get_deep_size(start_token) + sum(
+            self._get_record_size(record) for record in records)
+
+    @staticmethod
+    def _get_record_size(record: Any) -> int:
+        if isinstance(record, CompactRecord):
+            return record.size
+        return get_deep_size(getattr(record, 'attribute_values', None))
+
+    @property
+    def records(self) -> List[PynamoModel]:
+        """
+        The page's records, fresh copies for a compacted entry
+        :return: List[PynamoModel]
+        """
+        return [expand(record) for record in self._records]
+
+    def compacted(self, compress_threshold: int = DalConfig.cache_compress_threshold) -> 'QueryCacheEntry':
+        """
+        Copy of this entry holding compact encodings of its records
+        :param compress_threshold: int see CompactRecord
+        :return: QueryCacheEntry
+        """
+        return QueryCacheEntry(tuple(compact(record, compress_threshold) for record in self._records),
+                               self.start_token, self.generation)
+
+
+class QueryResultCache:
+    """
+    TTL cache of query pages bounded by the approximate size of the cached records in bytes, least recently
+    used pages are evicted first. Expired pages are kept until evicted or replaced, see peek.
+
+    Entries are keyed on (table, index, hash key, query key) so a write to a table's hash key drops every
+    cached page of that partition. Index partitions can't be mapped back from a table key, so any write
+    to a table also drops its cached index queries. Keys are indexed by partition so a write only visits
+    the pages it drops.
+
+    A page loaded while a write raced it could be stored after the write dropped the partition, so every
+    entry carries the PARTITION_CACHE generation of its table read before loading it: get and put are handed
+    the current generation and discard entries loaded under an older one.
+    """
+
+    def __init__(self, max_bytes: int = DalConfig.query_cache_max_bytes, ttl: float = CONFIG.DATA_CACHE_TTL,
+                 timer: Callable[[], float] = time.monotonic) -> None:
+        """
+        :param max_bytes: int approximate memory budget, 0 disables the cache
+        :param ttl: float seconds a page stays fresh, 0 disables the cache
+        :param timer: callable returning the current time in seconds
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._timer = timer
+        self._lock = threading.RLock()
+        # (expires at, QueryCacheEntry) per key
+        self._cache = LRUCache(max(max_bytes, 1), getsizeof=self._get_entry_size)
+        self._partitions: Dict[Tuple, Set[Tuple]] = {}
+        self._indexed = 0
+
+    @property
+    def enabled(self) -> bool:
+        """
+        False when the cache is configured off
+        :return: bool
+        """
+        return self.max_bytes > 0 and self.ttl > 0
+
+    @property
+    def size(self) -> int:
+        """
+        Approximate bytes held by the cached entries
+        :return: int
+        """
+        with self._lock:
+            return self._cache.currsize
+
+    @staticmethod
+    def get_key(db_model: Type[PynamoModel], index_name: Optional[str], hash_key: Any,
+                query_key: Hashable) -> Tuple:
+        """
+        Builds the key of a cached query page
+        :param db_model: Type[PynamoModel]
+        :param index_name: str
+        :param hash_key: Any
+        :param query_key: Hashable normalized query arguments
+        :return: tuple
+        """
+        return get_cache_name(db_model), index_name, hash_key, query_key
+
+    def get(self, key: Tuple, generation: int = 0) -> Optional[QueryCacheEntry]:
+        """
+        Looks up a fresh query page
+        :param key: tuple from get_key
+        :param generation: int current PARTITION_CACHE generation of the table, older entries are dropped
+        :return: QueryCacheEntry or None
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            cached = self._cache.get(key)
+            entry = cached[1] if cached is not None else None
+            if entry is not None and (cached[0] <= self._timer() or entry.generation < generation):
+                self.stats.expirations += 1
+                entry = None
+            if entry is None:
+                self.stats.misses += 1
+            else:
+                self.stats.hits += 1
+            return entry
+
+    def put(self, key: Tuple, entry: QueryCacheEntry, generation: int = 0) -> None:
+        """
+        Caches a compact copy of a query page, pages larger than the whole budget or loaded under an older
+        generation than the current one are skipped
+        :param key: tuple from get_key
+        :param entry: QueryCacheEntry
+        :param generation: int current PARTITION_CACHE generation of the table
+        :return: None
+        """
+        if not self.enabled or entry.generation < generation:
+            return
+        entry = entry.compacted()
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            while self._cache.currsize + entry.size > self.max_bytes and self._cache:
+                self._cache.popitem()
+                self.stats.evictions += 1
+            self._cache[key] = (self._timer() + self.ttl, entry)
+            self._index(key)
+
+    def peek(self, key: Tuple) -> Optional[QueryCacheEntry]:
+        """
+        Looks up a query page however stale, ignoring its TTL and generation, the fallback of queries cut by
+        an open circuit breaker. Pages of written partitions are dropped and never returned
+        :param key: tuple from get_key
+        :return: QueryCacheEntry or None
+        """
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is None:
+                return None
+            self.stats.stale_hits += 1
+            return cached[1]
+
+    def invalidate(self, db_model: Type[PynamoModel], hash_key: Any) -> None:
+        """
+        Drops the cached pages of a table partition and every cached index query of the table
+        :param db_model: Type[PynamoModel]
+        :param hash_key: Any table hash key that was written
+        :return: None
+        """
+        table = get_cache_name(db_model)
+        with self._lock:
+            for partition in ((table, _INDEX_QUERIES), (table, hash_key)):
+                keys = self._partitions.pop(partition, ())
+                self._indexed -= len(keys)
+                for key in keys:
+                    self._cache.pop(key, None)
+
+    def clear(self) -> None:
+        """
+        Drops every entry
+        :return: None
+        """
+        with self._lock:
+            self._cache.clear()
+            self._partitions.clear()
+            self._indexed = 0
+
+    def _index(self, key: Tuple) -> None:
+        """
+        Adds a cached key to its partition. Expired and evicted keys are left behind, the index is rebuilt
+        from the cached keys once it holds twice as many
+        """
+        keys = self._partitions.setdefault(self._get_partition(key), set())
+        if key not in keys:
+            keys.add(key)
+            self._indexed += 1
+        if self._indexed > 2 * len(self._cache) + 16:
+            self._partitions.clear()
+            for cached in self._cache.keys():
+                self._partitions.setdefault(self._get_partition(cached), set()).add(cached)
+            self._indexed = len(self._cache)
+
+    @staticmethod
+    def _get_partition(key: Tuple) -> Tuple:
+        return (key[0], _INDEX_QUERIES) if key[1] is not None else (key[0], key[2])
+
+    @staticmethod
+    def _get_entry_size(cached: Tuple[float, QueryCacheEntry]) -> int:
+        return cached[1].size
+
+
+QUERY_CACHE = QueryResultCache()
+LogLambdaMetrics.register_gauge('cache.queries.bytes', lambda: QUERY_CACHE.size)
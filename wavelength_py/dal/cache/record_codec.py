@@ -0,0 +1,180 @@
+"""
+Compact, immutable encoding of pynamo records for the in-memory caches
+"""
+import json
+import sys
+import zlib
+from typing import Any, Dict, Type
+
+from pynamodb.models import Model as PynamoModel
+
+from wavelength_py.dal.dal_config import DalConfig
+
+
+def get_deep_size(value: Any) -> int:
+    """
+    Approximate number of bytes held by a value and the containers nested in it
+    :param value: Any
+    :return: int
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(get_deep_size(key) + get_deep_size(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(get_deep_size(item) for item in value)
+    return size
+
+
+def get_encoded_size(value: Any) -> int:
+    """
+    Approximate length of the JSON encoding of a raw attribute map, without encoding it
+    :param value: Any
+    :return: int
+    """
+    if isinstance(value, str):
+        return len(value) + 2
+    if isinstance(value, dict):
+        return max(2, 1 + sum(get_encoded_size(key) + get_encoded_size(item) + 2 for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return max(2, 1 + sum(get_encoded_size(item) + 1 for item in value))
+    return len(str(value))
+
+
+def serialize_record(record: PynamoModel) -> Dict[str, Any]:
+    """
+    Raw DynamoDB attribute map of a record
+    :param record: PynamoModel
+    :return: dict
+    """
+    return getattr(record, '_serialize')(attr_map=True, null_check=False)['attributes']
+
+
+def deserialize_record(db_model: Type[PynamoModel], raw: Dict[str, Any]) -> PynamoModel:
+    """
+    Rebuilds a record from its raw attribute map, unlike Model.from_raw_data this never describes the table
+    :param db_model: Type[PynamoModel]
+    :param raw: dict
+    :return: PynamoModel
+    """
+    attributes = db_model.get_attributes()
+    values = {}
+    for name, value in raw.items():
+        attr_name = getattr(db_model, '_dynamo_to_python_attr')(name)
+        attribute = attributes.get(attr_name)
+        if attribute is not None:
+            values[attr_name] = attribute.deserialize(attribute.get_value(value))
+    return db_model(**values)
+
+
+class FrozenMap(tuple):
+    """
+    Read only stand-in for a dict nested in a cached attribute value, a tuple of (key, value) pairs
+    """
+
+    __slots__ = ()
+
+
+def freeze(value: Any) -> Any:
+    """
+    Deep copy of a raw attribute value with its dicts and lists turned into FrozenMap and tuples
+    :param value: Any
+    :return: Any
+    """
+    if isinstance(value, dict):
+        return FrozenMap((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def thaw(value: Any) -> Any:
+    """
+    Reverses freeze into fresh dicts and lists
+    :param value: Any
+    :return: Any
+    """
+    if isinstance(value, FrozenMap):
+        return {key: thaw(item) for key, item in value}
+    if isinstance(value, tuple):
+        return [thaw(item) for item in value]
+    return value
+
+
+def dumps(value: Any) -> bytes:
+    """
+    Compact JSON encoding of a cached value
+    :param value: Any
+    :return: bytes
+    """
+    return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+
+class CompactRecord:
+    """
+    A record reduced to its raw attributes: a tuple of (name, type, value) with interned attribute names and
+    frozen values, or zlib compressed JSON once its JSON encoding grows past the compression threshold. A new
+    record with fresh containers is built on every decode so cached copies are never shared with, or changed
+    by, callers
+    """
+
+    __slots__ = ('db_model', 'payload', 'compressed', 'size')
+
+    def __init__(self, record: PynamoModel, compress_threshold: int = DalConfig.cache_compress_threshold) -> None:
+        """
+        :param record: PynamoModel
+        :param compress_threshold: int JSON encoded bytes above which the attributes are compressed,
+        0 disables compression
+        """
+        raw = serialize_record(record)
+        self.db_model = type(record)
+        self.compressed = False
+        self.payload: Any = tuple((sys.intern(name), attr_type, freeze(value))
+                                  for name, attribute in raw.items() for attr_type, value in attribute.items())
+        self.size = get_deep_size(self.payload)
+        if 0 < compress_threshold < get_encoded_size(raw):
+            payload = zlib.compress(dumps(raw))
+            if sys.getsizeof(payload) < self.size:
+                self.payload, self.compressed, self.size = payload, True, sys.getsizeof(payload)
+
+    def decode(self) -> PynamoModel:
+        """
+        Rehydrates the record
+        :return: PynamoModel
+        """
+        if self.compressed:
+            raw = json.loads(zlib.decompress(self.payload).decode('utf-8'))
+        else:
+            raw = {name: {attr_type: thaw(value)} for name, attr_type, value in self.payload}
+        return deserialize_record(self.db_model, raw)
+
+
+def compact(value: Any, compress_threshold: int = DalConfig.cache_compress_threshold) -> Any:
+    """
+    Encodes pynamo records as CompactRecord, anything else is returned unchanged
+    :param value: Any
+    :param compress_threshold: int see CompactRecord
+    :return: CompactRecord or value
+    """
+    if isinstance(value, PynamoModel):
+        return CompactRecord(value, compress_threshold)
+    return value
+
+
+def expand(value: Any) -> Any:
+    """
+    Reverses compact
+    :param value: CompactRecord or any value
+    :return: Any
+    """
+    return value.decode() if isinstance(value, CompactRecord) else value
+
+
+def get_compact_size(value: Any) -> int:
+    """
+    Approximate bytes held by a value returned from compact, or a tuple of them
+    :param value: Any
+    :return: int
+    """
+    if isinstance(value, tuple):
+        return sys.getsizeof(value) + sum(get_compact_size(item) for item in value)
+    return value.size if isinstance(value, CompactRecord) else get_deep_size(value)
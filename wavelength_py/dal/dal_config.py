@@ -9,6 +9,43 @@ class DalConfig(BotoThrottleConfig):
     DAL configuration settings
     """
     results_default_limit: int = 10
+    batch_get_page_limit: int = 100
+    batch_write_page_limit: int = 25
+    batch_write_max_workers: int = 1
+    unit_of_work_max_workers: int = 4
+    scan_total_segments: int = 4
+    scan_max_workers: int = 8
+    scan_queue_size: int = 100
+    scan_queue_timeout: float = 0.1
+    # Item cache defaults, override per model through Meta.cache_*
+    cache_maxsize: int = 128
+    cache_policy: str = 'LRU'
+    cache_negative_ttl: float = 0
+    # Cached records larger than this many bytes are zlib compressed, 0 disables compression
+    cache_compress_threshold: int = 1024
+    # Container lifetime cache defaults, models opt in with Meta.container_cache_soft_ttl
+    container_cache_hard_ttl: float = 3600
+    container_cache_maxsize: int = 1024
+    # Partition cache defaults, models opt in with Meta.partition_cache_max_items
+    partition_cache_maxsize: int = 256
+    partition_cache_ttl: float = 300
+    # Key filter defaults, models opt in with Meta.key_filter_capacity
+    key_filter_error_rate: float = 0.01
+    key_filter_max_age: float = 3600
+    # Seconds a filter is trusted to answer 404 without a read, models opt in with Meta.key_filter_skip_reads
+    key_filter_skip_max_age: float = 60
+    key_filter_dir: str = '/tmp'
+    # Hedged read defaults, models opt in with Meta.hedge_reads
+    hedge_percentile: float = 95
+    hedge_initial_delay: float = 0.05  # seconds, until hedge_min_samples reads of the model were timed
+    hedge_min_samples: int = 20
+    hedge_window: int = 200
+    hedge_max_rate: float = 0.05  # share of the reads that may be hedged
+    hedge_max_workers: int = 16
+    # Query result cache budget in bytes, shared by every table
+    query_cache_max_bytes: int = 4 * 1024 * 1024
+    # Seconds to stop calling memcached after a client error
+    memcached_retry_interval: float = 30
     # Table States:
     table_state_new = 'NEW'
     table_state_modified = 'MOD'
@@ -1,41 +1,59 @@
 """
 Base update command and utils
 """
-from typing import Any
+from typing import Any, Callable, List
 
+from pynamodb.expressions.condition import Condition
+from pynamodb.expressions.operand import Path as PynamoAction
 from pynamodb.models import Model as PynamoModel
 
 from wavelength_py.dal.dal_config import DalConfig
 from wavelength_py.dal.dao.commands.post_filter_pynamo_command import PostFilteredPynamoCommand
+from wavelength_py.dal.dao.commands.pynamo_command import always_pass
+from wavelength_py.dal.dao.models.platform_persistence_model import PynamoPersistenceModel
 from wavelength_py.dal.pynamo_models.util import pynamo_write_handler
-from wavelength_py.errors.exceptions import Base404Exception
+from wavelength_py.errors.exceptions import Base404Exception, Base409Exception, wavelengthBaseException
 from wavelength_py.model.util import get_posix_timestamp
 
+CONDITIONAL_CHECK_FAILED = 'ConditionalCheckFailedException'
+
 
 class BaseUpdatePynamoCommand(PostFilteredPynamoCommand):
     """
     Base functionality for updating a pynamo record
     """
 
+    def __init__(self, parent_model: PynamoPersistenceModel, post_filter: Callable = always_pass,
+                 optimistic: bool = False):
+        """
+
+        :param parent_model: PynamoPersistenceModel (domain model object)
+        :param post_filter: callable->bool function to run retrieved items against
+        :param optimistic: bool if True skip the consistent read and condition the write on the model's version
+        """
+        super().__init__(parent_model, post_filter)
+        self.optimistic = optimistic
+
     def _execute(self) -> Any:
         """
         Run the command
         :return:Union[List[PynamoPersistenceModel],PynamoPersistenceModel]
         """
+        if self.optimistic:
+            return self._update_optimistic()
+
         result = super()._execute()
         if result is None:
             raise Base404Exception(
                 'Model does not exist', 'Unable to perform update on None')
         return self._update_record(result)
 
-    @pynamo_write_handler
-    def _update_record(self, record: PynamoModel):
+    def _build_update_actions(self, next_version: int) -> List[PynamoAction]:
         """
-        Updates the validated record based on the parent model's change set
-        :param record: PynamoModel
-        :return: None
+        Combines the parent model's change set with the default and system actions
+        :param next_version: int
+        :return: List[PynamoAction]
         """
-        next_version = record.version + 1
         model_actions = self._build_model_update_actions()
         default_actions = {
             'table_state': self._parent.db_model.table_state.set(DalConfig.table_state_modified),
@@ -44,11 +62,79 @@ class BaseUpdatePynamoCommand(PostFilteredPynamoCommand):
             'version': self._parent.db_model.version.set(next_version),
             'modified_at': self._parent.db_model.modified_at.set(get_posix_timestamp())
         }
-        actions = list({**default_actions, **model_actions, **system_actions}.values())  # allow overrides
+        return list({**default_actions, **model_actions, **system_actions}.values())  # allow overrides
+
+    @pynamo_write_handler
+    def _update_record(self, record: PynamoModel):
+        """
+        Updates the validated record based on the parent model's change set
+        :param record: PynamoModel
+        :return: None
+        """
+        next_version = record.version + 1
 
         record.update(
-            actions=actions,
+            actions=self._build_update_actions(next_version),
             condition=(self._parent.db_model.version == record.version)
         )
+        self._invalidate_queries()
         self._parent.override_protected_field('version', next_version)
         self._parent.flush_changes()
+
+    def _update_optimistic(self) -> None:
+        """
+        Single UpdateItem conditioned on the version the parent model holds, the parent is refreshed from
+        the ALL_NEW attributes returned by DynamoDB
+        :return: None
+        """
+        version = self._parent.version
+        record = self._parent.db_model(*self._parent.get_key())
+        self._update_conditionally(record, self._build_update_actions(version + 1),
+                                   self._build_live_item_condition() & (self._parent.db_model.version == version))
+        self._invalidate_queries()
+        self._parent.push(record.to_json())
+        self._parent.flush_changes()
+
+    def _build_live_item_condition(self) -> Condition:
+        """
+        Condition that only passes for an existing item that has not been soft deleted
+        :return: Condition
+        """
+        db_model = self._parent.db_model
+        hash_key = getattr(db_model, self._parent.db_hash_key)
+        return hash_key.exists() & (db_model.table_state != DalConfig.table_state_deleted)
+
+    def _update_conditionally(self, record: PynamoModel, actions: List[PynamoAction], condition: Condition) -> None:
+        """
+        Runs the update and maps a failed condition to the 404/409 the read-then-write flow would raise
+        :param record: PynamoModel
+        :param actions: List[PynamoAction]
+        :param condition: Condition
+        :return: None
+        """
+        try:
+            self._send_update(record, actions, condition)
+        except Base409Exception as err:
+            if err.reason != CONDITIONAL_CHECK_FAILED:
+                raise
+            raise self._resolve_condition_failure() from err
+
+    @staticmethod
+    @pynamo_write_handler
+    def _send_update(record: PynamoModel, actions: List[PynamoAction], condition: Condition) -> None:
+        record.update(actions=actions, condition=condition)
+
+    def _resolve_condition_failure(self) -> wavelengthBaseException:
+        """
+        Only reached when the conditional write failed, reads the item to tell a missing/deleted item (404)
+        from a version conflict (409)
+        :return: wavelengthBaseException
+        """
+        try:
+            current = super()._execute()
+        except Base404Exception as err:
+            return err
+        if current is None:
+            return Base404Exception('Model does not exist', 'Unable to perform update on None')
+        return Base409Exception('Model version conflict',
+                                reason='Try getting the latest model and re-apply updates')
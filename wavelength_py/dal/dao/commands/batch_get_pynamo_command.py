@@ -0,0 +1,154 @@
+"""
+Module to support loading many records by key with BatchGetItem
+"""
+import time
+from typing import Any, Dict, List, Tuple, Optional
+
+from wavelength_py.dal.dal_config import DalConfig
+from wavelength_py.dal.dao.commands.post_filter_pynamo_command import filter_deleted_items, PostFilteredPynamoCommand
+from wavelength_py.dal.dao.models.platform_persistence_model import PynamoPersistenceModel
+from wavelength_py.dal.dao.unit_of_work import get_unit_of_work, UnitOfWork
+from wavelength_py.dal.dynamodb.deadline import check_deadline
+from wavelength_py.dal.dynamodb.rate_limiter import RATE_LIMITER
+from wavelength_py.dal.dynamodb.util import chunk_list, get_backoff_delay
+from wavelength_py.dal.pynamo_models.util import pynamo_read_handler
+from wavelength_py.errors.exceptions import Base404Exception, Base429Exception
+
+
+class PynamoBatchGetCommand(PostFilteredPynamoCommand):
+    """
+    This class encapsulates loading many records in as few round trips as possible
+    """
+
+    def __init__(self, parent_model: PynamoPersistenceModel, **kwargs):
+        """
+
+        :param parent_model: PynamoPersistenceModel (domain model object)
+        :param post_filter: callable->bool function to run retrieved items against
+        :param consistent_read: bool
+        """
+        filter_function = kwargs.get('post_filter', filter_deleted_items)
+
+        super().__init__(parent_model, filter_function)
+        self.keys: Tuple = ()
+        self.consistent_read = kwargs.get('consistent_read', False)
+
+    def _execute(self) -> List[PynamoPersistenceModel]:
+        """
+        Run the command
+        :return: List[PynamoPersistenceModel] in the order the keys were given, missing or filtered items are omitted
+        """
+        keys, self.keys = self.keys, ()
+        unit_of_work = get_unit_of_work()
+        if unit_of_work is not None:
+            return self._read_in_unit_of_work(keys, unit_of_work)
+        return self._read(keys)
+
+    def _read(self, keys: Tuple) -> List[PynamoPersistenceModel]:
+        """
+        Reads the keys from the table
+        :param keys: Tuple of hash keys or (hash, range) pairs
+        :return: List[PynamoPersistenceModel]
+        :raise: DeadlineExceededException if the invocation is about to time out before every chunk was read
+        """
+        keys = [self._serialize_key(key) for key in keys]
+
+        found: Dict[Tuple, Any] = {}
+        for index, chunk in enumerate(chunk_list(list(dict.fromkeys(keys)), DalConfig.batch_get_page_limit)):
+            if index:
+                check_deadline('batch_get')
+            for raw_item in self._gather_chunk(chunk):
+                found[self._get_raw_key(raw_item)] = raw_item
+
+        result = []
+        for key in keys:
+            item = self._filter_raw(found.get(key))
+            if item is not None:
+                result.append(self._parent.build_trusted(item.to_json()))
+        return result
+
+    def _read_in_unit_of_work(self, keys: Tuple, unit_of_work: UnitOfWork) -> List[PynamoPersistenceModel]:
+        """
+        Only reads the keys missing from the unit of work's identity map and registers the models read
+        :param keys: Tuple of hash keys or (hash, range) pairs
+        :param unit_of_work: UnitOfWork
+        :return: List[PynamoPersistenceModel]
+        """
+        found: Dict[Tuple, Optional[PynamoPersistenceModel]] = {}
+        missing = []
+        for key in keys:
+            try:
+                model = unit_of_work.get(self._parent.db_model, key)
+            except Base404Exception:
+                found[self._get_identity(key)] = None  # deleted in this unit of work
+                continue
+            if model is None:
+                missing.append(key)
+            found[self._get_identity(key)] = model
+
+        for model in self._read(tuple(missing)) if missing else []:
+            found[tuple(model.get_key())] = unit_of_work.register(model)
+
+        return [model for model in (found.get(self._get_identity(key)) for key in keys) if model is not None]
+
+    @staticmethod
+    def _get_identity(key) -> Tuple:
+        return tuple(key) if isinstance(key, (list, tuple)) else (key,)
+
+    def _gather_chunk(self, keys: List[Tuple]) -> List[dict]:
+        """
+        Reads a single chunk, re-requesting any UnprocessedKeys with backoff
+        :param keys: List[Tuple] serialized keys
+        :return: List[dict] raw DynamoDB items
+        """
+        result: List[dict] = []
+        pending = [self._get_key_map(key) for key in keys]
+        attempt = 0
+        while pending:
+            page, pending = self._gather_page(pending)
+            result.extend(page or [])
+            if pending:
+                RATE_LIMITER.on_throttle(self._parent.db_model)
+                if attempt >= DalConfig.max_retries:
+                    raise Base429Exception('Batch read throttled',
+                                           reason=f'{len(pending)} keys were left unprocessed')
+                check_deadline('batch_get')
+                time.sleep(get_backoff_delay(attempt))
+                attempt += 1
+        return result
+
+    @pynamo_read_handler
+    def _gather_page(self, keys: List[dict]) -> Tuple[Optional[List[dict]], Optional[List[dict]]]:
+        """
+        Issues a single BatchGetItem request
+        :param keys: List[dict]
+        :return: tuple of items and unprocessed keys
+        """
+        batch_get_page = getattr(self._parent.db_model, '_batch_get_page')
+        return batch_get_page(keys, consistent_read=self.consistent_read, attributes_to_get=None)
+
+    def _filter_raw(self, raw_item: Optional[dict]):
+        if raw_item is None:
+            return None
+        item = self._parent.db_model.from_raw_data(raw_item)
+        try:
+            return self._filter(item)
+        except Base404Exception:
+            return None
+
+    def _get_key_map(self, key: Tuple) -> Dict[str, Any]:
+        return dict(zip(self._get_key_names(), key))
+
+    def _serialize_key(self, key) -> Tuple:
+        """
+        Accepts a hash key or a (hash, range) pair and serializes it the way DynamoDB returns it
+        :param key: Union[str, tuple, list]
+        :return: tuple
+        """
+        parts = key if isinstance(key, (list, tuple)) else (key,)
+        serialized = getattr(self._parent.db_model, '_serialize_keys')(*parts)
+        return tuple(part for part in serialized if part is not None)
+
+    def __call__(self, *keys) -> List[PynamoPersistenceModel]:
+        self.keys = keys
+        return self._execute()
@@ -0,0 +1,275 @@
+"""
+Module to support bulk create with BatchWriteItem and bulk soft delete with parallel conditional updates
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from pynamodb.constants import UNPROCESSED_ITEMS, PUT_REQUEST, ITEM
+
+from wavelength_py.dal.cache.key_filter import KEY_FILTERS
+from wavelength_py.dal.dal_config import DalConfig
+from wavelength_py.dal.dao.commands.blind_soft_delete_pynamo_command import PynamoBlindSoftDeleteCommand
+from wavelength_py.dal.dao.commands.pynamo_command import BasePynamoCommand
+from wavelength_py.dal.dao.models.platform_persistence_model import PynamoPersistenceModel
+from wavelength_py.dal.dynamodb.deadline import check_deadline
+from wavelength_py.dal.dynamodb.rate_limiter import OPERATION_WRITE, RATE_LIMITER
+from wavelength_py.dal.dynamodb.util import chunk_list, get_backoff_delay
+from wavelength_py.dal.pynamo_models.cachable_pynamo_model import CachingPynamoModel
+from wavelength_py.dal.pynamo_models.util import pynamo_write_handler
+from wavelength_py.errors.exceptions import wavelengthBaseException, Base422Exception, Base429Exception
+from wavelength_py.model.util import get_posix_timestamp
+
+
+class BatchWriteItemResult:
+    """
+    Outcome of writing a single model as part of a batch
+    """
+
+    def __init__(self, model: PynamoPersistenceModel, error: Optional[wavelengthBaseException] = None):
+        """
+        :param model: PynamoPersistenceModel
+        :param error: wavelengthBaseException if the write failed
+        """
+        self.model = model
+        self.error = error
+
+    @property
+    def succeeded(self) -> bool:
+        """
+        True if the item was written
+        :return: bool
+        """
+        return self.error is None
+
+
+class BatchWriteReport:
+    """
+    Per-item success/failure report for a batch write
+    """
+
+    def __init__(self):
+        self._items: List[BatchWriteItemResult] = []
+
+    def add(self, results: Iterable[BatchWriteItemResult]) -> None:
+        """
+        Appends item results to the report
+        :param results: Iterable[BatchWriteItemResult]
+        :return: None
+        """
+        self._items.extend(results)
+
+    @property
+    def items(self) -> List[BatchWriteItemResult]:
+        """
+        All item results
+        :return: List[BatchWriteItemResult]
+        """
+        return self._items
+
+    @property
+    def succeeded(self) -> List[BatchWriteItemResult]:
+        """
+        Item results that were written
+        :return: List[BatchWriteItemResult]
+        """
+        return [item for item in self._items if item.succeeded]
+
+    @property
+    def failed(self) -> List[BatchWriteItemResult]:
+        """
+        Item results that could not be written
+        :return: List[BatchWriteItemResult]
+        """
+        return [item for item in self._items if not item.succeeded]
+
+
+class PynamoBatchWriteCommand(BasePynamoCommand):
+    """
+    Writes many models to the parent model's table, new items 25 per BatchWriteItem request.
+    Written items of caching models are written through their caches like a single create.
+    BatchWriteItem cannot carry conditions, so soft deletes are sent as the conditional UpdateItem of
+    PynamoBlindSoftDeleteCommand, max_workers at a time
+    """
+
+    def __init__(self, parent_model: PynamoPersistenceModel, max_workers: int = DalConfig.batch_write_max_workers):
+        """
+        :param parent_model: PynamoPersistenceModel (domain model object)
+        :param max_workers: int number of batches to run in parallel
+        """
+        super().__init__(parent_model)
+        self.max_workers = max_workers
+        self.models: Iterable[PynamoPersistenceModel] = ()
+        self.soft_delete = False
+
+    def _execute(self) -> BatchWriteReport:
+        """
+        Signs, chunks and writes the models
+        :return: BatchWriteReport
+        """
+        report = BatchWriteReport()
+        if self.soft_delete:
+            self._soft_delete(self.models, report)
+            self.models = ()
+            return report
+
+        chunks = chunk_list(self._prepare(self.models, report), DalConfig.batch_write_page_limit)
+        self.models = ()
+
+        if self.max_workers <= 1:
+            for index, chunk in enumerate(chunks):
+                report.add(self._write_chunk(chunk, index > 0))
+        else:
+            self._write_parallel(chunks, report)
+
+        for item in report.succeeded:
+            KEY_FILTERS.add(item.model.db_model, item.model.get_key())
+            self._invalidate_queries(item.model)
+        return report
+
+    def _write_parallel(self, chunks: Iterator[List[Tuple[PynamoPersistenceModel, Dict[str, Any]]]],
+                        report: BatchWriteReport) -> None:
+        """
+        Writes up to max_workers chunks at a time
+        :param chunks: Iterator of chunks of (model, raw item)
+        :param report: BatchWriteReport
+        :return: None
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            pending: set = set()
+            for index, chunk in enumerate(chunks):
+                if len(pending) >= self.max_workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        report.add(future.result())
+                pending.add(pool.submit(self._write_chunk, chunk, index > 0))
+            for future in wait(pending).done:
+                report.add(future.result())
+
+    def _soft_delete(self, models: Iterable[PynamoPersistenceModel], report: BatchWriteReport) -> None:
+        """
+        Soft deletes every model with its own conditional update, up to max_workers at a time.
+        A missing or already deleted item is reported with a Base404Exception
+        :param models: Iterable[PynamoPersistenceModel]
+        :param report: BatchWriteReport
+        :return: None
+        """
+        max_workers = max(1, self.max_workers)
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            pending: set = set()
+            for index, model in enumerate(models):
+                if len(pending) >= max_workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    report.add(future.result() for future in done)
+                pending.add(pool.submit(self._soft_delete_model, model, index > 0))
+            report.add(future.result() for future in wait(pending).done)
+
+    @staticmethod
+    def _soft_delete_model(model: PynamoPersistenceModel, continued: bool) -> BatchWriteItemResult:
+        with RATE_LIMITER.bulk():
+            try:
+                if continued:
+                    check_deadline('batch_write')
+                PynamoBlindSoftDeleteCommand(model)()
+            except wavelengthBaseException as err:
+                return BatchWriteItemResult(model, err)
+        return BatchWriteItemResult(model)
+
+    def _prepare(self, models: Iterable[PynamoPersistenceModel],
+                 report: BatchWriteReport) -> Iterator[Tuple[PynamoPersistenceModel, Dict[str, Any]]]:
+        """
+        Signs each model and serializes it to a raw put item, unserializable models are reported as failures
+        :param models: Iterable[PynamoPersistenceModel]
+        :param report: BatchWriteReport
+        :return: Iterator of (model, raw item)
+        """
+        for model in models:
+            try:
+                yield model, self._serialize_model(self._sign_model(model))
+            except ValueError as verr:
+                report.add([BatchWriteItemResult(model, Base422Exception('Model creation failed', reason=str(verr)))])
+
+    @staticmethod
+    def _sign_model(model: PynamoPersistenceModel) -> PynamoPersistenceModel:
+        """
+        Sets the system fields the same way the single item create command does
+        :param model: PynamoPersistenceModel
+        :return: PynamoPersistenceModel
+        """
+        now = get_posix_timestamp()
+        model.override_protected_field('created_at', now)
+        model.override_protected_field('modified_at', now)
+        return model
+
+    @classmethod
+    def _serialize_model(cls, model: PynamoPersistenceModel) -> Dict[str, Any]:
+        record = model.db_model(*model.get_key(), **model.get_creation_actions())
+        return getattr(record, '_serialize')(attr_map=True)['attributes']
+
+    def _write_chunk(self, chunk: List[Tuple[PynamoPersistenceModel, Dict[str, Any]]],
+                     continued: bool = False) -> List[BatchWriteItemResult]:
+        """
+        Writes a chunk as bulk traffic, re-sending unprocessed items with jittered backoff.
+        Items left once the invocation is about to time out are reported with a DeadlineExceededException
+        :param chunk: list of (model, raw item)
+        :param continued: bool the chunk is not the first one of the batch
+        :return: List[BatchWriteItemResult]
+        """
+        with RATE_LIMITER.bulk():
+            return self._write_items(chunk, continued)
+
+    def _write_items(self, chunk: List[Tuple[PynamoPersistenceModel, Dict[str, Any]]],
+                     continued: bool) -> List[BatchWriteItemResult]:
+        pending: Dict[Tuple, List[Tuple[PynamoPersistenceModel, Dict[str, Any]]]] = {}
+        for model, item in chunk:
+            pending.setdefault(self._get_raw_key(item), []).append((model, item))
+
+        results: List[BatchWriteItemResult] = []
+        attempt = 0
+        try:
+            while pending:
+                if continued or attempt:
+                    check_deadline('batch_write')
+                unprocessed = {self._get_raw_key(request[PUT_REQUEST][ITEM])
+                               for request in self._write_page([entries[-1][1] for entries in pending.values()])}
+                for key in [key for key in pending if key not in unprocessed]:
+                    entries = pending.pop(key)
+                    self._write_through(entries[-1][1])
+                    results.extend(BatchWriteItemResult(model) for model, _ in entries)
+                if pending:
+                    RATE_LIMITER.on_throttle(self._parent.db_model, operation=OPERATION_WRITE)
+                    if attempt >= DalConfig.max_retries:
+                        raise Base429Exception('Batch write throttled',
+                                               reason=f'{len(pending)} items were left unprocessed')
+                    time.sleep(get_backoff_delay(attempt, maximum=DalConfig.max_write_backoff, jitter=True))
+                    attempt += 1
+        except wavelengthBaseException as err:
+            for entries in pending.values():
+                results.extend(BatchWriteItemResult(model, err) for model, _ in entries)
+        return results
+
+    def _write_through(self, item: Dict[str, Any]) -> None:
+        """
+        Replaces the cached copies of a written item, including a cached miss of its key
+        :param item: dict raw put item
+        :return: None
+        """
+        db_model = self._parent.db_model
+        if isinstance(db_model, type) and issubclass(db_model, CachingPynamoModel):
+            db_model.write_through(item)
+
+    @pynamo_write_handler
+    def _write_page(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Issues a single BatchWriteItem request
+        :param items: List[dict] raw put items
+        :return: List[dict] unprocessed requests
+        """
+        db_model = self._parent.db_model
+        data = getattr(db_model, '_get_connection')().batch_write_item(put_items=items)
+        return (data or {}).get(UNPROCESSED_ITEMS, {}).get(db_model.Meta.table_name, [])
+
+    def __call__(self, models: Iterable[PynamoPersistenceModel], soft_delete: bool = False) -> BatchWriteReport:
+        self.models = models
+        self.soft_delete = soft_delete
+        return self._execute()
@@ -0,0 +1,45 @@
+"""
+Module supporting soft delete without a pre-read with a DynamoDB backend
+"""
+from wavelength_py.dal.dal_config import DalConfig
+from wavelength_py.dal.dao.commands.base_update_pynamo_command import BaseUpdatePynamoCommand, CONDITIONAL_CHECK_FAILED
+from wavelength_py.dal.dao.commands.post_filter_pynamo_command import filter_deleted_items
+from wavelength_py.dal.dao.models.platform_persistence_model import PynamoPersistenceModel
+from wavelength_py.errors.exceptions import Base404Exception, Base409Exception
+from wavelength_py.model.util import get_posix_timestamp
+
+
+class PynamoBlindSoftDeleteCommand(BaseUpdatePynamoCommand):
+    """
+    Class to encapsulate performing a soft delete as a single conditional UpdateItem
+    """
+
+    def __init__(self, parent_model: PynamoPersistenceModel):
+        super().__init__(parent_model, filter_deleted_items)
+
+    def _execute(self):
+        """
+        Marks the item deleted and bumps its version server side, a missing or already deleted item
+        fails the condition and is reported as a 404
+        :return: None
+        """
+        db_model = self._parent.db_model
+        record = db_model(*self._parent.get_key())
+        actions = [
+            db_model.table_state.set(DalConfig.table_state_deleted),
+            db_model.version.set(db_model.version + 1),
+            db_model.modified_at.set(get_posix_timestamp())
+        ]
+        try:
+            self._send_update(record, actions, self._build_live_item_condition())
+        except Base409Exception as err:
+            if err.reason != CONDITIONAL_CHECK_FAILED:
+                raise
+            raise Base404Exception('Model does not exist', object_id=self._parent.get_key()) from err
+        self._invalidate_queries()
+
+        self._parent.push(record.to_json())
+        self._parent.flush_changes()
+
+    def __call__(self):
+        return self._execute()
@@ -1,7 +1,9 @@
 """
 Module for supporting a hard delete on a pynamo item
 """
+from wavelength_py.dal.cache.key_filter import KEY_FILTERS
 from wavelength_py.dal.dao.commands.pynamo_command import BasePynamoCommand
+from wavelength_py.dal.dao.unit_of_work import defer_write, WRITE_CREATE
 from wavelength_py.dal.pynamo_models.util import pynamo_write_handler
 from wavelength_py.errors.exceptions import Base422Exception
 from wavelength_py.model.util import get_posix_timestamp
@@ -36,9 +38,13 @@ class PynamoCreateCommand(BasePynamoCommand):
                                            **self._parent.get_creation_actions())
             # TODO consider supporting conditions
             record.save()
+            KEY_FILTERS.add(self._parent.db_model, self._parent.get_key())
+            self._invalidate_queries()
             return record
         except ValueError as verr:
             raise Base422Exception('Model creation failed', reason=str(verr))
 
     def __call__(self):
+        if defer_write(WRITE_CREATE, self, self._parent):
+            return self._parent
         return self._execute()
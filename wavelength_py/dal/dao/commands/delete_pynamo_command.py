@@ -17,7 +17,9 @@ class PynamoDeleteCommand(PostFilteredPynamoCommand):
         :return:Union[List[PynamoPersistenceModel],PynamoPersistenceModel]
         """
         result = super()._execute()
-        return result.delete()
+        response = result.delete()
+        self._invalidate_queries()
+        return response
 
     def __call__(self):
         return self._execute()
@@ -1,10 +1,22 @@
 """
 Module to support loading a single record by key
 """
-from typing import Any
+from functools import partial
+from typing import Any, List, Optional
 
+from pynamodb.models import Model as PynamoModel
+
+from wavelength_py.dal.cache.key_filter import KEY_FILTERS
+from wavelength_py.dal.cache.model_cache import get_cache_name, get_record_version
+from wavelength_py.dal.cache.partition_cache import PARTITION_CACHE
 from wavelength_py.dal.dao.commands.post_filter_pynamo_command import filter_deleted_items, PostFilteredPynamoCommand
 from wavelength_py.dal.dao.models.platform_persistence_model import PynamoPersistenceModel
+from wavelength_py.dal.dao.hedge import GET_HEDGES
+from wavelength_py.dal.dao.singleflight import GET_FLIGHTS
+from wavelength_py.dal.dao.unit_of_work import get_unit_of_work
+from wavelength_py.dal.pynamo_models.cachable_pynamo_model import CachingPynamoModel
+from wavelength_py.errors.exceptions import Base404Exception, CircuitOpenException
+from wavelength_py.logging.log_lambda_metrics import LogLambdaMetrics
 
 
 class PynamoGetByIdCommand(PostFilteredPynamoCommand):
@@ -17,25 +29,98 @@ class PynamoGetByIdCommand(PostFilteredPynamoCommand):
 
         :param parent_model: PynamoPersistenceModel (domain model object)
         :param post_filter: callable->bool function to run retrieved items against
+        :param projection: List[str] domain field names to fetch, all fields when None
         """
         filter_function = kwargs.get('post_filter', filter_deleted_items)
 
         super().__init__(parent_model, filter_function)
         self.keys = None
+        self.projection: List[str] = kwargs.get('projection')
+        self._call_projection: List[str] = None
+        self._call_min_version: int = None
 
     def _execute(self) -> Any:
         """
         Run the command
         :return:Union[List[PynamoPersistenceModel],PynamoPersistenceModel]
         """
-        result = super()._execute()
+        projection = self._call_projection if self._call_projection is not None else self.projection
+        self._call_projection = None
+        min_version, self._call_min_version = self._call_min_version, None
+        key = self._get_key()
         self.keys = None
 
-        return self._parent.build(result.to_json())
+        if projection is None:
+            unit_of_work = get_unit_of_work()
+            if unit_of_work is None:
+                return self._read(key, min_version)
+            return unit_of_work.get(self._parent.db_model, key) or unit_of_work.register(self._read(key, min_version))
+
+        result = self._filter(self._gather_once(key, attributes_to_get=self._parent.get_projection(projection)))
+        return self._parent.build_trusted(result.to_json(), fields=self._parent.get_projected_fields(projection))
+
+    def _read(self, key, min_version: int = None) -> PynamoPersistenceModel:
+        result = self._filter(self._gather_once(key, min_version=min_version))
+        return self._parent.build_trusted(result.to_json())
+
+    def _gather_once(self, key, attributes_to_get: List[str] = None, min_version: int = None) -> PynamoModel:
+        """
+        Reads a record, concurrent identical reads share a single DynamoDB call and its outcome.
+        A read never joins a call started before a write to the same table through this container.
+        Keys the key filter of a model skipping reads has never seen are not read at all, slow reads of models
+        opting in are hedged. Caching models opting in with Meta.cache_reads are read through their caches.
+        While the table's circuit breaker is open the container cached copy is returned, however stale
+        :param key: hash key and optional range key
+        :param attributes_to_get: List[str]
+        :param min_version: int
+        :return: PynamoModel shared with the coalesced callers, only read from it
+        :raise: Base404Exception, CircuitOpenException when there is no cached copy to fall back to
+        """
+        db_model = self._parent.db_model
+        missing = KEY_FILTERS.is_missing(db_model, key)
+        if missing and KEY_FILTERS.skips_reads(db_model):
+            KEY_FILTERS.record_lookup(db_model, missing, found=False)
+            raise Base404Exception('Model does not exist', object_id=key)
+
+        flight_key = (db_model, PARTITION_CACHE.get_generation(db_model), tuple(key),
+                      tuple(attributes_to_get) if attributes_to_get is not None else None, min_version)
+        try:
+            read = partial(self._gather, key, attributes_to_get, min_version, cached=True)
+            result = GET_FLIGHTS.call(flight_key, partial(GET_HEDGES.call, db_model, read))
+        except Base404Exception:
+            KEY_FILTERS.record_lookup(db_model, missing, found=False)
+            raise
+        except CircuitOpenException:
+            stale = self._get_stale(key, min_version)
+            if stale is None:
+                raise
+            return stale
+        KEY_FILTERS.record_lookup(db_model, missing, found=True)
+        return result
+
+    def _get_stale(self, key, min_version: int = None) -> Optional[PynamoModel]:
+        db_model = self._parent.db_model
+        if not (isinstance(db_model, type) and issubclass(db_model, CachingPynamoModel)):
+            return None
+        stale = db_model.get_stale(*key)
+        if stale is None or (min_version is not None and (get_record_version(stale) or 0) < min_version):
+            return None
+        LogLambdaMetrics.counter(f'dal.circuit.stale.{get_cache_name(db_model)}', 1)
+        return stale
 
     def _get_key(self):
         return self.keys if self.keys else self._parent.get_key()
 
-    def __call__(self, *keys):
+    def __call__(self, *keys, projection: List[str] = None, min_version: int = None):
+        """
+        Reads a model by key
+        :param keys: hash key and optional range key, the parent model's keys when omitted
+        :param projection: List[str] domain field names to fetch
+        :param min_version: int version the caller last wrote, a cached copy at least this recent is
+        returned instead of a consistent read (read-your-writes)
+        :return: PynamoPersistenceModel
+        """
         self.keys = keys
+        self._call_projection = projection
+        self._call_min_version = min_version
         return self._execute()
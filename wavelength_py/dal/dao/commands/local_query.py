@@ -0,0 +1,114 @@
+"""
+In-memory evaluation of queries against a cached partition, mirrors the conditions BasePynamoCommand sends to DynamoDB
+"""
+import operator
+from typing import Any, Callable, List, Optional, Tuple, Type
+
+from pynamodb.models import Model as PynamoModel
+
+from wavelength_py.dal.dao.commands.pynamo_command import FilterModel, OPERATOR_LOOKUP
+from wavelength_py.errors.exceptions import Base422Exception
+
+
+def _compare(compare: Callable[[Any, Any], bool]) -> Callable[..., bool]:
+    def evaluate(value, *args) -> bool:
+        try:
+            return value is not None and bool(compare(value, args[0]))
+        except TypeError:
+            return False
+    return evaluate
+
+
+def _between(value, *args) -> bool:
+    try:
+        return value is not None and args[0] <= value <= args[1]
+    except TypeError:
+        return False
+
+
+def _contains(value, *args) -> bool:
+    try:
+        return value is not None and args[0] in value
+    except TypeError:
+        return False
+
+
+# Conditions on missing attributes are false, like in DynamoDB, except does_not_exist
+LOCAL_OPERATORS = {
+    '__eq__': _compare(operator.eq),
+    '__ne__': _compare(operator.ne),
+    '__lt__': _compare(operator.lt),
+    '__gt__': _compare(operator.gt),
+    '__le__': _compare(operator.le),
+    '__ge__': _compare(operator.ge),
+    'startswith': lambda value, *args: isinstance(value, (str, bytes)) and value.startswith(args[0]),
+    'between': _between,
+    'is_in': lambda value, *args: value is not None and value in args,
+    'contains': _contains,
+    'exists': lambda value, *args: value is not None,
+    'does_not_exist': lambda value, *args: value is None,
+}
+
+
+def build_local_filter(db_model: Type[PynamoModel],
+                       filters: List[FilterModel]) -> Optional[Callable[[PynamoModel], bool]]:
+    """
+    Compiles filters to a predicate over records, combined left to right like BasePynamoCommand._build_conditionals
+    :param db_model: Type[PynamoModel]
+    :param filters: List[FilterModel]
+    :return: callable, None if an operator can only be evaluated by DynamoDB
+    :raise: Base422Exception if the model has no such attribute
+    """
+    compiled = []
+    for filter_ in filters:
+        if getattr(db_model, filter_.model_attribute, None) is None:
+            raise Base422Exception(f'Model has no property named "{filter_.model_attribute}"')
+        evaluate = LOCAL_OPERATORS.get(OPERATOR_LOOKUP.get(filter_.operator, filter_.operator))
+        if evaluate is None:
+            return None
+        args = filter_.parameters if isinstance(filter_.parameters, list) else [filter_.parameters]
+        compiled.append((filter_.combinator == 'or', filter_.model_attribute, evaluate, args))
+
+    def predicate(record: PynamoModel) -> bool:
+        result = None
+        for is_or, name, evaluate, args in compiled:
+            matched = evaluate(getattr(record, name, None), *args)
+            if result is None:
+                result = matched
+            else:
+                result = (result or matched) if is_or else (result and matched)
+        return result is not False
+
+    return predicate
+
+
+# pylint: disable=too-many-arguments
+def query_partition(records: List[PynamoModel], range_key_name: Optional[str],
+                    key_filter: Callable[[PynamoModel], bool], item_filter: Callable[[PynamoModel], bool],
+                    scan_index_forward: bool, start_range_key: Any = None,
+                    limit: int = None) -> Tuple[List[PynamoModel], Optional[PynamoModel]]:
+    """
+    Runs a query page against a partition's records
+    :param records: List[PynamoModel] every item of the partition sorted by range key
+    :param range_key_name: str python name of the range key attribute, None for hash only tables
+    :param key_filter: predicate of the range key condition
+    :param item_filter: predicate of the filter expression
+    :param scan_index_forward: bool
+    :param start_range_key: Any range key of the previous page's last item, None for the first page
+    :param limit: int max items evaluated, counted before the filter expression like DynamoDB's Limit
+    :return: (matching records, the last evaluated record when more items match the range key condition,
+    else None)
+    """
+    ordered = records if scan_index_forward else list(reversed(records))
+    if start_range_key is not None:
+        if range_key_name is None:
+            return [], None
+        after = operator.gt if scan_index_forward else operator.lt
+        ordered = [record for record in ordered if after(getattr(record, range_key_name), start_range_key)]
+
+    candidates = [record for record in ordered if key_filter(record)]
+    last = None
+    if limit is not None and len(candidates) > limit:
+        candidates = candidates[:limit]
+        last = candidates[-1] if candidates else None
+    return [record for record in candidates if item_filter(record)], last
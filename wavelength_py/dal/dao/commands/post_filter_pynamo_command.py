@@ -1,14 +1,15 @@
 """
 Base pynamo command for gathering a single record and filtering it on the client side
 """
-from typing import Callable, Optional, List, Union
+from typing import Any, Callable, Dict, Optional, List, Union
 
 from pynamodb.exceptions import DoesNotExist
 from pynamodb.models import Model as PynamoModel
 
 from wavelength_py.dal.dal_config import DalConfig
-from wavelength_py.dal.dao.commands.pynamo_command import BasePynamoCommand, always_pass
+from wavelength_py.dal.dao.commands.pynamo_command import BasePynamoCommand, FilterModel, always_pass
 from wavelength_py.dal.dao.models.platform_persistence_model import PynamoPersistenceModel
+from wavelength_py.dal.pynamo_models.cachable_pynamo_model import CachingPynamoModel
 from wavelength_py.dal.pynamo_models.util import pynamo_read_handler
 from wavelength_py.errors.exceptions import Base404Exception
 
@@ -38,15 +39,26 @@ class PostFilteredPynamoCommand(BasePynamoCommand):
         return self._parent.get_key()
 
     @pynamo_read_handler
-    def _gather(self, key=None) -> Optional[PynamoModel]:
+    def _gather(self, key=None, attributes_to_get: List[str] = None, min_version: int = None,
+                cached: bool = False) -> Optional[PynamoModel]:
         """
         Pulls the most recent model from DB based on the parent model's keys
+        :param key: list
+        :param attributes_to_get: List[str] optional DynamoDB attribute names to project
+        :param min_version: int oldest acceptable version, lets caching models answer from the cache
+        instead of a consistent read
+        :param cached: bool lets caching models opting in with Meta.cache_reads answer from their caches
         :return: PynamoModel
         """
         try:
             if not key:
                 key = self._parent.get_key()
-            item = self._parent.db_model.get(*key, consistent_read=True)
+            db_model = self._parent.db_model
+            if isinstance(db_model, type) and issubclass(db_model, CachingPynamoModel) and (
+                    min_version is not None or (cached and db_model.caches_reads())):
+                return db_model.get(*key, consistent_read=False, attributes_to_get=attributes_to_get,
+                                    min_version=min_version)
+            item = db_model.get(*key, consistent_read=True, attributes_to_get=attributes_to_get)
             return item
         except DoesNotExist as err:
             raise Base404Exception('Model does not exist', object_id=key) from err
@@ -62,6 +74,28 @@ class PostFilteredPynamoCommand(BasePynamoCommand):
             return item
         return None
 
+    def _build_raw(self, raw_item: Dict[str, Any], post_filter: Callable = None,
+                   fields: List[str] = None) -> Optional[PynamoPersistenceModel]:
+        """
+        Deserializes a raw DynamoDB item and builds a domain model from it if it passes the post filter
+        :param raw_item: dict
+        :param post_filter: callable->bool, defaults to the command's post filter
+        :param fields: List[str] optional domain fields to hydrate
+        :return: PynamoPersistenceModel or None if the item was filtered out
+        """
+        item = self._parent.db_model.from_raw_data(raw_item)
+        try:
+            if not (post_filter or self._post_filter)(item):
+                return None
+        except Base404Exception:
+            return None
+
+        return self._parent.build_trusted(item.to_json(), fields=fields)
+
+
+# Shared default pre filter, filters are only read when building conditions
+LIVE_ITEM_FILTER = FilterModel('table_state', 'is_in', [DalConfig.table_state_new, DalConfig.table_state_modified])
+
 
 def filter_deleted_items(record) -> bool:
     """
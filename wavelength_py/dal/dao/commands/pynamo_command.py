@@ -2,13 +2,16 @@
 Module for abstracting commands on a pynamo item
 """
 from operator import and_, or_
-from typing import Any, List, Callable, Dict
+from typing import Any, List, Callable, Dict, Tuple
 
 import simplejson as json
 from pynamodb.expressions.condition import Comparison
 from pynamodb.expressions.operand import Path as PynamoAction
 from schematics.types import StringType, ListType, BaseType
 
+from wavelength_py.dal.cache.memcached_cache import MEMCACHED_CACHE
+from wavelength_py.dal.cache.partition_cache import PARTITION_CACHE
+from wavelength_py.dal.cache.query_cache import QUERY_CACHE
 from wavelength_py.dal.dao.models.platform_persistence_model import PynamoPersistenceModel
 from wavelength_py.errors.exceptions import Base422Exception
 from wavelength_py.model.model_base import BaseModel
@@ -112,6 +115,37 @@ class BasePynamoCommand:
             result.update({key: prop.set(val)})
         return result
 
+    def _invalidate_queries(self, model: PynamoPersistenceModel = None) -> None:
+        """
+        Drops the cached query pages and the cached partition of a written model, locally and in memcached
+        :param model: PynamoPersistenceModel defaults to the parent model
+        :return: None
+        """
+        model = model or self._parent
+        hash_key = model.get_key()[0]
+        PARTITION_CACHE.invalidate(model.db_model, hash_key)
+        QUERY_CACHE.invalidate(model.db_model, hash_key)
+        MEMCACHED_CACHE.invalidate_partition(model.db_model, hash_key)
+
+    def _get_key_names(self) -> List[str]:
+        """
+        DynamoDB attribute names of the parent table's keys
+        :return: List[str]
+        """
+        attributes = self._parent.db_model.get_attributes()
+        result = [attributes[self._parent.db_hash_key].attr_name]
+        if self._parent.db_range_key:
+            result.append(attributes[self._parent.db_range_key].attr_name)
+        return result
+
+    def _get_raw_key(self, raw_item: Dict[str, Dict[str, Any]]) -> Tuple:
+        """
+        Plucks the serialized key values out of a raw DynamoDB item
+        :param raw_item: dict
+        :return: tuple
+        """
+        return tuple(next(iter(raw_item[name].values())) for name in self._get_key_names())
+
     def _build_conditionals(self, filters: List[FilterModel]) -> Comparison:
         """
         Parses a generic DSL (key, operator, args) and converts it to pynamodb Conditions(conditional)
@@ -1,14 +1,15 @@
 """
 Query args for gathering a single record and filtering it on the client side
 """
-from typing import List, Any, Callable
+import json
+from typing import List, Any, Callable, Optional, Tuple
 
 from wavelength_py.dal.dao.commands.post_filter_pynamo_command import filter_deleted_items
 from wavelength_py.dal.dao.commands.pynamo_command import FilterModel
 from wavelength_py.dal.dynamodb.util import decode_start_token
 
 
-class PynamoQueryArguments:
+class PynamoQueryArguments:  # pylint: disable=too-many-instance-attributes
     """
     Class to represent *args and **kwargs for a query method
     """
@@ -23,6 +24,7 @@ class PynamoQueryArguments:
         :param limit: int
         :param start_token: str
         :param consistent_read: str
+        :param projection: List[str] domain field names to fetch, all fields when None
         """
         self.hash_key = hash_key
         self.index_name = kwargs.get('index_name')
@@ -35,6 +37,7 @@ class PynamoQueryArguments:
         self._consistent_read = kwargs.get('consistent_read', False)
         self._frozen = kwargs.get('frozen', False)
         self._post_filter: Callable = kwargs.get('post_filter', filter_deleted_items)
+        self.projection: Optional[List[str]] = kwargs.get('projection')
 
     @property
     def consistent_read(self) -> bool:
@@ -67,7 +70,24 @@ class PynamoQueryArguments:
         if not self._frozen and filters:
             self.filters.extend(filters)
 
-    def __hash__(self) -> Any:
-        filters = '::'.join([str(filter_) for filter_ in self.range_key_filter + self.filters])
+    def get_cache_key(self) -> Tuple:
+        """
+        Normalized, hashable form of everything that shapes the DynamoDB request, the post filter is left out
+        since it is applied to every read, cached or not
+        :return: tuple
+        """
+        range_key_filter = '::'.join([str(filter_) for filter_ in self.range_key_filter])
+        filters = '::'.join([str(filter_) for filter_ in self.filters])
+        start_token = json.dumps(self.start_token, sort_keys=True) if self.start_token else ''
+        projection = tuple(self.projection) if self.projection is not None else None
 
-        return hash((self.hash_key, self.start_token or '', self.limit, self.scan_index_forward, filters))
+        return (self.hash_key, self.index_name, range_key_filter, filters, self.scan_index_forward, self.limit,
+                start_token, projection)
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, PynamoQueryArguments):
+            return NotImplemented
+        return self.get_cache_key() == other.get_cache_key() and self._post_filter == other.post_filter
+
+    def __hash__(self) -> Any:
+        return hash(self.get_cache_key())
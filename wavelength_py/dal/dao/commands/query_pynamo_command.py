@@ -1,19 +1,62 @@
 """
 Module to support updating a single record
 """
-from typing import List, Callable, Optional, Iterator
+from functools import partial
+from typing import Any, Dict, List, Callable, Optional, Iterator, Sequence
 
-from cachetools import cached, TTLCache
+from pynamodb.constants import ITEMS, COUNT, CAMEL_COUNT, SCANNED_COUNT
 from pynamodb.models import Model as PynamoModel
 
-from wavelength_py.config import CONFIG
-from wavelength_py.dal.dal_config import DalConfig
-from wavelength_py.dal.dao.commands.post_filter_pynamo_command import PostFilteredPynamoCommand, filter_deleted_items
+from wavelength_py.dal.cache.memcached_cache import MEMCACHED_CACHE
+from wavelength_py.dal.cache.model_cache import get_cache_name
+from wavelength_py.dal.cache.partition_cache import PARTITION_CACHE
+from wavelength_py.dal.cache.query_cache import QUERY_CACHE, QueryCacheEntry
+from wavelength_py.dal.cache.record_codec import serialize_record
+from wavelength_py.dal.dao.commands.local_query import build_local_filter, query_partition
+from wavelength_py.dal.dao.commands.post_filter_pynamo_command import PostFilteredPynamoCommand, \
+    filter_deleted_items, LIVE_ITEM_FILTER
 from wavelength_py.dal.dao.commands.pynamo_command import FilterModel
 from wavelength_py.dal.dao.commands.pynamo_query_args import PynamoQueryArguments
 from wavelength_py.dal.dao.models.platform_persistence_model import PynamoPersistenceModel
-from wavelength_py.dal.dynamodb.util import decode_start_token
-from wavelength_py.dal.pynamo_models.util import pynamo_read_handler
+from wavelength_py.dal.dao.hedge import QUERY_HEDGES
+from wavelength_py.dal.dao.singleflight import QUERY_FLIGHTS
+from wavelength_py.dal.dynamodb.deadline import can_continue, check_deadline
+from wavelength_py.dal.dynamodb.util import encode_start_token, validate_start_token
+from wavelength_py.dal.pynamo_models.cachable_pynamo_model import CachingPynamoModel
+from wavelength_py.dal.pynamo_models.util import pynamo_read_handler, fetch_page, get_query_pager, ResultPager
+from wavelength_py.errors.exceptions import CircuitOpenException
+from wavelength_py.logging.log_lambda_metrics import LogLambdaMetrics
+
+
+class LazyModelSequence(Sequence):  # pylint: disable=too-many-ancestors
+    """
+    Read-only sequence of domain models, each one is built from its db record on first access
+    """
+
+    def __init__(self, records: List[PynamoModel], parent_model: PynamoPersistenceModel,
+                 fields: List[str] = None) -> None:
+        """
+        :param records: List[PynamoModel]
+        :param parent_model: PynamoPersistenceModel
+        :param fields: List[str] optional domain fields to hydrate
+        """
+        self._records = records
+        self._parent = parent_model
+        self._fields = fields
+        self._models: List[Optional[PynamoPersistenceModel]] = [None] * len(records)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        model = self._models[index]
+        if model is None:
+            model = self._parent.build_trusted(self._records[index].to_json(), fields=self._fields)
+            self._models[index] = model
+        return model
+
+    def __len__(self) -> int:
+        return len(self._records)
 
 
 class PynamoQueryResult:
@@ -23,15 +66,18 @@ class PynamoQueryResult:
     """
 
     def __init__(self, query_result: List[Optional[PynamoModel]],
-                 parent_model: PynamoPersistenceModel, start_token: str = None) -> None:
+                 parent_model: PynamoPersistenceModel, start_token: str = None, fields: List[str] = None) -> None:
         """
-        Converts a result set from a pynamoDB query and converts it a collection of domain models
+        Wraps a result set from a pynamoDB query, domain models are only built when accessed
         :param query_result: List[PynamoModel]
         :param parent_model: PynamoPersistenceModel
+        :param fields: List[str] optional domain fields to hydrate
         """
         self._start_token = start_token
-
-        self._items = [parent_model.build(item.to_json()) for item in query_result]
+        self._parent = parent_model
+        self._fields = fields
+        self._records = [item for item in query_result if item is not None]
+        self._items = LazyModelSequence(self._records, parent_model, fields)
 
     @property
     def start_token(self) -> Optional[str]:
@@ -42,13 +88,132 @@ class PynamoQueryResult:
         return self._start_token
 
     @property
-    def items(self) -> List[PynamoPersistenceModel]:
+    def items(self) -> Sequence[PynamoPersistenceModel]:
         """
-        List of converted domain items
-        :return: List[PynamoPersistenceModel]
+        Lazily converted domain items
+        :return: Sequence[PynamoPersistenceModel]
         """
         return self._items
 
+    def to_json(self) -> List[Dict[str, Any]]:
+        """
+        Serializes the records straight to API JSON without building domain models
+        :return: List[dict]
+        """
+        return [self._parent.build_json(record.to_json(), self._fields) for record in self._records]
+
+
+class PynamoQueryStream:
+    """
+    Lazily yields domain models across query pages, holding a single raw page in memory at a time.
+    Like the caps, a Lambda invocation about to time out stops the stream early, resume with start_token
+    """
+
+    def __init__(self, pager: ResultPager, to_model: Callable[[Dict[str, Any]], Optional[PynamoPersistenceModel]],
+                 max_items: int = None, max_capacity: float = None) -> None:
+        """
+        :param pager: ResultPager
+        :param to_model: callable converting a raw item to a domain model (or None if filtered out)
+        :param max_items: int stop after yielding this many models
+        :param max_capacity: float stop fetching pages once this many read capacity units were consumed
+        """
+        self._pager = pager
+        self._to_model = to_model
+        self._max_items = max_items
+        self._max_capacity = max_capacity
+        self._raw_items: List[Dict[str, Any]] = []
+        self._index = 0
+        self._page_start_key = pager.last_evaluated_key
+        self._count = 0
+        self._pages = 0
+        self._consumed_capacity = 0.0
+
+    def __iter__(self) -> 'PynamoQueryStream':
+        return self
+
+    def __next__(self) -> PynamoPersistenceModel:
+        while self._max_items is None or self._count < self._max_items:
+            if self._index >= len(self._raw_items):
+                if not self._fetch():
+                    break
+                continue
+
+            raw_item = self._raw_items[self._index]
+            self._index += 1
+            model = self._to_model(raw_item)
+            if model is not None:
+                self._count += 1
+                return model
+
+        raise StopIteration
+
+    def _fetch(self) -> bool:
+        if self._pager.exhausted:
+            return False
+        if self._max_capacity is not None and self._consumed_capacity >= self._max_capacity:
+            return False
+        if self._pages and not can_continue('query_stream'):
+            return False
+
+        self._page_start_key = self._pager.last_evaluated_key
+        page = fetch_page(self._pager)
+        self._raw_items = page.get(ITEMS) or []
+        self._index = 0
+        self._consumed_capacity += ResultPager.get_consumed_capacity(page)
+        self._pages += 1
+        return True
+
+    @property
+    def start_token(self) -> Optional[str]:
+        """
+        Encoded token to resume from the current position, None once every page was read
+        :return: str
+        """
+        if self._index >= len(self._raw_items):
+            return encode_start_token(self._pager.last_evaluated_key)
+        if self._index == 0:
+            return encode_start_token(self._page_start_key)
+
+        raw_item = self._raw_items[self._index - 1]
+        return encode_start_token({name: raw_item[name] for name in self._pager.key_names})
+
+    @property
+    def count(self) -> int:
+        """
+        Number of models yielded so far
+        :return: int
+        """
+        return self._count
+
+    @property
+    def consumed_capacity(self) -> float:
+        """
+        Read capacity units consumed so far
+        :return: float
+        """
+        return self._consumed_capacity
+
+
+class PynamoQueryCount:
+    """
+    Totals of a count-only query across every page
+    """
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.scanned_count = 0
+        self.consumed_capacity = 0.0
+
+    def add(self, page: Dict[str, Any]) -> None:
+        """
+        Adds the totals of a raw Select=COUNT page
+        :param page: dict
+        :return: None
+        """
+        self.count += page.get(CAMEL_COUNT, 0)
+        self.scanned_count += page.get(SCANNED_COUNT, 0)
+        self.consumed_capacity += ResultPager.get_consumed_capacity(page)
+
 
 class PynamoQueryCommand(PostFilteredPynamoCommand):
     """
@@ -65,36 +230,199 @@ class PynamoQueryCommand(PostFilteredPynamoCommand):
         super().__init__(parent_model, post_filter)
         self._next_token = None
         # using `is not None` here so we can clear out the pre_filters with an empty list
-        self._pre_filters = pre_filters if pre_filters is not None else [
-            FilterModel('table_state', 'is_in', [DalConfig.table_state_new, DalConfig.table_state_modified])]
+        self._pre_filters = pre_filters if pre_filters is not None else [LIVE_ITEM_FILTER]
 
-    @cached(TTLCache(maxsize=32, ttl=CONFIG.DATA_CACHE_TTL))
     def __call__(self, query: PynamoQueryArguments) -> PynamoQueryResult:
         """
-        Builds the query object for subsequent execution and returns the result
+        Builds the query object for subsequent execution and returns the result.
+        Table queries of models caching whole partitions are evaluated against the cached partition,
+        other pages are served from QUERY_CACHE, then memcached, until a write to the partition invalidates them.
+        Consistent reads always go to the table. Concurrent identical queries share a single read.
+        Pages are cached and shared before the post filter, which is applied for every caller
         :param query: str
         :return: PynamoQueryCommand
         """
         query.append_filters(self._pre_filters)
-        return self._execute_query(query)
+        db_model = self._parent.db_model
+        flight_key = (db_model, PARTITION_CACHE.get_generation(db_model), query.consistent_read,
+                      query.get_cache_key())
+        entry = QUERY_FLIGHTS.call(flight_key, partial(self._read_page, query))
+
+        return PynamoQueryResult(self._post_filter_page(query, entry.records), self._parent, entry.start_token,
+                                 self._get_projected_fields(query))
+
+    def _read_page(self, query: PynamoQueryArguments) -> QueryCacheEntry:
+        """
+        Reads a page from the cached partition, the query caches or the table.
+        While the table's circuit breaker is open the cached partition or page is used, however stale
+        :param query: PynamoQueryArguments
+        :return: QueryCacheEntry shared with the coalesced callers, not post filtered
+        :raise: CircuitOpenException when there is no cached copy to fall back to
+        """
+        try:
+            if query.consistent_read:
+                return self._execute_query(query)
+            return self._query_partition(query) or self._get_cached_query(query)
+        except CircuitOpenException:
+            stale = self._get_stale(query)
+            if stale is None:
+                raise
+            return stale
+
+    def _get_stale(self, query: PynamoQueryArguments) -> Optional[QueryCacheEntry]:
+        db_model = self._parent.db_model
+        stale = self._query_partition(query, stale=True) or QUERY_CACHE.peek(
+            QUERY_CACHE.get_key(db_model, query.index_name, query.hash_key, query.get_cache_key()))
+        if stale is not None:
+            LogLambdaMetrics.counter(f'dal.circuit.stale.{get_cache_name(db_model)}', 1)
+        return stale
 
-    def _execute_query(self, query: PynamoQueryArguments) -> PynamoQueryResult:
+    def _query_partition(self, query: PynamoQueryArguments, stale: bool = False) -> Optional[QueryCacheEntry]:
+        """
+        Answers a table query from the cached partition of its hash key
+        :param query: PynamoQueryArguments
+        :param stale: bool only use a cached partition, however stale
+        :return: QueryCacheEntry, None when the query has to go to DynamoDB
         """
-        Execute command interface
-        :return: list[PynamoPersistenceModel]
+        db_model = self._parent.db_model
+        if query.index_name or not (isinstance(db_model, type) and issubclass(db_model, CachingPynamoModel)):
+            return None
+        key_filter = build_local_filter(db_model, query.range_key_filter)
+        item_filter = build_local_filter(db_model, query.filters)
+        if key_filter is None or item_filter is None:
+            return None
+        records = db_model.get_stale_partition(query.hash_key) if stale else db_model.get_partition(query.hash_key)
+        if records is None:
+            return None
+
+        range_key_name = self._parent.db_range_key
+        page, last = query_partition(records, range_key_name, key_filter, item_filter, query.scan_index_forward,
+                                     self._get_start_range_key(query), query.limit)
+        next_token = encode_start_token(self._get_record_start_key(last)) if last is not None else None
+        return QueryCacheEntry(page, next_token)
+
+    def _get_start_range_key(self, query: PynamoQueryArguments) -> Any:
+        token = query.start_token
+        if not token or not self._parent.db_range_key:
+            return None
+        attribute = self._parent.db_model.get_attributes()[self._parent.db_range_key]
+        validate_start_token(token, [attribute.attr_name])
+        return attribute.deserialize(attribute.get_value(token[attribute.attr_name]))
+
+    def _get_record_start_key(self, record: PynamoModel) -> Dict[str, Any]:
+        raw = serialize_record(record)
+        return {name: raw[name] for name in self._get_key_names()}
+
+    def _get_cached_query(self, query: PynamoQueryArguments) -> QueryCacheEntry:
+        """
+        Looks the page up in the local then the shared cache, runs the query on a miss
+        :param query: PynamoQueryArguments
+        :return: QueryCacheEntry
+        """
+        db_model = self._parent.db_model
+        query_key = query.get_cache_key()
+        key = QUERY_CACHE.get_key(db_model, query.index_name, query.hash_key, query_key)
+        local_generation = PARTITION_CACHE.get_generation(db_model)
+        entry = QUERY_CACHE.get(key, local_generation)
+        if entry is not None:
+            return entry
+
+        page, generation = MEMCACHED_CACHE.get_query(db_model, query.index_name, query.hash_key, query_key)
+        if page is not None:
+            entry = QueryCacheEntry(*page, generation=local_generation)
+        else:
+            entry = self._execute_query(query, local_generation)
+            MEMCACHED_CACHE.put_query(db_model, query.index_name, query.hash_key, query_key,
+                                      entry.records, entry.start_token, generation)
+        QUERY_CACHE.put(key, entry, PARTITION_CACHE.get_generation(db_model))
+        return entry
+
+    def stream(self, query: PynamoQueryArguments, max_items: int = None,
+               max_capacity: float = None) -> PynamoQueryStream:
+        """
+        Streams domain models across pages until the partition is exhausted or a cap is hit,
+        query.limit is used as the page size
+        :param query: PynamoQueryArguments
+        :param max_items: int
+        :param max_capacity: float read capacity units
+        :return: PynamoQueryStream
+        """
+        query.append_filters(self._pre_filters)
+        to_model = partial(self._build_raw, post_filter=query.post_filter, fields=self._get_projected_fields(query))
+        pager = self._get_query_pager(query, limit=query.limit, attributes_to_get=self._get_projection(query))
+        return PynamoQueryStream(pager, to_model, max_items, max_capacity)
+
+    def count(self, query: PynamoQueryArguments) -> PynamoQueryCount:
+        """
+        Counts the items matching the query with Select=COUNT, walking every page.
+        The pre filters are still sent as a FilterExpression, post filters and query.limit do not apply
+        since no item data is returned
+        :param query: PynamoQueryArguments
+        :return: PynamoQueryCount
+        :raise: DeadlineExceededException if the invocation is about to time out before the last page
+        """
+        query.append_filters(self._pre_filters)
+        pager = self._get_query_pager(query, select=COUNT)
+        result = PynamoQueryCount()
+        pages = 0
+        while not pager.exhausted:
+            if pages:
+                check_deadline('query_count')
+            result.add(fetch_page(pager))
+            pages += 1
+        return result
+
+    def _get_query_pager(self, query: PynamoQueryArguments, select: str = None, limit: int = None,
+                         attributes_to_get: List[str] = None) -> ResultPager:
+        return get_query_pager(self._parent.db_model, query.hash_key,
+                               select=select,
+                               index_name=query.index_name,
+                               range_key_condition=self._build_conditionals(query.range_key_filter),
+                               filter_condition=self._build_conditionals(query.filters),
+                               limit=limit,
+                               scan_index_forward=query.scan_index_forward,
+                               consistent_read=query.consistent_read,
+                               last_evaluated_key=query.start_token,
+                               attributes_to_get=attributes_to_get)
+
+    def _get_projection(self, query: PynamoQueryArguments) -> Optional[List[str]]:
+        if query.projection is None:
+            return None
+        return self._parent.get_projection(query.projection)
+
+    def _get_projected_fields(self, query: PynamoQueryArguments) -> Optional[List[str]]:
+        if query.projection is None:
+            return None
+        return self._parent.get_projected_fields(query.projection)
+
+    def _execute_query(self, query: PynamoQueryArguments, generation: int = 0) -> QueryCacheEntry:
+        """
+        Execute command interface, slow queries of models opting in are hedged
+        :param query: PynamoQueryArguments
+        :param generation: int PARTITION_CACHE generation of the table read before the query
+        :return: QueryCacheEntry the records and the next page's token
+        """
+        query_result = QUERY_HEDGES.call(self._parent.db_model, partial(self._gather_query, query))
+        self._next_token = query_result.last_evaluated_key
+        result = QueryCacheEntry([item for item in query_result.items if item], self._next_token, generation)
+        self._next_token = None
+        return result
+
+    def _post_filter_page(self, query: PynamoQueryArguments, items: List[PynamoModel]) -> List[PynamoModel]:
+        """
+        Applies the query's post filter, or the command's, to a page of records
+        :param query: PynamoQueryArguments
+        :param items: List[PynamoModel]
+        :return: List[PynamoModel]
         """
-        query_result = self._gather_query(query)
         post_filter: Callable = self._post_filter
 
         if query.post_filter:
             self._post_filter = query.post_filter
 
-        result = PynamoQueryResult([self._filter(item) for item in query_result.items if item], self._parent,
-                                   self._next_token)
-
+        records = [self._filter(item) for item in items if item]
         self._post_filter = post_filter
-        self._next_token = None
-        return result
+        return [record for record in records if record is not None]
 
     @pynamo_read_handler
     def _gather_query(self, query: PynamoQueryArguments) -> Iterator[PynamoModel]:
@@ -110,4 +438,5 @@ class PynamoQueryCommand(PostFilteredPynamoCommand):
                                            limit=query.limit,
                                            scan_index_forward=query.scan_index_forward,
                                            consistent_read=query.consistent_read,
-                                           last_evaluated_key=decode_start_token(query.start_token))
+                                           last_evaluated_key=query.start_token,
+                                           attributes_to_get=self._get_projection(query))
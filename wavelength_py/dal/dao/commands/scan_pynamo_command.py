@@ -0,0 +1,286 @@
+"""
+Module to support parallel, segmented table scans
+"""
+import queue
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from pynamodb.constants import ITEMS
+
+from wavelength_py.dal.dal_config import DalConfig
+from wavelength_py.dal.dao.commands.post_filter_pynamo_command import PostFilteredPynamoCommand, \
+    filter_deleted_items, LIVE_ITEM_FILTER
+from wavelength_py.dal.dao.commands.pynamo_command import FilterModel
+from wavelength_py.dal.dao.models.platform_persistence_model import PynamoPersistenceModel
+from wavelength_py.dal.dynamodb.deadline import can_continue
+from wavelength_py.dal.dynamodb.rate_limiter import RATE_LIMITER
+from wavelength_py.dal.dynamodb.util import encode_start_token, decode_start_token
+from wavelength_py.dal.pynamo_models.util import fetch_page, get_scan_pager, ResultPager
+from wavelength_py.errors.exceptions import Base422Exception
+
+SCAN_ITEM = 'item'
+SCAN_PAGE = 'page'
+SCAN_DONE = 'done'
+SCAN_ERROR = 'error'
+SCAN_EXPIRED = 'expired'
+
+
+class ScanWorkers:
+    """
+    Segment workers of a PynamoScanStream feeding its queue. They are kept apart from the stream so
+    a stream abandoned without close() can still be collected, which stops them
+    """
+
+    def __init__(self, command: 'PynamoScanCommand', queue_size: int) -> None:
+        """
+        :param command: PynamoScanCommand
+        :param queue_size: int max number of queued entries
+        """
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.stopped = threading.Event()
+        self._command = command
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def started(self) -> bool:
+        """
+        Checks whether the workers were started
+        :return: bool
+        """
+        return self._pool is not None
+
+    def start(self, pagers: Dict[int, ResultPager], max_workers: int) -> None:
+        """
+        Starts a worker per segment on a pool of max_workers threads
+        :param pagers: Dict[int, ResultPager] pager per segment
+        :param max_workers: int
+        :return: None
+        """
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        for segment, pager in pagers.items():
+            self._pool.submit(self._scan_segment, segment, pager)
+
+    def stop(self) -> None:
+        """
+        Stops the workers, a blocked worker gives up within DalConfig.scan_queue_timeout
+        :return: None
+        """
+        self.stopped.set()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+
+    def _scan_segment(self, segment: int, pager: ResultPager) -> None:
+        """
+        Worker body, pushes built models followed by a page marker for every page of the segment.
+        Pages are read as bulk traffic of the rate limiter
+        :param segment: int
+        :param pager: ResultPager
+        :return: None
+        """
+        try:
+            with RATE_LIMITER.bulk():
+                self._read_segment(segment, pager)
+        except Exception as err:  # pylint: disable=broad-except
+            self._put((segment, SCAN_ERROR, err))
+
+    def _read_segment(self, segment: int, pager: ResultPager) -> None:
+        while self._put_page(segment, pager, fetch_page(pager)):
+            if pager.exhausted:
+                self._put((segment, SCAN_DONE, None))
+                return
+            if not self._put((segment, SCAN_PAGE, pager.last_evaluated_key)):
+                return
+            if not can_continue('scan'):
+                self._put((segment, SCAN_EXPIRED, None))
+                return
+
+    def _put_page(self, segment: int, pager: ResultPager, page: Dict[str, Any]) -> bool:
+        """
+        Queues the models built from a page
+        :param segment: int
+        :param pager: ResultPager
+        :param page: dict raw page
+        :return: bool False if the stream was closed
+        """
+        for raw_item in page.get(ITEMS) or []:
+            model = self._command.to_model(raw_item)
+            if model is not None:
+                key = {name: raw_item[name] for name in pager.key_names}
+                if not self._put((segment, SCAN_ITEM, (model, key))):
+                    return False
+        return True
+
+    def _put(self, entry: Tuple[int, str, Any]) -> bool:
+        """
+        Blocks until the consumer makes room, gives up once the stream was closed
+        :param entry: tuple
+        :return: bool False if the stream was closed
+        """
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(entry, timeout=DalConfig.scan_queue_timeout)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+
+class PynamoScanStream:
+    """
+    Yields domain models from every segment of a parallel scan as they arrive.
+    Segment workers block on a bounded queue so a slow consumer throttles the scan.
+    The stream ends early when the Lambda invocation is about to time out, resume with start_tokens.
+    Use it as a context manager or close() it, a stream abandoned early stops its workers once collected
+    """
+
+    def __init__(self, command: 'PynamoScanCommand', pagers: Dict[int, ResultPager],
+                 max_workers: int, queue_size: int) -> None:
+        """
+        :param command: PynamoScanCommand
+        :param pagers: Dict[int, ResultPager] pager per segment
+        :param max_workers: int
+        :param queue_size: int max number of queued entries
+        """
+        self._pagers = pagers
+        self._max_workers = max(1, min(max_workers, len(pagers)))
+        self._workers = ScanWorkers(command, queue_size)
+        self._close = weakref.finalize(self, self._workers.stop)
+        self._tokens = {segment: pager.last_evaluated_key for segment, pager in pagers.items()}
+        self._count = 0
+
+    def __iter__(self) -> 'PynamoScanStream':
+        return self
+
+    def __next__(self) -> PynamoPersistenceModel:
+        if not self._workers.started:
+            self._workers.start(self._pagers, self._max_workers)
+
+        while self._tokens and not self._workers.stopped.is_set():
+            segment, kind, payload = self._workers.queue.get()
+            if kind == SCAN_ITEM:
+                model, self._tokens[segment] = payload
+                self._count += 1
+                return model
+            if kind == SCAN_PAGE:
+                self._tokens[segment] = payload
+            elif kind == SCAN_DONE:
+                del self._tokens[segment]
+            elif kind == SCAN_EXPIRED:
+                break
+            elif kind == SCAN_ERROR:
+                self.close()
+                raise payload
+
+        self.close()
+        raise StopIteration
+
+    def close(self) -> None:
+        """
+        Stops the segment workers, resume with start_tokens
+        :return: None
+        """
+        self._close()
+
+    def __enter__(self) -> 'PynamoScanStream':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    @property
+    def start_tokens(self) -> Dict[int, Optional[str]]:
+        """
+        Encoded resume token per unfinished segment, pass back to PynamoScanCommand to resume the scan.
+        Segments that have not started yet map to None
+        :return: Dict[int, str]
+        """
+        return {segment: encode_start_token(token) for segment, token in self._tokens.items()}
+
+    @property
+    def count(self) -> int:
+        """
+        Number of models yielded so far
+        :return: int
+        """
+        return self._count
+
+
+class PynamoScanCommand(PostFilteredPynamoCommand):
+    """
+    This class encapsulates a parallel scan of the parent model's table
+    """
+
+    def __init__(self, parent_model: PynamoPersistenceModel,
+                 pre_filters: List[FilterModel] = None,
+                 post_filter: Callable = filter_deleted_items,
+                 **kwargs):
+        """
+        :param parent_model: PynamoPersistenceModel
+        :param pre_filters: List[FilterModel]
+        :param post_filter: callable->bool function to run retrieved items against
+        :param total_segments: int
+        :param max_workers: int
+        :param queue_size: int
+        :param limit: int page size per segment request
+        :param consistent_read: bool
+        """
+        super().__init__(parent_model, post_filter)
+        # using `is not None` here so we can clear out the pre_filters with an empty list
+        self._pre_filters = pre_filters if pre_filters is not None else [LIVE_ITEM_FILTER]
+        self.total_segments = kwargs.get('total_segments', DalConfig.scan_total_segments)
+        self.max_workers = kwargs.get('max_workers', DalConfig.scan_max_workers)
+        self.queue_size = kwargs.get('queue_size', DalConfig.scan_queue_size)
+        self.limit = kwargs.get('limit')
+        self.consistent_read = kwargs.get('consistent_read', False)
+
+    def __call__(self, filters: List[FilterModel] = None,
+                 start_tokens: Dict[int, Optional[str]] = None) -> PynamoScanStream:
+        """
+        Starts a scan of every segment, or resumes the segments in start_tokens
+        :param filters: List[FilterModel] applied as a FilterExpression alongside the pre filters
+        :param start_tokens: Dict[int, str] as returned by PynamoScanStream.start_tokens
+        :return: PynamoScanStream
+        """
+        if start_tokens is None:
+            start_tokens = dict.fromkeys(range(self.total_segments))
+        start_tokens = self._validate_segments(start_tokens)
+
+        filter_condition = self._build_conditionals((filters or []) + self._pre_filters)
+        pagers = {segment: get_scan_pager(self._parent.db_model,
+                                          segment=segment,
+                                          total_segments=self.total_segments,
+                                          filter_condition=filter_condition,
+                                          limit=self.limit,
+                                          consistent_read=self.consistent_read,
+                                          last_evaluated_key=decode_start_token(token))
+                  for segment, token in start_tokens.items()}
+        return PynamoScanStream(self, pagers, self.max_workers, self.queue_size)
+
+    def _validate_segments(self, start_tokens: Dict[Any, Optional[str]]) -> Dict[int, Optional[str]]:
+        """
+        Segment numbers may come back as strings after a JSON round trip
+        :param start_tokens: dict
+        :return: Dict[int, str]
+        :raise: Base422Exception for unknown segments
+        """
+        result = {}
+        for segment, token in start_tokens.items():
+            try:
+                segment = int(segment)
+            except (TypeError, ValueError):
+                segment = -1
+            if not 0 <= segment < self.total_segments:
+                raise Base422Exception('Invalid startToken',
+                                       reason=f'segment is outside of {self.total_segments} total segments')
+            result[segment] = token
+        return result
+
+    def to_model(self, raw_item: Dict[str, Any]) -> Optional[PynamoPersistenceModel]:
+        """
+        Builds a domain model from a raw scanned item
+        :param raw_item: dict
+        :return: PynamoPersistenceModel or None if filtered out
+        """
+        return self._build_raw(raw_item)
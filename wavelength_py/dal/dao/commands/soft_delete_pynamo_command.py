@@ -9,6 +9,7 @@ from wavelength_py.dal.dal_config import DalConfig
 from wavelength_py.dal.dao.commands.base_update_pynamo_command import BaseUpdatePynamoCommand
 from wavelength_py.dal.dao.commands.post_filter_pynamo_command import filter_deleted_items
 from wavelength_py.dal.dao.models.platform_persistence_model import PynamoPersistenceModel
+from wavelength_py.dal.dao.unit_of_work import defer_write, WRITE_DELETE
 
 
 class PynamoSoftDeleteCommand(BaseUpdatePynamoCommand):
@@ -36,4 +37,6 @@ class PynamoSoftDeleteCommand(BaseUpdatePynamoCommand):
             }}
 
     def __call__(self):
+        if defer_write(WRITE_DELETE, self, self._parent):
+            return None
         return self._execute()
@@ -5,6 +5,7 @@ Module to support updating a single record
 from wavelength_py.dal.dao.commands.base_update_pynamo_command import BaseUpdatePynamoCommand
 from wavelength_py.dal.dao.commands.post_filter_pynamo_command import filter_deleted_items
 from wavelength_py.dal.dao.models.platform_persistence_model import PynamoPersistenceModel
+from wavelength_py.dal.dao.unit_of_work import defer_write, WRITE_UPDATE
 
 
 class PynamoUpdateCommand(BaseUpdatePynamoCommand):
@@ -12,8 +13,14 @@ class PynamoUpdateCommand(BaseUpdatePynamoCommand):
     This class encapsulates the updating of a versioned record
     """
 
-    def __init__(self, parent_model: PynamoPersistenceModel):
-        super().__init__(parent_model, filter_deleted_items)
+    def __init__(self, parent_model: PynamoPersistenceModel, optimistic: bool = False):
+        """
+        :param parent_model: PynamoPersistenceModel (domain model object)
+        :param optimistic: bool if True update in a single round trip conditioned on the model's version
+        """
+        super().__init__(parent_model, filter_deleted_items, optimistic=optimistic)
 
     def __call__(self):
+        if defer_write(WRITE_UPDATE, self, self._parent):
+            return None
         return self._execute()
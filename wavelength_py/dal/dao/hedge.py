@@ -0,0 +1,195 @@
+"""
+Hedged reads, a slow DynamoDB read is sent a second time and the first answer wins, to cut tail latency
+"""
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Optional
+
+from wavelength_py.dal.cache.model_cache import get_cache_name
+from wavelength_py.dal.dal_config import DalConfig
+from wavelength_py.dal.dynamodb.rate_limiter import RATE_LIMITER
+from wavelength_py.logging.log_lambda_metrics import LogLambdaMetrics
+
+_NOT_FIRED = object()
+
+
+class HedgedReads:
+    """
+    Hedges the reads of the models opting in through Meta:
+
+        class Meta:
+            table_name = 'devices'
+            hedge_reads = True
+
+    The primary read runs on the calling thread, so it never queues behind other callers and its observed
+    latency is DynamoDB's. A read that has not answered after the DalConfig.hedge_percentile latency observed
+    for its model (DalConfig.hedge_initial_delay until DalConfig.hedge_min_samples reads were timed) is sent
+    again from a pool thread. The caller gets the primary's answer, or the duplicate's when the primary fails,
+    the duplicate otherwise finishes in the background. Both calls share the model's connection pool, so the
+    duplicate travels on another pooled connection and keeps the caller's RATE_LIMITER.bulk() mark.
+
+    At most DalConfig.hedge_max_rate of the reads are hedged. Hedges are counted in dal.hedge.fired.<name>
+    and, when the duplicate answered for a failed primary, dal.hedge.won.<name>
+    """
+
+    def __init__(self, name: str, timer: Callable[[], float] = time.monotonic,
+                 executor: Optional[Executor] = None) -> None:
+        """
+        :param name: str kind of read, used in the metric names
+        :param timer: callable returning the current time in seconds
+        :param executor: Executor running the hedges, a pool of DalConfig.hedge_max_workers threads by default
+        """
+        self.name = name
+        self.calls = 0
+        self.fired = 0
+        self.won = 0
+        self._timer = timer
+        self._executor = executor
+        self._latencies: Dict[Any, Deque[float]] = {}
+        self._tokens = 1.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def is_enabled(db_model: Any) -> bool:
+        """
+        Checks whether a model's reads are hedged
+        :param db_model: Type[PynamoModel]
+        :return: bool
+        """
+        return getattr(getattr(db_model, 'Meta', None), 'hedge_reads', False) is True
+
+    def call(self, db_model: Any, func: Callable[[], Any]) -> Any:
+        """
+        Calls func on the calling thread, hedged when the model opted in
+        :param db_model: Type[PynamoModel]
+        :param func: callable without arguments, must be safe to call twice concurrently
+        :return: Any the primary call's result, the hedge's when the primary failed
+        :raise: whatever the primary call raised
+        """
+        if not self.is_enabled(db_model):
+            return func()
+
+        delay = self.get_delay(db_model)
+        with self._lock:
+            self.calls += 1
+            self._tokens = min(1.0, self._tokens + DalConfig.hedge_max_rate)
+        started = self._timer()
+        primary_done = threading.Event()
+        hedge = self._get_executor().submit(self._hedge, func, started + delay, primary_done,
+                                            RATE_LIMITER.is_bulk())
+        try:
+            result = func()
+        except Exception:  # pylint: disable=broad-except
+            primary_done.set()
+            self._record(db_model, self._timer() - started)
+            answer = self._get_answer(hedge)
+            if answer is _NOT_FIRED:
+                raise
+            with self._lock:
+                self.won += 1
+            LogLambdaMetrics.counter(f'dal.hedge.won.{self.name}', 1)
+            return answer
+        primary_done.set()
+        self._record(db_model, self._timer() - started)
+        return result
+
+    def get_delay(self, db_model: Any) -> float:
+        """
+        Seconds a read of the model is given before it is hedged
+        :param db_model: Type[PynamoModel]
+        :return: float
+        """
+        with self._lock:
+            latencies = sorted(self._latencies.get(db_model, ()))
+        if len(latencies) < DalConfig.hedge_min_samples:
+            return DalConfig.hedge_initial_delay
+        index = int(math.ceil(len(latencies) * DalConfig.hedge_percentile / 100.0)) - 1
+        return latencies[max(0, min(index, len(latencies) - 1))]
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Reads, hedges fired and won since the container started, and the current hedge delay per table
+        :return: dict
+        """
+        with self._lock:
+            db_models = list(self._latencies)
+            result = {'calls': self.calls, 'fired': self.fired, 'won': self.won}
+        result['delay_ms'] = {get_cache_name(db_model): int(self.get_delay(db_model) * 1000)
+                              for db_model in db_models}
+        return result
+
+    def reset(self) -> None:
+        """
+        Forgets the observed latencies and counts
+        :return: None
+        """
+        with self._lock:
+            self._latencies.clear()
+            self._tokens = 1.0
+            self.calls = self.fired = self.won = 0
+
+    def _hedge(self, func: Callable[[], Any], fire_at: float, primary_done: threading.Event, bulk: bool) -> Any:
+        """
+        Hedge body, calls func once fire_at passed unless the primary answered or the hedge rate is spent
+        :return: Any the hedge's result, _NOT_FIRED when it was not sent
+        """
+        if primary_done.wait(max(0.0, fire_at - self._timer())) or not self._acquire():
+            return _NOT_FIRED
+        LogLambdaMetrics.counter(f'dal.hedge.fired.{self.name}', 1)
+        return self._run(func, bulk)
+
+    @staticmethod
+    def _get_answer(hedge: Future) -> Any:
+        """
+        Waits for a hedge once the primary failed
+        :return: Any the hedge's result, _NOT_FIRED when it was not sent or failed as well
+        """
+        if hedge.cancel():
+            return _NOT_FIRED
+        try:
+            return hedge.result()
+        except Exception:  # pylint: disable=broad-except
+            return _NOT_FIRED
+
+    @staticmethod
+    def _run(func: Callable[[], Any], bulk: bool) -> Any:
+        """
+        Calls func on a worker thread, as bulk traffic when the calling thread was
+        """
+        if not bulk:
+            return func()
+        with RATE_LIMITER.bulk():
+            return func()
+
+    def _record(self, db_model: Any, latency: float) -> None:
+        with self._lock:
+            if db_model not in self._latencies:
+                self._latencies[db_model] = deque(maxlen=DalConfig.hedge_window)
+            self._latencies[db_model].append(latency)
+
+    def _acquire(self) -> bool:
+        """
+        Takes a hedge token, every read adds DalConfig.hedge_max_rate of one
+        :return: bool False when hedging would exceed DalConfig.hedge_max_rate
+        """
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            self.fired += 1
+            return True
+
+    def _get_executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=DalConfig.hedge_max_workers)
+            return self._executor
+
+
+GET_HEDGES = HedgedReads('get')
+QUERY_HEDGES = HedgedReads('query')
+LogLambdaMetrics.register_gauge('dal.hedge', lambda: {hedges.name: hedges.stats()
+                                                      for hedges in (GET_HEDGES, QUERY_HEDGES)})
@@ -2,15 +2,42 @@
 Observable Data Model
 """
 from copy import copy
-from typing import List, Any, Dict, Optional, Type
+from typing import Callable, Iterable, List, Any, Dict, Optional, Type
 
 from pynamodb.models import Model as PynamoModel
-from schematics.types import StringType, IntType
+from schematics.models import ModelDict
+from schematics.transforms import get_import_context
+from schematics.types import BaseType, BooleanType, DecimalType, NumberType, StringType, IntType
+from schematics.undefined import Undefined
 
 from wavelength_py.dal.dal_config import DalConfig
 from wavelength_py.dal.dao.models.observable_persistence_model import ObservablePersistenceModel
+from wavelength_py.errors.exceptions import Base422Exception
 from wavelength_py.model.model_base import BaseModel
 
+_TRUSTED_CONVERTERS: Dict[type, Dict[str, Optional[Callable]]] = {}
+_TRUSTED_IMPORT_CONTEXT = get_import_context(oo=True, partial=True)
+_UNRESOLVED = object()
+
+
+def _get_trusted_converter(field: BaseType) -> Optional[Callable]:
+    """
+    Scalar values read from the table are assigned as is, everything else is still converted without validation
+    :param field: BaseType
+    :return: callable or None for pass through fields
+    """
+    if isinstance(field, (StringType, NumberType, BooleanType)) and not isinstance(field, DecimalType):
+        return None
+
+    def convert(value):
+        if isinstance(value, dict):
+            value = BaseModel.convert_dict(value, BaseModel.to_snake_case)
+        elif isinstance(value, list):
+            value = BaseModel.convert_list(value, BaseModel.to_snake_case)
+        return field.convert(value, _TRUSTED_IMPORT_CONTEXT)
+
+    return convert
+
 
 class BasePersistenceModel(ObservablePersistenceModel):
     """
@@ -25,6 +52,7 @@ class BasePersistenceModel(ObservablePersistenceModel):
 
         super().__init__(source_model, protected_fields=protected_fields, **kwargs)
         self._column_mapping = column_mapping if column_mapping else {}
+        self._trusted_keys: Dict[str, Optional[str]] = {}
         self.system_fields = ['created_at', 'modified_at', 'version', 'table_state']
 
     def get_mapped_changes(self):
@@ -55,16 +83,89 @@ class BasePersistenceModel(ObservablePersistenceModel):
             return mapped_key
         return key
 
-    def build(self, source_model: Dict[str, Any]) -> 'BasePersistenceModel':
+    def build(self, source_model: Dict[str, Any], fields: List[str] = None) -> 'BasePersistenceModel':
         """
         Creates an instance of this model
         :param source_model:
+        :param fields: optional list of domain field names, only these are hydrated
         :return:
         """
+        source = self._resolve_mapped_changes(source_model)
+        if fields is not None:
+            source = self._project(source, fields)
+        result = copy(self)
+        result.from_json(source)
+        return result
+
+    def build_trusted(self, source_model: Dict[str, Any], fields: List[str] = None) -> 'BasePersistenceModel':
+        """
+        Creates an instance of this model from a record read from our own table. Skips from_json, case conversion
+        and validation: record keys are resolved to fields once and reused, scalar values are assigned directly
+        :param source_model: dict db record JSON
+        :param fields: optional list of domain field names, only these are hydrated
+        :return: BasePersistenceModel
+        """
+        converters = self._get_trusted_converters()
+        projected = None if fields is None else {self.to_snake_case(field) for field in fields}
+
+        data: Dict[str, Any] = {}
+        for name, field in self._fields.items():  # pylint: disable=no-member
+            default = field.default
+            data[name] = None if default is Undefined else default
+
+        for key, value in source_model.items():
+            name = self._trusted_keys.get(key, _UNRESOLVED)
+            if name is _UNRESOLVED:
+                name = self._trusted_keys.setdefault(key, self._resolve_trusted_key(key))
+            if name is None or (projected is not None and name not in projected):
+                continue
+            converter = converters[name]
+            data[name] = value if converter is None or value is None else converter(value)
+
         result = copy(self)
-        result.from_json(self._resolve_mapped_changes(source_model))
+        result._rebind(data)  # pylint: disable=protected-access
         return result
 
+    def _resolve_trusted_key(self, key: str) -> Optional[str]:
+        name = self.to_snake_case(self._resolve_mapped_key(key))
+        return name if name in self._fields else None  # pylint: disable=no-member
+
+    @classmethod
+    def _get_trusted_converters(cls) -> Dict[str, Optional[Callable]]:
+        converters = _TRUSTED_CONVERTERS.get(cls)
+        if converters is None:
+            converters = {name: _get_trusted_converter(field)
+                          for name, field in cls._fields.items()}  # pylint: disable=no-member
+            _TRUSTED_CONVERTERS[cls] = converters
+        return converters
+
+    def _rebind(self, data: Dict[str, Any]) -> None:
+        """
+        Gives a shallow copy its own field data and per instance state, subclasses holding
+        other per instance state should extend this
+        :param data: dict trusted field values
+        :return: None
+        """
+        self._data = ModelDict(valid=data)
+        self._changes = {}
+        self._protected_fields = list(self._protected_fields)
+
+    def build_json(self, source_model: Dict[str, Any], fields: List[str] = None) -> Dict[str, Any]:
+        """
+        Maps a db record's JSON straight to this model's camel-cased API JSON without building a model.
+        Skips copying and validation, fields missing from the record are omitted
+        :param source_model: dict
+        :param fields: optional list of domain field names to include
+        :return: dict
+        """
+        source = self._project(self._resolve_mapped_changes(source_model),
+                               self._fields if fields is None else fields)  # pylint: disable=no-member
+        return self.convert_dict(source, self.to_camel_case)
+
+    def _project(self, source: Dict[str, Any], fields: Iterable[str]) -> Dict[str, Any]:
+        projected = {self.to_snake_case(field) for field in fields}
+        return {key: value for key, value in source.items() if self.to_snake_case(key) in projected}
+
     def push(self, source_model: Dict[str, Any]) -> None:
         """
         In-place swap of attribute values based on source model
@@ -101,6 +202,40 @@ class PynamoPersistenceModel(BasePersistenceModel):
 
         return result
 
+    def get_projection(self, fields: List[str]) -> List[str]:
+        """
+        Translates domain field names through the column mapping into the DynamoDB attribute names to fetch.
+        Keys and system fields are always included
+        :param fields: List[str] domain field names
+        :return: List[str]
+        :raise: Base422Exception if a field does not map to a db attribute
+        """
+        attributes = self.db_model.get_attributes()
+        lookup: Dict[str, str] = {}
+        for prop in attributes:
+            for name in (prop, self.to_camel_case(prop)):
+                lookup[self.to_snake_case(self._resolve_mapped_key(name))] = prop
+            lookup.setdefault(prop, prop)
+
+        props = [prop for prop in [self.db_hash_key, self.db_range_key] + self.system_fields if prop in attributes]
+        for field in fields:
+            prop = lookup.get(self.to_snake_case(field))
+            if prop is None:
+                raise Base422Exception(f'Model has no property named "{field}"')
+            if prop not in props:
+                props.append(prop)
+
+        return [attributes[prop].attr_name for prop in props]
+
+    def get_projected_fields(self, fields: List[str]) -> List[str]:
+        """
+        Domain field names hydrated for a projection, includes the keys and system fields
+        :param fields: List[str]
+        :return: List[str]
+        """
+        keys = [self._resolve_mapped_key(key) for key in (self.db_hash_key, self.db_range_key) if key]
+        return keys + self.system_fields + list(fields)
+
     def get_creation_actions(self) -> Dict[str, Any]:
         """
         Builds a dict representing non-key attributes from the db_model
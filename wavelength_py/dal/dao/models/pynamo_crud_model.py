@@ -2,13 +2,16 @@
 Observable Data Model with CRUD OPs and DynamoDB back end
 """
 
-from typing import Type
+from typing import Any, Dict, Type
 
 from pynamodb.models import Model as PynamoModel
 
+from wavelength_py.dal.dao.commands.batch_get_pynamo_command import PynamoBatchGetCommand
+from wavelength_py.dal.dao.commands.batch_write_pynamo_command import PynamoBatchWriteCommand
 from wavelength_py.dal.dao.commands.create_pynamo_command import PynamoCreateCommand
 from wavelength_py.dal.dao.commands.get_by_key_pynamo_command import PynamoGetByIdCommand
 from wavelength_py.dal.dao.commands.query_pynamo_command import PynamoQueryCommand
+from wavelength_py.dal.dao.commands.scan_pynamo_command import PynamoScanCommand
 from wavelength_py.dal.dao.commands.soft_delete_pynamo_command import PynamoSoftDeleteCommand
 from wavelength_py.dal.dao.commands.update_pynamo_command import PynamoUpdateCommand
 from wavelength_py.dal.dao.models.platform_persistence_model import PynamoPersistenceModel
@@ -21,12 +24,21 @@ class PynamoCrudModel(PynamoPersistenceModel):
 
     def __init__(self, source_model: dict, db_model: Type[PynamoModel], **kwargs):
         super().__init__(source_model, db_model, **kwargs)
+        self._bind_commands()
 
+    def _rebind(self, data: Dict[str, Any]) -> None:
+        super()._rebind(data)
+        self._bind_commands()
+
+    def _bind_commands(self) -> None:
         self.query = PynamoQueryCommand(self)
         self.create = PynamoCreateCommand(self)
         self.read = PynamoGetByIdCommand(self)
+        self.read_many = PynamoBatchGetCommand(self)
         self.update = PynamoUpdateCommand(self)
         self.delete = PynamoSoftDeleteCommand(self)
+        self.write_many = PynamoBatchWriteCommand(self)
+        self.scan = PynamoScanCommand(self)
 
     def __repr__(self):
         return f'{type(self).__name__}({self.to_json()})'
@@ -0,0 +1,83 @@
+"""
+Coalescing of concurrent identical reads, so threads of a pool asking for the same thing share one DynamoDB call
+"""
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from wavelength_py.logging.log_lambda_metrics import LogLambdaMetrics
+
+
+class _Flight:
+    """
+    An in-flight call and, once done, its outcome
+    """
+
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Runs a function once per key among concurrent callers:
+
+        GET_FLIGHTS.call(key, load)   # the first caller runs load, callers arriving before it returns
+                                      # wait and get the same result, or the same exception
+
+    Nothing is cached, a caller arriving after the call returned starts a new one. Callers joining
+    a flight are counted on the instance and in the metric_name counter.
+    """
+
+    def __init__(self, metric_name: str) -> None:
+        """
+        :param metric_name: str LogLambdaMetrics counter of coalesced calls
+        """
+        self.metric_name = metric_name
+        self.coalesced = 0
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+
+    def call(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        """
+        Calls func, or waits for the identical call already in flight
+        :param key: Hashable identity of the call, include whatever shapes its result
+        :param func: callable without arguments
+        :return: Any the result of func
+        :raise: whatever func raised
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            LogLambdaMetrics.counter(self.metric_name, 1)
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = func()
+        except BaseException as err:
+            flight.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._flights)
+
+
+GET_FLIGHTS = SingleFlight('dal.get.coalesced')
+QUERY_FLIGHTS = SingleFlight('dal.query.coalesced')
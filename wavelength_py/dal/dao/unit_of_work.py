@@ -0,0 +1,240 @@
+"""
+Request scoped identity map and unit of work for the DAL
+"""
+import copy
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from wavelength_py.dal.cache.model_cache import get_cache_name
+from wavelength_py.dal.dal_config import DalConfig
+from wavelength_py.dal.dao.commands.batch_write_pynamo_command import PynamoBatchWriteCommand
+from wavelength_py.dal.dao.models.platform_persistence_model import PynamoPersistenceModel
+from wavelength_py.errors.exceptions import Base404Exception, Base409Exception, wavelengthBaseException
+from wavelength_py.logging.slog import StructLog as log
+
+WRITE_CREATE = 'create'
+WRITE_UPDATE = 'update'
+WRITE_DELETE = 'delete'
+
+_ACTIVE = threading.local()
+
+
+class PendingWrite:
+    """
+    The single write an item will get when the unit of work commits
+    """
+
+    def __init__(self, operation: str, command: Any, model: PynamoPersistenceModel) -> None:
+        """
+        :param operation: str WRITE_CREATE, WRITE_UPDATE or WRITE_DELETE
+        :param command: the deferred command, executed at commit against model
+        :param model: PynamoPersistenceModel the instance mapped to the item, holding every merged change
+        """
+        self.operation = operation
+        self.command = self._bind(command, model)
+        self.model = model
+
+    @staticmethod
+    def _bind(command: Any, model: PynamoPersistenceModel) -> Any:
+        """
+        A copy of a command built for another instance of the item, keeping its options, bound to model
+        """
+        if getattr(command, '_parent', model) is model:
+            return command
+        command = copy.copy(command)
+        setattr(command, '_parent', model)
+        return command
+
+
+class UnitOfWork:
+    """
+    Opt-in, request scoped context for DAL commands:
+
+        with UnitOfWork():
+            account = Account({}).read(account_id)      # read once
+            Account({}).read(account_id) is account     # True, served from the identity map
+            account.name = 'renamed'
+            account.update()                            # deferred
+            account.status = 'active'
+            account.update()                            # coalesced with the first update
+        # one UpdateItem is sent here, new items go out with BatchWriteItem
+
+    Reads of full items by key are served from the identity map once an item was read or registered.
+    Create, update and soft delete commands are deferred and coalesced per item, the writes are flushed
+    when the block exits without an exception or when commit is called, and discarded otherwise.
+    """
+
+    def __init__(self, max_workers: int = DalConfig.unit_of_work_max_workers) -> None:
+        """
+        :param max_workers: int number of updates and soft deletes to send in parallel at commit
+        """
+        self.max_workers = max_workers
+        self._identity_map: Dict[Tuple, PynamoPersistenceModel] = {}
+        self._pending: Dict[Tuple, PendingWrite] = OrderedDict()
+
+    def __enter__(self) -> 'UnitOfWork':
+        stack = getattr(_ACTIVE, 'stack', None)
+        if stack is None:
+            stack = _ACTIVE.stack = []
+        stack.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        _ACTIVE.stack.remove(self)
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+
+    @property
+    def pending(self) -> List[PendingWrite]:
+        """
+        Writes waiting for commit, in the order the items were first written
+        :return: List[PendingWrite]
+        """
+        return list(self._pending.values())
+
+    def get(self, db_model: Any, key: Any) -> Optional[PynamoPersistenceModel]:
+        """
+        Looks up a model read or registered in this unit of work
+        :param db_model: Type[PynamoModel]
+        :param key: hash key or (hash_key, range_key)
+        :return: PynamoPersistenceModel or None
+        :raise: Base404Exception if the item was deleted in this unit of work
+        """
+        identity = self._get_identity(db_model, key)
+        pending = self._pending.get(identity)
+        if pending is not None and pending.operation == WRITE_DELETE:
+            raise Base404Exception('Model does not exist', object_id=list(identity[1]))
+        return self._identity_map.get(identity)
+
+    def register(self, model: PynamoPersistenceModel) -> PynamoPersistenceModel:
+        """
+        Adds a model to the identity map, the instance already mapped to its key wins
+        :param model: PynamoPersistenceModel
+        :return: PynamoPersistenceModel the mapped instance
+        """
+        return self._identity_map.setdefault(self._get_model_identity(model), model)
+
+    def defer(self, operation: str, command: Any, model: PynamoPersistenceModel) -> None:
+        """
+        Queues a write, coalescing it with the write already queued for the same item
+        :param operation: str WRITE_CREATE, WRITE_UPDATE or WRITE_DELETE
+        :param command: the command to execute at commit
+        :param model: PynamoPersistenceModel the command's model
+        :return: None
+        :raise: Base409Exception when writing an item deleted in this unit of work
+        """
+        identity = self._get_model_identity(model)
+        mapped = self._identity_map.setdefault(identity, model)
+        if mapped is not model:
+            self._merge_changes(model, mapped)
+
+        pending = self._pending.get(identity)
+        if pending is None:
+            self._pending[identity] = PendingWrite(operation, command, mapped)
+        elif pending.operation == WRITE_DELETE:
+            raise Base409Exception('Model was deleted in this unit of work',
+                                   reason=f'Unable to {operation} a deleted model')
+        elif operation == WRITE_DELETE and pending.operation == WRITE_CREATE:
+            del self._pending[identity]  # never written, nothing to delete
+            del self._identity_map[identity]
+        elif operation == WRITE_DELETE:
+            self._pending[identity] = PendingWrite(operation, command, mapped)
+        # a create or an update followed by an update is flushed as the first write with all the changes
+
+    def commit(self) -> None:
+        """
+        Flushes the queued writes: new items with one BatchWriteItem per table, then one UpdateItem per
+        updated or soft deleted item, max_workers at a time. The items are distinct, so their writes are
+        independent. Every write is attempted and every failure is logged with its item's key, the first
+        failure is raised afterwards
+        :return: None
+        :raise: wavelengthBaseException
+        """
+        pending, self._pending = self._pending, OrderedDict()
+        errors: List[wavelengthBaseException] = []
+
+        creates: Dict[str, List[PynamoPersistenceModel]] = OrderedDict()
+        for write in pending.values():
+            if write.operation == WRITE_CREATE:
+                creates.setdefault(get_cache_name(write.model.db_model), []).append(write.model)
+        for models in creates.values():
+            report = PynamoBatchWriteCommand(models[0])(models)
+            for item in report.failed:
+                errors.append(self._log_failure(WRITE_CREATE, item.model, item.error))
+            for item in report.succeeded:
+                item.model.flush_changes()
+
+        writes = [write for write in pending.values() if write.operation != WRITE_CREATE]
+        if self.max_workers > 1 and len(writes) > 1:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+                results = list(pool.map(self._execute_write, writes))
+        else:
+            results = [self._execute_write(write) for write in writes]
+        errors.extend(self._log_failure(write.operation, write.model, error)
+                      for write, error in zip(writes, results) if error is not None)
+
+        if errors:
+            raise errors[0]
+
+    def rollback(self) -> None:
+        """
+        Discards the queued writes
+        :return: None
+        """
+        self._pending.clear()
+
+    @staticmethod
+    def _execute_write(write: PendingWrite) -> Optional[wavelengthBaseException]:
+        try:
+            write.command._execute()  # pylint: disable=protected-access
+        except wavelengthBaseException as err:
+            return err
+        return None
+
+    @staticmethod
+    def _log_failure(operation: str, model: PynamoPersistenceModel,
+                     error: wavelengthBaseException) -> wavelengthBaseException:
+        log.warn('UNIT_OF_WORK_WRITE_FAILED', str(error), operation=operation,
+                 table=get_cache_name(model.db_model), key=list(model.get_key()))
+        return error
+
+    @staticmethod
+    def _merge_changes(source: PynamoPersistenceModel, target: PynamoPersistenceModel) -> None:
+        for name, value in getattr(source, '_get_changes')().items():
+            setattr(target, name, value)
+
+    @classmethod
+    def _get_model_identity(cls, model: PynamoPersistenceModel) -> Tuple:
+        return cls._get_identity(model.db_model, tuple(model.get_key()))
+
+    @staticmethod
+    def _get_identity(db_model: Any, key: Any) -> Tuple:
+        return get_cache_name(db_model), tuple(key) if isinstance(key, (list, tuple)) else (key,)
+
+
+def get_unit_of_work() -> Optional[UnitOfWork]:
+    """
+    The innermost active unit of work of the current thread
+    :return: UnitOfWork or None
+    """
+    stack = getattr(_ACTIVE, 'stack', None)
+    return stack[-1] if stack else None
+
+
+def defer_write(operation: str, command: Any, model: PynamoPersistenceModel) -> bool:
+    """
+    Queues a write command on the active unit of work
+    :param operation: str WRITE_CREATE, WRITE_UPDATE or WRITE_DELETE
+    :param command: the command to execute at commit
+    :param model: PynamoPersistenceModel
+    :return: bool True if the write was deferred, False when no unit of work is active
+    """
+    unit_of_work = get_unit_of_work()
+    if unit_of_work is None:
+        return False
+    unit_of_work.defer(operation, command, model)
+    return True
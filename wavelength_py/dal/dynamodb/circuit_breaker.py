@@ -0,0 +1,220 @@
+"""
+Per table circuit breakers failing DynamoDB reads fast while a table keeps erroring
+"""
+import functools
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from wavelength_py.config import CONFIG
+from wavelength_py.dal.dynamodb.retry import DEFAULT_RETRY_SCOPE, get_retry_scope
+from wavelength_py.errors.exceptions import Base429Exception, Base503Exception, Base5xxException, \
+    CircuitOpenException, wavelengthBaseException
+from wavelength_py.logging.log_lambda_metrics import LogLambdaMetrics
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+
+def is_failure(error: BaseException) -> Optional[bool]:
+    """
+    Tells how a call's error weighs on its table's breaker
+    :param error: BaseException
+    :return: bool True for server errors and exhausted throttle retries, False when DynamoDB answered
+    (4xx errors), None for errors that say nothing about the table (deadline, open circuit, bugs)
+    """
+    if isinstance(error, (Base5xxException, Base429Exception)):
+        return True
+    if isinstance(error, Base503Exception):
+        return None
+    return False if isinstance(error, wavelengthBaseException) else None
+
+
+class CircuitBreaker:
+    """
+    Breaker of a single table:
+
+        closed      calls go through, the breaker opens once CONFIG.CIRCUIT_BREAKER_ERROR_RATE of the calls of
+                    the last CONFIG.CIRCUIT_BREAKER_WINDOW seconds failed, over at least CIRCUIT_BREAKER_MIN_CALLS
+        open        calls fail fast for CONFIG.CIRCUIT_BREAKER_OPEN_TIME millis
+        half open   one probe call at a time goes through, CONFIG.CIRCUIT_BREAKER_PROBES successful probes
+                    close the breaker and a failed one opens it again
+    """
+
+    def __init__(self, name: str, timer: Callable[[], float] = time.monotonic) -> None:
+        """
+        :param name: str table name, used in the metric names
+        :param timer: callable returning the current time in seconds
+        """
+        self.name = name
+        self.state = STATE_CLOSED
+        self.opened = 0
+        self._timer = timer
+        self._buckets: Deque[List[int]] = deque()
+        self._opened_at = 0.0
+        self._probing = False
+        self._probes = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """
+        Checks whether a call may go through, a half open breaker lets a single probe through
+        :return: bool
+        """
+        with self._lock:
+            open_time = CONFIG.CIRCUIT_BREAKER_OPEN_TIME / 1000.0
+            if self.state == STATE_OPEN and self._timer() - self._opened_at >= open_time:
+                self.state = STATE_HALF_OPEN
+                self._probing = False
+                self._probes = 0
+            if self.state == STATE_HALF_OPEN:
+                if self._probing:
+                    return False
+                self._probing = True
+                return True
+            return self.state == STATE_CLOSED
+
+    def record(self, failed: Optional[bool]) -> None:
+        """
+        Records the outcome of a call allowed through
+        :param failed: bool, None when the outcome says nothing about the table
+        :return: None
+        """
+        with self._lock:
+            if self.state == STATE_HALF_OPEN:
+                self._probing = False
+                if failed:
+                    self._open()
+                elif failed is not None:
+                    self._probes += 1
+                    if self._probes >= CONFIG.CIRCUIT_BREAKER_PROBES:
+                        self.state = STATE_CLOSED
+                        self._buckets.clear()
+            elif self.state == STATE_CLOSED and failed is not None:
+                calls, failures = self._add(failed)
+                if calls >= CONFIG.CIRCUIT_BREAKER_MIN_CALLS and failures >= calls * CONFIG.CIRCUIT_BREAKER_ERROR_RATE:
+                    self._open()
+
+    @property
+    def error_rate(self) -> float:
+        """
+        Share of failed calls in the current window
+        :return: float
+        """
+        with self._lock:
+            self._prune(int(self._timer()))
+            calls = sum(bucket[1] for bucket in self._buckets)
+            return sum(bucket[2] for bucket in self._buckets) / calls if calls else 0.0
+
+    def _add(self, failed: bool):
+        second = int(self._timer())
+        self._prune(second)
+        if not self._buckets or self._buckets[-1][0] != second:
+            self._buckets.append([second, 0, 0])
+        self._buckets[-1][1] += 1
+        self._buckets[-1][2] += int(failed)
+        return sum(bucket[1] for bucket in self._buckets), sum(bucket[2] for bucket in self._buckets)
+
+    def _prune(self, second: int) -> None:
+        while self._buckets and self._buckets[0][0] <= second - CONFIG.CIRCUIT_BREAKER_WINDOW:
+            self._buckets.popleft()
+
+    def _open(self) -> None:
+        self.state = STATE_OPEN
+        self.opened += 1
+        self._opened_at = self._timer()
+        self._buckets.clear()
+        LogLambdaMetrics.counter(f'dal.circuit.opened.{self.name}', 1)
+
+
+class CircuitBreakerRegistry:
+    """
+    One CircuitBreaker per table, guarding the DAL read handlers outside of their retries:
+
+        @CIRCUIT_BREAKERS.guard
+        @Retrier(On429ThrottleError('DynamoDB'))
+        def read(self):
+            ...
+
+    Calls of an open table raise CircuitOpenException (503) at once, counted in dal.circuit.rejected.<table>.
+    Calls whose table is unknown are never guarded
+    """
+
+    def __init__(self, timer: Callable[[], float] = time.monotonic) -> None:
+        self._timer = timer
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> CircuitBreaker:
+        """
+        The breaker of a table
+        :param name: str table name
+        :return: CircuitBreaker
+        """
+        with self._lock:
+            if name not in self._breakers:
+                self._breakers[name] = CircuitBreaker(name, self._timer)
+            return self._breakers[name]
+
+    def guard(self, func: Callable) -> Callable:
+        """
+        Decorates a DAL call with its table's breaker
+        :param func: callable
+        :return: callable
+        """
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            """ Standard function wrapper """
+            return self.call(func, *args, **kwargs)
+
+        return wrapper
+
+    def call(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        Calls func unless its table's breaker is open
+        :param func: callable
+        :return: Any the result of func
+        :raise: CircuitOpenException
+        """
+        scope = get_retry_scope(args)
+        if scope == DEFAULT_RETRY_SCOPE:
+            return func(*args, **kwargs)
+
+        breaker = self.get(scope)
+        if not breaker.allow():
+            LogLambdaMetrics.counter(f'dal.circuit.rejected.{scope}', 1)
+            raise CircuitOpenException('DynamoDB circuit open', reason=f'Reads of {scope} are failing, retry later')
+        failed = None
+        try:
+            result = func(*args, **kwargs)
+            failed = False
+            return result
+        except Exception as err:
+            failed = is_failure(err)
+            raise
+        finally:
+            breaker.record(failed)
+
+    def states(self) -> Dict[str, Dict[str, Any]]:
+        """
+        State, error rate and times opened of every breaker, keyed by table name
+        :return: dict
+        """
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {breaker.name: {'state': breaker.state, 'error_rate': breaker.error_rate, 'opened': breaker.opened}
+                for breaker in breakers}
+
+    def reset(self) -> None:
+        """
+        Closes every breaker
+        :return: None
+        """
+        with self._lock:
+            self._breakers.clear()
+
+
+CIRCUIT_BREAKERS = CircuitBreakerRegistry()
+LogLambdaMetrics.register_gauge('dal.circuit', CIRCUIT_BREAKERS.states)
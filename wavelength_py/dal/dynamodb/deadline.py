@@ -0,0 +1,102 @@
+"""
+Lambda deadline awareness for DAL calls: socket timeouts sized to the time left and early stops of multi page work
+"""
+import threading
+from typing import Any, Callable, Dict, List
+
+from wavelength_py.config import CONFIG
+from wavelength_py.errors.exceptions import DeadlineExceededException
+from wavelength_py.logging.log_lambda_metrics import LogLambdaMetrics
+from wavelength_py.logging.slog import LogLambda
+
+# Timeout a shared connection had before the calls in flight cut it, and how many calls are in flight
+_ORIGINAL_TIMEOUTS: Dict[Any, List[Any]] = {}
+_TIMEOUTS_LOCK = threading.Lock()
+
+
+def has_time_for(delay: float) -> bool:
+    """
+    Checks that the current Lambda invocation can afford to wait before a retry
+    :param delay: float millis
+    :return: bool True outside of a Lambda invocation
+    """
+    remaining = LogLambda.get_remaining_time_in_millis()
+    return remaining is None or remaining - delay >= CONFIG.CLIENT_RETRY_MIN_REMAINING_TIME
+
+
+def can_continue(name: str) -> bool:
+    """
+    Checks that the current Lambda invocation has CONFIG.DEFAULT_LAMBDA_EXEC_MIN_TIME left to start another
+    page, chunk or re-send of multi request work, counts dal.deadline.stop.<name> when it does not
+    :param name: str kind of work, e.g. query_stream
+    :return: bool True outside of a Lambda invocation
+    """
+    remaining = LogLambda.get_remaining_time_in_millis()
+    if remaining is None or remaining >= CONFIG.DEFAULT_LAMBDA_EXEC_MIN_TIME:
+        return True
+    LogLambdaMetrics.counter(f'dal.deadline.stop.{name}', 1)
+    return False
+
+
+def check_deadline(name: str) -> None:
+    """
+    Stops multi request work that cannot be resumed once the invocation is about to time out, see can_continue
+    :param name: str kind of work, e.g. batch_get
+    :return: None
+    :raise: DeadlineExceededException
+    """
+    if not can_continue(name):
+        raise DeadlineExceededException('Request deadline exceeded',
+                                        reason=f'Not enough time left in the invocation to finish the {name}')
+
+
+def get_request_timeout(default: float) -> float:
+    """
+    Socket timeout of the next request, cut so the invocation keeps CONFIG.CLIENT_RETRY_MIN_REMAINING_TIME
+    to answer once it expires
+    :param default: float seconds used outside of a Lambda invocation or when more time is left
+    :return: float seconds
+    :raise: DeadlineExceededException if no time is left for a request
+    """
+    remaining = LogLambda.get_remaining_time_in_millis()
+    if remaining is None:
+        return default
+    available = remaining - CONFIG.CLIENT_RETRY_MIN_REMAINING_TIME
+    if available <= 0:
+        LogLambdaMetrics.counter('dal.deadline.stop.request', 1)
+        raise DeadlineExceededException('Request deadline exceeded',
+                                        reason='Not enough time left in the invocation to call DynamoDB')
+    return min(default, available / 1000.0)
+
+
+def apply_request_timeout(db_model: Any) -> Callable[[], None]:
+    """
+    Sizes the socket timeout of a pynamo model's connection to the time left in the invocation.
+    The connection is shared by every call of the model class, the returned callable puts its own timeout
+    back once the last call in flight is over
+    :param db_model: Type[PynamoModel], only the deadline is checked for anything else
+    :return: callable to call once the request is over
+    :raise: DeadlineExceededException if no time is left for a request
+    """
+    if LogLambda.get_remaining_time_in_millis() is None:
+        return lambda: None
+    default = getattr(getattr(db_model, 'Meta', None), 'request_timeout_seconds', None)
+    timeout = get_request_timeout(default if isinstance(default, (int, float)) else CONFIG.DEFAULT_REQUEST_TIMEOUT)
+    get_connection = getattr(db_model, '_get_connection', None)
+    connection = getattr(get_connection(), 'connection', None) if callable(get_connection) else None
+    if connection is None:
+        return lambda: None
+    with _TIMEOUTS_LOCK:
+        original = _ORIGINAL_TIMEOUTS.setdefault(connection, [getattr(connection, '_request_timeout_seconds', None), 0])
+        original[1] += 1
+        setattr(connection, '_request_timeout_seconds', timeout)
+    return lambda: _restore_request_timeout(connection)
+
+
+def _restore_request_timeout(connection: Any) -> None:
+    with _TIMEOUTS_LOCK:
+        original = _ORIGINAL_TIMEOUTS[connection]
+        original[1] -= 1
+        if original[1] == 0:
+            del _ORIGINAL_TIMEOUTS[connection]
+            setattr(connection, '_request_timeout_seconds', original[0])
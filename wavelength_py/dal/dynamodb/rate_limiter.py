@@ -0,0 +1,231 @@
+"""
+Client side AIMD rate limiting of DynamoDB calls per table, index and capacity type
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from wavelength_py.config import CONFIG
+from wavelength_py.logging.log_lambda_metrics import LogLambdaMetrics
+from wavelength_py.logging.slog import LogLambda
+
+OPERATION_READ = 'read'
+OPERATION_WRITE = 'write'
+
+_BULK = threading.local()
+
+
+def get_consumed_units(result: Any) -> Optional[float]:
+    """
+    Capacity units a raw DynamoDB response reports, when it was asked for them
+    :param result: Any
+    :return: float, None if the response has no ConsumedCapacity
+    """
+    capacity = result.get('ConsumedCapacity') if isinstance(result, dict) else None
+    if isinstance(capacity, list):
+        capacity = capacity[0] if capacity else None
+    units = capacity.get('CapacityUnits') if isinstance(capacity, dict) else None
+    return float(units) if isinstance(units, (int, float)) else None
+
+
+class AdaptiveTokenBucket:
+    """
+    Token bucket whose rate follows AIMD: halved (CONFIG.RATE_LIMIT_DECREASE) on a throttle, at most once a
+    second, and raised by CONFIG.RATE_LIMIT_INCREASE units per second of successful calls, up to max_rate.
+    A call costs the moving average of the capacity units its scope consumed, 1 until responses report it
+    """
+
+    def __init__(self, max_rate: float, timer: Callable[[], float] = time.monotonic) -> None:
+        """
+        :param max_rate: float capacity units per second, e.g. the table's provisioned capacity
+        :param timer: callable returning the current time in seconds
+        """
+        self.max_rate = float(max_rate)
+        self.rate = self.max_rate
+        self.cost = 1.0
+        self._timer = timer
+        self._tokens = self.max_rate
+        self._updated = timer()
+        self._decreased = None
+        self._lock = threading.Lock()
+
+    def reserve(self, reserve: float = 0.0) -> float:
+        """
+        Takes the tokens of a call, going into debt when there are not enough
+        :param reserve: float fraction of the burst that must be left once the call's tokens are taken
+        :return: float seconds the caller has to wait before calling
+        """
+        with self._lock:
+            self._refill()
+            floor = reserve * self.rate
+            wait = max(0.0, (self.cost + floor - self._tokens) / self.rate)
+            self._tokens -= self.cost
+            return wait
+
+    def on_throttle(self) -> None:
+        """
+        Cuts the rate after a throttled call
+        :return: None
+        """
+        with self._lock:
+            now = self._timer()
+            if self._decreased is not None and now - self._decreased < 1:
+                return
+            self._decreased = now
+            self._refill()
+            self.rate = max(CONFIG.RATE_LIMIT_MIN, self.rate * CONFIG.RATE_LIMIT_DECREASE)
+            self._tokens = min(self._tokens, self.rate)
+
+    def on_success(self, units: Optional[float] = None) -> None:
+        """
+        Raises the rate after a successful call and learns the cost of calls
+        :param units: float capacity units the call consumed, if known
+        :return: None
+        """
+        with self._lock:
+            if units is not None:
+                self.cost = max(0.5, 0.8 * self.cost + 0.2 * units)
+            self.rate = min(self.max_rate, self.rate + CONFIG.RATE_LIMIT_INCREASE * self.cost / self.rate)
+
+    def _refill(self) -> None:
+        now = self._timer()
+        self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+class AdaptiveRateLimiter:
+    """
+    One AdaptiveTokenBucket per table, index and capacity type of the models opting in through Meta:
+
+        class Meta:
+            table_name = 'events'
+            read_rate_limit = 400       # capacity units per second
+            write_rate_limit = 100
+
+    Every call of the DAL retry handlers waits for its tokens first, bulk work wrapped in bulk() also leaves
+    CONFIG.RATE_LIMIT_BULK_RESERVE of the bucket to latency sensitive calls. Waits are capped by
+    CONFIG.RATE_LIMIT_MAX_WAIT and the time left in the invocation, the call is made once they are over
+    """
+
+    def __init__(self, timer: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep) -> None:
+        self._timer = timer
+        self._sleep = sleep
+        self._buckets: Dict[Tuple[Any, Optional[str], str], Optional[AdaptiveTokenBucket]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    @contextmanager
+    def bulk() -> Iterator[None]:
+        """
+        Marks the calls made by the current thread as bulk traffic
+        :return: context manager
+        """
+        previous = getattr(_BULK, 'active', False)
+        _BULK.active = True
+        try:
+            yield
+        finally:
+            _BULK.active = previous
+
+    @staticmethod
+    def is_bulk() -> bool:
+        """
+        Checks whether the current thread's calls are marked as bulk traffic, for handing the mark to workers
+        :return: bool
+        """
+        return getattr(_BULK, 'active', False)
+
+    def get_bucket(self, db_model: Any, index_name: Optional[str] = None,
+                   operation: str = OPERATION_READ) -> Optional[AdaptiveTokenBucket]:
+        """
+        The bucket of a table or index
+        :param db_model: Type[PynamoModel]
+        :param index_name: str
+        :param operation: str OPERATION_READ or OPERATION_WRITE
+        :return: AdaptiveTokenBucket, None if the model does not limit this operation
+        """
+        if db_model is None:
+            return None
+        key = (db_model, index_name, operation)
+        if key not in self._buckets:
+            max_rate = getattr(getattr(db_model, 'Meta', None), f'{operation}_rate_limit', None)
+            with self._lock:
+                if key not in self._buckets:
+                    valid = isinstance(max_rate, (int, float)) and max_rate > 0
+                    self._buckets[key] = AdaptiveTokenBucket(max_rate, self._timer) if valid else None
+        return self._buckets[key]
+
+    def acquire(self, db_model: Any, index_name: Optional[str] = None, operation: str = OPERATION_READ) -> float:
+        """
+        Waits for the tokens of a call
+        :param db_model: Type[PynamoModel]
+        :param index_name: str
+        :param operation: str
+        :return: float seconds waited
+        """
+        bucket = self.get_bucket(db_model, index_name, operation)
+        if bucket is None:
+            return 0.0
+        reserve = CONFIG.RATE_LIMIT_BULK_RESERVE if self.is_bulk() else 0.0
+        wait = min(bucket.reserve(reserve), CONFIG.RATE_LIMIT_MAX_WAIT / 1000.0)
+        remaining = LogLambda.get_remaining_time_in_millis()
+        if remaining is not None:
+            wait = min(wait, max(0.0, (remaining - CONFIG.CLIENT_RETRY_MIN_REMAINING_TIME) / 1000.0))
+        if wait > 0:
+            LogLambdaMetrics.counter(f'dal.rate_limit.wait_ms.{self._get_name(db_model, index_name)}',
+                                     int(wait * 1000))
+            self._sleep(wait)
+        return wait
+
+    def on_throttle(self, db_model: Any, index_name: Optional[str] = None, operation: str = OPERATION_READ) -> None:
+        """
+        Reports a throttled call
+        :param db_model: Type[PynamoModel]
+        :param index_name: str
+        :param operation: str
+        :return: None
+        """
+        bucket = self.get_bucket(db_model, index_name, operation)
+        if bucket is not None:
+            bucket.on_throttle()
+
+    def on_success(self, db_model: Any, index_name: Optional[str] = None, operation: str = OPERATION_READ,
+                   result: Any = None) -> None:
+        """
+        Reports a successful call
+        :param db_model: Type[PynamoModel]
+        :param index_name: str
+        :param operation: str
+        :param result: the call's result, raw responses carrying ConsumedCapacity tune the cost of calls
+        :return: None
+        """
+        bucket = self.get_bucket(db_model, index_name, operation)
+        if bucket is not None:
+            bucket.on_success(get_consumed_units(result))
+
+    def rates(self) -> Dict[str, float]:
+        """
+        Current rate of every bucket, keyed by table[/index]:operation
+        :return: dict
+        """
+        return {f'{self._get_name(db_model, index_name)}:{operation}': bucket.rate
+                for (db_model, index_name, operation), bucket in list(self._buckets.items()) if bucket is not None}
+
+    def reset(self) -> None:
+        """
+        Drops every bucket so they are rebuilt from Meta on next use
+        :return: None
+        """
+        with self._lock:
+            self._buckets.clear()
+
+    @staticmethod
+    def _get_name(db_model: Any, index_name: Optional[str]) -> str:
+        name = getattr(getattr(db_model, 'Meta', None), 'table_name', None) or getattr(db_model, '__name__', '')
+        return f'{name}/{index_name}' if index_name else str(name)
+
+
+RATE_LIMITER = AdaptiveRateLimiter()
+LogLambdaMetrics.register_gauge('dal.rate_limit.rates', RATE_LIMITER.rates)
@@ -0,0 +1,278 @@
+"""
+Retry engine for DynamoDB calls: pluggable jittered backoff, a per-table retry budget and a Lambda deadline stop
+"""
+import functools
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple
+
+from wavelength_py.config import CONFIG
+from wavelength_py.dal.dynamodb.deadline import apply_request_timeout, has_time_for
+from wavelength_py.dal.dynamodb.rate_limiter import OPERATION_READ, RATE_LIMITER
+from wavelength_py.logging.log_lambda_metrics import LogLambdaMetrics
+
+DEFAULT_RETRY_SCOPE = 'default'
+
+
+class RetryPolicy:
+    """
+    Computes the wait before a retry, subclass and add to RETRY_POLICIES to plug in another strategy
+    """
+
+    def get_delay(self, attempt: int, previous: float, multiplier: float, maximum: float) -> float:
+        """
+        :param attempt: int zero-based retry attempt
+        :param previous: float millis waited before the previous retry, 0 for the first one
+        :param multiplier: float base wait in millis
+        :param maximum: float max wait in millis
+        :return: float millis to wait
+        """
+        raise NotImplementedError()
+
+
+class ExponentialBackoff(RetryPolicy):
+    """
+    multiplier * 2 ** attempt, capped, every caller retries at the same moments
+    """
+
+    def get_delay(self, attempt: int, previous: float, multiplier: float, maximum: float) -> float:
+        return min(maximum, multiplier * (2 ** attempt))
+
+
+class FullJitterBackoff(RetryPolicy):
+    """
+    Random wait between 0 and the capped exponential backoff
+    """
+
+    def get_delay(self, attempt: int, previous: float, multiplier: float, maximum: float) -> float:
+        return random.uniform(0, min(maximum, multiplier * (2 ** attempt)))
+
+
+class DecorrelatedJitterBackoff(RetryPolicy):
+    """
+    Random wait between the base wait and three times the previous wait, capped
+    """
+
+    def get_delay(self, attempt: int, previous: float, multiplier: float, maximum: float) -> float:
+        return min(maximum, random.uniform(multiplier, max(multiplier, previous) * 3))
+
+
+RETRY_POLICIES: Dict[str, RetryPolicy] = {
+    'exponential': ExponentialBackoff(),
+    'full_jitter': FullJitterBackoff(),
+    'decorrelated_jitter': DecorrelatedJitterBackoff(),
+}
+
+
+class RetryBudget:
+    """
+    Token bucket of retries per scope (table): every retry takes a token, every successful call gives back
+    a fraction of one. Once a table's bucket is empty its calls fail fast instead of piling retries onto
+    a throttled table
+    """
+
+    def __init__(self, capacity: Optional[float] = None, refill: Optional[float] = None) -> None:
+        """
+        :param capacity: float tokens per scope, CONFIG.CLIENT_RETRY_BUDGET when None
+        :param refill: float tokens given back by a success, CONFIG.CLIENT_RETRY_BUDGET_REFILL when None
+        """
+        self._capacity = capacity
+        self._refill = refill
+        self._tokens: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def capacity(self) -> float:
+        """
+        Tokens a scope starts with
+        :return: float
+        """
+        return self._capacity if self._capacity is not None else CONFIG.CLIENT_RETRY_BUDGET
+
+    def acquire(self, scope: str) -> bool:
+        """
+        Takes a token for a retry
+        :param scope: str
+        :return: bool False when the scope's budget is exhausted
+        """
+        with self._lock:
+            tokens = self._tokens.get(scope, self.capacity)
+            if tokens < 1:
+                return False
+            self._tokens[scope] = tokens - 1
+            return True
+
+    def refund(self, scope: str) -> None:
+        """
+        Gives part of a token back after a successful call
+        :param scope: str
+        :return: None
+        """
+        refill = self._refill if self._refill is not None else CONFIG.CLIENT_RETRY_BUDGET_REFILL
+        with self._lock:
+            if scope in self._tokens:
+                self._tokens[scope] = min(self.capacity, self._tokens[scope] + refill)
+
+    def get_tokens(self, scope: str) -> float:
+        """
+        Tokens left for a scope
+        :param scope: str
+        :return: float
+        """
+        with self._lock:
+            return self._tokens.get(scope, self.capacity)
+
+    def reset(self) -> None:
+        """
+        Refills every scope
+        :return: None
+        """
+        with self._lock:
+            self._tokens.clear()
+
+
+RETRY_BUDGET = RetryBudget()
+
+
+def get_client_retry_settings() -> Tuple[int, float, float]:
+    """
+    Attempts, base wait and max wait in millis of the pynamo handlers, read from CONFIG on every call
+    :return: tuple
+    """
+    return (CONFIG.MAX_NUMBER_OF_CLIENT_RETRIES, CONFIG.CLIENT_RETRY_WAIT_EXPONENTIAL_MULTIPLIER,
+            CONFIG.CLIENT_RETRY_WAIT_EXPONENTIAL_MAX)
+
+
+def get_retry_policy() -> RetryPolicy:
+    """
+    The policy named by CONFIG.CLIENT_RETRY_POLICY, full jitter for unknown names
+    :return: RetryPolicy
+    """
+    return RETRY_POLICIES.get(CONFIG.CLIENT_RETRY_POLICY, RETRY_POLICIES['full_jitter'])
+
+
+def get_call_target(args: Sequence[Any]) -> Tuple[Any, Optional[str]]:
+    """
+    Model and index a call is made against, from a DAL command's parent model or a pager,
+    the index from the pager or the query arguments
+    :param args: positional arguments of the retried call
+    :return: tuple (Type[PynamoModel] or None, index name or None)
+    """
+    if not args:
+        return None, None
+    db_model = getattr(args[0], 'db_model', None) or getattr(getattr(args[0], '_parent', None), 'db_model', None)
+    index_name = getattr(args[0], 'index_name', None)
+    if not isinstance(index_name, str) and len(args) > 1:
+        index_name = getattr(args[1], 'index_name', None)
+    return db_model, index_name if isinstance(index_name, str) else None
+
+
+def get_retry_scope(args: Sequence[Any]) -> str:
+    """
+    Table a call is made against
+    :param args: positional arguments of the retried call
+    :return: str table name or DEFAULT_RETRY_SCOPE
+    """
+    table_name = getattr(getattr(get_call_target(args)[0], 'Meta', None), 'table_name', None)
+    return table_name if isinstance(table_name, str) else DEFAULT_RETRY_SCOPE
+
+
+class Retrier:
+    """
+    Decorator retrying the calls should_retry accepts:
+
+        @Retrier(On429ThrottleError('DynamoDB'))
+        def read(self):
+            ...
+
+    Waits follow CONFIG.CLIENT_RETRY_POLICY and retries stop early when the table's retry budget is
+    exhausted or the Lambda invocation is about to time out, the last error is raised as is.
+    Retries and backoff are counted per decorated function in dal.retry.count.<name> and
+    dal.retry.backoff_ms.<name>.
+
+    Every attempt first waits for the RATE_LIMITER tokens of its table or index, retryable errors
+    slow the limiter down and successes speed it up. Inside a Lambda invocation the socket timeout of
+    every attempt is cut to the time left and put back after it, see apply_request_timeout
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, should_retry: Callable[[Exception], bool],
+                 settings: Callable[[], Tuple[int, float, float]] = get_client_retry_settings,
+                 policy: Callable[[], RetryPolicy] = get_retry_policy,
+                 budget: RetryBudget = None,
+                 sleep: Callable[[float], None] = time.sleep,
+                 operation: str = OPERATION_READ) -> None:
+        """
+        :param should_retry: callable telling whether an exception is retryable
+        :param settings: callable returning (max attempts, base wait, max wait in millis), read on every call
+        :param policy: callable returning the RetryPolicy, read on every call
+        :param budget: RetryBudget, the shared RETRY_BUDGET by default
+        :param sleep: callable waiting a number of seconds
+        :param operation: str OPERATION_READ or OPERATION_WRITE, the capacity the calls consume
+        """
+        self.should_retry = should_retry
+        self.operation = operation
+        self.settings = settings
+        self.policy = policy
+        self.budget = budget
+        self.sleep = sleep
+
+    def __call__(self, func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            """ Standard function wrapper """
+            return self.call(func, *args, **kwargs)
+
+        return wrapper
+
+    def call(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        Calls func, retrying it as configured
+        :param func: callable
+        :return: Any the result of func
+        """
+        budget = self.budget if self.budget is not None else RETRY_BUDGET
+        name = getattr(func, '__qualname__', repr(func))
+        target = (*get_call_target(args), self.operation)
+        scope = get_retry_scope(args)
+        max_attempts, multiplier, maximum = self.settings()
+        attempt = 0
+        delay = 0.0
+        while True:
+            RATE_LIMITER.acquire(*target)
+            restore_timeout = apply_request_timeout(target[0])
+            try:
+                result = func(*args, **kwargs)
+            except Exception as err:  # pylint: disable=broad-except
+                attempt += 1
+                retryable = self.should_retry(err)
+                if retryable:
+                    RATE_LIMITER.on_throttle(*target)
+                if not retryable or attempt >= max_attempts:
+                    raise
+                delay = self.policy().get_delay(attempt - 1, delay, multiplier, maximum)
+                if not self._wait(name, scope, budget, delay):
+                    raise
+            else:
+                budget.refund(scope)
+                RATE_LIMITER.on_success(*target, result=result)
+                return result
+            finally:
+                restore_timeout()
+
+    def _wait(self, name: str, scope: str, budget: RetryBudget, delay: float) -> bool:
+        """
+        Sleeps before a retry unless the deadline is too close or the scope's budget is spent
+        :return: bool False when the call must not be retried
+        """
+        if not has_time_for(delay):
+            LogLambdaMetrics.counter(f'dal.retry.deadline_stop.{name}', 1)
+            return False
+        if not budget.acquire(scope):
+            LogLambdaMetrics.counter(f'dal.retry.budget_exhausted.{scope}', 1)
+            return False
+        LogLambdaMetrics.counter(f'dal.retry.count.{name}', 1)
+        LogLambdaMetrics.counter(f'dal.retry.backoff_ms.{name}', int(delay))
+        self.sleep(delay / 1000.0)
+        return True
@@ -4,11 +4,14 @@ Common utils for Dynamo interop
 import base64
 import binascii
 import json
+import random
+from typing import Iterable, Iterator, List, Any
 
 from botocore.exceptions import ClientError
-from retrying import retry
 
 from wavelength_py.aws.boto_helper import is_a_boto3_throttle_error
+from wavelength_py.dal.dynamodb.rate_limiter import OPERATION_WRITE
+from wavelength_py.dal.dynamodb.retry import Retrier
 from wavelength_py.errors.exceptions import Base409Exception, Base422Exception, Base429Exception
 from wavelength_py.logging.slog import StructLog as log
 
@@ -50,10 +53,9 @@ class OnThrottleError:
 def dynamo_read_handler(func):
     """ Retry dynamodb read wrapper, returns value from function or passes the exception upward """
 
-    @retry(wait_exponential_multiplier=BotoThrottleConfig.wait_exponential_multiplier,
-           wait_exponential_max=BotoThrottleConfig.max_read_backoff,
-           stop_max_attempt_number=BotoThrottleConfig.max_retries,
-           retry_on_exception=OnThrottleError('DynamonDB'))
+    @Retrier(OnThrottleError('DynamonDB'), settings=lambda: (BotoThrottleConfig.max_retries,
+                                                             BotoThrottleConfig.wait_exponential_multiplier,
+                                                             BotoThrottleConfig.max_read_backoff))
     def wrapper(*args, **kwargs):
         """ Standard function wrapper """
         return func(*args, **kwargs)
@@ -70,10 +72,9 @@ def dynamo_write_handler(func):
             False if process is successful
     """
 
-    @retry(wait_exponential_multiplier=1000,
-           wait_exponential_max=BotoThrottleConfig.max_write_backoff,
-           stop_max_attempt_number=BotoThrottleConfig.max_retries,
-           retry_on_exception=OnThrottleError('DynamonDB'))
+    @Retrier(OnThrottleError('DynamonDB'), settings=lambda: (BotoThrottleConfig.max_retries, 1000,
+                                                             BotoThrottleConfig.max_write_backoff),
+             operation=OPERATION_WRITE)
     def wrapper(*args, **kwargs):
         """ Standard function wrapper """
         try:
@@ -114,6 +115,41 @@ class OnThrottleOrConditionalCheckError:
         return False
 
 
+def get_backoff_delay(attempt: int,
+                      multiplier: int = BotoThrottleConfig.wait_exponential_multiplier,
+                      maximum: int = BotoThrottleConfig.max_read_backoff,
+                      jitter: bool = False) -> float:
+    """
+    Exponential backoff matching the retry handlers (values in millis)
+    :param attempt: int zero-based retry attempt
+    :param multiplier: int
+    :param maximum: int
+    :param jitter: bool if True a random delay up to the exponential value is used (full jitter)
+    :return: float seconds to wait
+    """
+    delay = min(maximum, multiplier * (2 ** attempt))
+    if jitter:
+        delay = random.uniform(0, delay)
+    return delay / 1000.0
+
+
+def chunk_list(source: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """
+    Splits an iterable into lists of at most `size` items
+    :param source: Iterable
+    :param size: int
+    :return: Iterator[list]
+    """
+    chunk = []  # type: List[Any]
+    for item in source:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
 def encode_start_token(token: dict) -> str:
     """
     Converts dict into base-64 encoded serialized JSON
@@ -1,19 +1,62 @@
 """
 Base mode for cache enabled pynamo model access
 """
-from cachetools import TTLCache
+from functools import partial
+from itertools import islice
+from typing import List, Optional
+
+from pynamodb.constants import ATTRIBUTES
+from pynamodb.exceptions import DoesNotExist
 from pynamodb.models import Model as PynamoModel
 
-from wavelength_py.config import CONFIG
+from wavelength_py.dal.cache.container_cache import CONTAINER_CACHES
+from wavelength_py.dal.cache.memcached_cache import MEMCACHED_CACHE
+from wavelength_py.dal.cache.model_cache import CACHE_REGISTRY, ModelCache, NOT_FOUND, get_record_key, \
+    get_record_version
+from wavelength_py.dal.cache.partition_cache import PARTITION_CACHE
+from wavelength_py.dal.cache.record_codec import deserialize_record, serialize_record
 from wavelength_py.dal.pynamo_models.util import QueryResult
 
 
 class CachingPynamoModel(PynamoModel):
     """
-    Overrides a few methods on the Model class to enable selective caching
+    Overrides a few methods on the Model class to enable selective caching.
+    Each subclass gets its own cache from CACHE_REGISTRY, configured through Meta (see ModelCacheRegistry),
+    backed by the shared memcached cache when MEMCACHED_ENDPOINT is set.
+
+    Reads of the DAL get command are consistent and skip the caches, models whose items may be served
+    from the caches opt in with Meta.cache_reads = True (see caches_reads), models with a container cache
+    are read through it unless Meta.cache_reads = False.
+
+    Writes are cached as the server stored them (ALL_NEW for updates) along with the item's version, so
+    get(..., min_version=N) gives read-your-writes without a consistent read.
+
+    Reference style models can also opt into a container lifetime, stale-while-revalidate tier in front
+    of the other caches with Meta.container_cache_soft_ttl (see ContainerCacheRegistry), which also answers
+    reads while the table's circuit breaker is open (see get_stale), and small
+    partitions can be cached whole with Meta.partition_cache_max_items (see PartitionCache), which then
+    also answer queries cut by an open breaker (see get_stale_partition)
     """
 
-    cache = TTLCache(maxsize=128, ttl=CONFIG.DATA_CACHE_TTL)
+    @classmethod
+    def get_cache(cls) -> ModelCache:
+        """
+        This model's item cache
+        :return: ModelCache
+        """
+        return CACHE_REGISTRY.get(cls)
+
+    @classmethod
+    def caches_reads(cls) -> bool:
+        """
+        Checks whether the DAL get command may answer reads of this model from its caches
+        instead of a consistent read, the default for models with a container cache
+        :return: bool Meta.cache_reads when set
+        """
+        cache_reads = getattr(getattr(cls, 'Meta', None), 'cache_reads', None)
+        if isinstance(cache_reads, bool):
+            return cache_reads
+        return CONTAINER_CACHES.get(cls) is not None
 
     @classmethod
     def query(cls, *args, **kwargs) -> QueryResult:  # type: ignore  # pylint: disable=arguments-differ
@@ -35,48 +78,197 @@ class CachingPynamoModel(PynamoModel):
         :return: QueryResult
         """
         result = QueryResult(super().query(*args, **kwargs))
-        for item in result.items:
-            cls._put_model_cache(item)
+        if kwargs.get('attributes_to_get') is None:
+            for item in result.items:
+                cls._put_model_cache(item, shared=False)
+            MEMCACHED_CACHE.put_items(result.items)
         return result
 
     @classmethod
-    def get(cls,
+    def get_partition(cls, hash_key) -> Optional[List[PynamoModel]]:
+        """
+        Every item of a hash key partition sorted by range key, loaded with a single full query on a miss
+        :param hash_key: str
+        :return: List[PynamoModel], None if the model does not cache partitions or the partition is larger
+        than Meta.partition_cache_max_items
+        """
+        max_items = PARTITION_CACHE.get_max_items(cls)
+        if max_items is None:
+            return None
+        records = PARTITION_CACHE.get(cls, hash_key)
+        if records is not None:
+            return records if records is not NOT_FOUND else None
+
+        generation = PARTITION_CACHE.get_generation(cls)
+        records = list(islice(super().query(hash_key, scan_index_forward=True), max_items + 1))
+        if len(records) > max_items:
+            PARTITION_CACHE.put_oversized(cls, hash_key)
+            return None
+        PARTITION_CACHE.put(cls, hash_key, records, generation)
+        return records
+
+    @classmethod
+    def get_stale_partition(cls, hash_key) -> Optional[List[PynamoModel]]:
+        """
+        The cached partition of a hash key however stale, without calling DynamoDB, the fallback
+        of queries cut by an open circuit breaker
+        :param hash_key: str
+        :return: List[PynamoModel] sorted by range key, None if the partition is not cached
+        """
+        return PARTITION_CACHE.peek(cls, hash_key)
+
+    @classmethod
+    def batch_get(cls, items, consistent_read=None, attributes_to_get=None):
+        """
+        Yields the requested items, only the keys missing from the local and memcached caches are read
+        from DynamoDB. Order is not preserved, just like BatchGetItem
+        :param items: List of hash keys or (hash_key, range_key) tuples
+        :param consistent_read: bool
+        :param attributes_to_get: List
+        :return: Iterator[PynamoModel]
+        """
+        if consistent_read or attributes_to_get is not None:
+            yield from super().batch_get(items, consistent_read, attributes_to_get)
+            return
+
+        cache = cls.get_cache()
+        missing = []
+        for item in items:
+            key = tuple(item) if isinstance(item, (list, tuple)) else (item, None)
+            result = cache.get(cls.get_cache_key(*key))
+            if result is None:
+                missing.append(key)
+            elif result is not NOT_FOUND:
+                yield result
+
+        shared = MEMCACHED_CACHE.get_items(cls, missing)
+        for key, result in shared.items():
+            cache.put(cls.get_cache_key(*key), result)
+            yield result
+
+        missing = [key if key[1] is not None else key[0] for key in missing if key not in shared]
+        if missing:
+            records = list(super().batch_get(missing, consistent_read, attributes_to_get))
+            for record in records:
+                cls._put_model_cache(record, shared=False)
+            MEMCACHED_CACHE.put_items(records)
+            yield from records
+
+    # pylint: disable=too-many-arguments
+    @classmethod
+    def get(cls,  # pylint: disable=arguments-differ
             hash_key,
             range_key=None,
             consistent_read=False,
-            attributes_to_get=None):
+            attributes_to_get=None,
+            min_version=None):
         """
-        Returns a single object using the provided keys
+        Returns a single object using the provided keys. Consistent reads skip the cache lookup
+        but still refresh the cached item
         :param hash_key: str
         :param range_key: str
         :param consistent_read: bool
         :param attributes_to_get: List
+        :param min_version: int cached copies older than this version are skipped, an eventually consistent
+        read returning an older version is retried as a consistent read
         :return: PynamoModel
+        :raise: DoesNotExist, possibly from the negative cache
         """
+        if attributes_to_get is not None:  # partial items are never cached
+            return super().get(hash_key, range_key, consistent_read, attributes_to_get)
+
         key = cls.get_cache_key(hash_key, range_key)
-        result = cls.cache.get(key)
+        container = CONTAINER_CACHES.get(cls)
+        if container is not None and not consistent_read and min_version is None:
+            return container.get(key, partial(cls._get_from_table, hash_key, range_key))
 
-        if not result:
+        if not consistent_read:
+            result = cls._get_cached(key, (hash_key, range_key), min_version)
+            if result is NOT_FOUND:
+                raise cls.DoesNotExist()
+            if result is not None:
+                return result
+
+        try:
             result = super().get(hash_key, range_key, consistent_read, attributes_to_get)
-            cls.cache[key] = result
+            if not consistent_read and not cls._is_at_least(result, min_version):
+                result = super().get(hash_key, range_key, True, attributes_to_get)
+        except DoesNotExist:
+            cls.get_cache().put_missing(key)
+            raise
+        cls._put_model_cache(result)
+        return result
 
+    @classmethod
+    def get_stale(cls, hash_key, range_key=None) -> Optional[PynamoModel]:
+        """
+        The container cached copy of an item however stale, without calling DynamoDB, the fallback
+        of reads cut by an open circuit breaker
+        :param hash_key: str
+        :param range_key: str
+        :return: PynamoModel, None if the model has no container cache or the item is not in it
+        """
+        container = CONTAINER_CACHES.get(cls)
+        if container is None:
+            return None
+        return container.peek(cls.get_cache_key(hash_key, range_key))
+
+    @classmethod
+    def _get_from_table(cls, hash_key, range_key=None):
+        """
+        Eventually consistent read refreshing the local and shared caches, loads the container cache
+        :param hash_key: str
+        :param range_key: str
+        :return: PynamoModel
+        :raise: DoesNotExist
+        """
+        try:
+            result = super().get(hash_key, range_key)
+        except DoesNotExist:
+            cls.get_cache().put_missing(cls.get_cache_key(hash_key, range_key))
+            raise
+        cls._put_model_cache(result)
+        return result
+
+    @classmethod
+    def _get_cached(cls, key, record_key, min_version: int = None):
+        """
+        Looks an item up in the local then the shared cache
+        :param key: local cache key
+        :param record_key: tuple (hash_key, range_key)
+        :param min_version: int
+        :return: PynamoModel, NOT_FOUND or None
+        """
+        cache = cls.get_cache()
+        result = cache.get(key, min_version=min_version)
+        if result is not None:
+            return result
+
+        result = MEMCACHED_CACHE.get_items(cls, [record_key]).get(record_key)
+        if result is None or not cls._is_at_least(result, min_version):
+            return None
+        cache.put(key, result, get_record_version(result))
         return result
 
+    @staticmethod
+    def _is_at_least(record: PynamoModel, min_version: Optional[int]) -> bool:
+        return min_version is None or (get_record_version(record) or 0) >= min_version
+
     def save(self, condition=None, conditional_operator=None, **expected_values):
         """
-        Save this object to dynamodb
+        Save this object to dynamodb, a copy of what was written is cached
         :param condition: Condition
         :param conditional_operator: List
         :param expected_values: List
         :return: dict
         """
         result = super().save(condition, conditional_operator, **expected_values)
-        self._put_model_cache(self)
+        self.write_through(serialize_record(self))
         return result
 
     def update(self, attributes=None, actions=None, condition=None, conditional_operator=None, **expected_values):
         """
-        Updates an item using the UpdateItem operation.
+        Updates an item using the UpdateItem operation, the ALL_NEW attributes DynamoDB returned are cached
         :param attributes: List
         :param actions: List
         :param condition: Condition
@@ -85,9 +277,27 @@ class CachingPynamoModel(PynamoModel):
         :return: dict
         """
         result = super().update(attributes, actions, condition, conditional_operator, **expected_values)
-        self._put_model_cache(self)
+        attributes = result.get(ATTRIBUTES) if isinstance(result, dict) else None
+        self.write_through(attributes if attributes else serialize_record(self))
         return result
 
+    @classmethod
+    def write_through(cls, raw: dict) -> None:
+        """
+        Caches a copy of a stored item so later changes to the written instance never leak into the cache,
+        also used for items stored without an instance such as BatchWriteItem puts
+        :param raw: dict raw attribute map as stored in DynamoDB
+        :return: None
+        """
+        record = deserialize_record(cls, raw)
+        key = get_record_key(record)
+        PARTITION_CACHE.invalidate(cls, key[0])
+        cls.get_cache().put(cls.get_cache_key(*key), record, get_record_version(record))
+        MEMCACHED_CACHE.put_item(record)
+        container = CONTAINER_CACHES.get(cls)
+        if container is not None:
+            container.put(cls.get_cache_key(*key), record, partial(cls._get_from_table, *key))
+
     def delete(self, condition=None, conditional_operator=None, **expected_values):
         """
         Deletes this object from dynamodb
@@ -115,21 +325,27 @@ class CachingPynamoModel(PynamoModel):
         return result
 
     @classmethod
-    def _put_model_cache(cls, model: PynamoModel):
+    def _put_model_cache(cls, model: PynamoModel, shared: bool = True):
         """
         Replaces an item in the cache based on its own keys
         :param model: PynamoModel
+        :param shared: bool also write it through to memcached
         :return: None
         """
-        key = cls.get_cache_key(*getattr(model, '_get_keys')())
-        cls.cache[key] = model
+        cls.get_cache().put(cls.get_cache_key(*get_record_key(model)), model, get_record_version(model))
+        if shared:
+            MEMCACHED_CACHE.put_item(model)
 
     @classmethod
     def _delete_model_cache(cls, model: PynamoModel):
         """
-        Replaces an item in the cache based on its own keys
+        Removes an item from the cache based on its own keys
         :param model: PynamoModel
         :return: None
         """
-        key = cls.get_cache_key(*getattr(model, '_get_keys')())
-        cls.cache.pop(key)
+        cls.get_cache().pop(cls.get_cache_key(*get_record_key(model)))
+        MEMCACHED_CACHE.delete_item(model)
+        PARTITION_CACHE.invalidate(cls, get_record_key(model)[0])
+        container = CONTAINER_CACHES.get(cls)
+        if container is not None:
+            container.pop(cls.get_cache_key(*get_record_key(model)))
@@ -1,15 +1,18 @@
 """
 Utilities for pynamo models
 """
-from typing import List, Union
+import functools
+from typing import Any, Dict, List, Optional, Type, Union
 
+from pynamodb.constants import LAST_EVALUATED_KEY, CONSUMED_CAPACITY, CAPACITY_UNITS, TOTAL
 from pynamodb.exceptions import PynamoDBConnectionError
 from pynamodb.indexes import Projection
 from pynamodb.models import Model as PynamoModel
 from pynamodb.pagination import ResultIterator
-from retrying import retry
-
 from wavelength_py.config import CONFIG
+from wavelength_py.dal.dynamodb.circuit_breaker import CIRCUIT_BREAKERS
+from wavelength_py.dal.dynamodb.rate_limiter import OPERATION_WRITE
+from wavelength_py.dal.dynamodb.retry import Retrier
 from wavelength_py.dal.dynamodb.util import encode_start_token, handle_dynamodb_client_error
 from wavelength_py.errors.exceptions import Base429Exception, Base5xxException
 
@@ -63,6 +66,116 @@ class QueryResult:
         return self._total_count
 
 
+class ResultPager:
+    """
+    Fetches raw query/scan pages one request at a time from a pynamo ResultIterator's arguments.
+    State only advances after a page was returned so a failed fetch can be retried safely
+    """
+
+    def __init__(self, db_model: Type[PynamoModel], result: ResultIterator, **kwargs):
+        """
+        :param db_model: Type[PynamoModel]
+        :param result: ResultIterator built but not yet iterated
+        :param kwargs: extra low level operation arguments (ie select)
+        """
+        page_iter = result.page_iter
+        self._db_model = db_model
+        self._operation = getattr(page_iter, '_operation')
+        self._args = getattr(page_iter, '_args')
+        self._kwargs = {**getattr(page_iter, '_kwargs'), 'return_consumed_capacity': TOTAL, **kwargs}
+        self._last_evaluated_key = self._kwargs.get('exclusive_start_key')
+        self._exhausted = False
+
+    def fetch(self) -> Optional[Dict[str, Any]]:
+        """
+        Requests the next raw page
+        :return: dict raw page or None when there are no more pages
+        """
+        if self._exhausted:
+            return None
+        page = self._operation(*self._args, **{**self._kwargs, 'exclusive_start_key': self._last_evaluated_key})
+        self._last_evaluated_key = page.get(LAST_EVALUATED_KEY)
+        self._exhausted = self._last_evaluated_key is None
+        return page
+
+    @property
+    def db_model(self) -> Type[PynamoModel]:
+        """
+        Model whose table is paged
+        :return: Type[PynamoModel]
+        """
+        return self._db_model
+
+    @property
+    def index_name(self) -> Optional[str]:
+        """
+        Index being paged, None for the table
+        :return: str
+        """
+        return self._kwargs.get('index_name')
+
+    @property
+    def exhausted(self) -> bool:
+        """
+        True when the last page has been fetched
+        :return: bool
+        """
+        return self._exhausted
+
+    @property
+    def last_evaluated_key(self) -> Optional[Dict[str, Any]]:
+        """
+        Raw key to resume from after the last fetched page
+        :return: dict
+        """
+        return self._last_evaluated_key
+
+    @property
+    def key_names(self) -> List[str]:
+        """
+        Attribute names that make up a resume key for the table or index being read
+        :return: List[str]
+        """
+        meta = getattr(self._db_model, '_get_meta_data')()
+        return meta.get_key_names(self._kwargs.get('index_name'))
+
+    @classmethod
+    def get_consumed_capacity(cls, page: Dict[str, Any]) -> float:
+        """
+        Capacity units reported on a raw page
+        :param page: dict
+        :return: float
+        """
+        return page.get(CONSUMED_CAPACITY, {}).get(CAPACITY_UNITS, 0)
+
+
+def get_query_pager(db_model: Type[PynamoModel], hash_key: Any, select: str = None, **kwargs) -> ResultPager:
+    """
+    Builds a ResultPager for a query. The base pynamo query is used so model level result caching is bypassed
+    :param db_model: Type[PynamoModel]
+    :param hash_key: Any
+    :param select: str optional Select value (ie COUNT)
+    :param kwargs: pynamo query kwargs
+    :return: ResultPager
+    """
+    extra = {'select': select} if select else {}
+    return ResultPager(db_model, PynamoModel.query.__func__(db_model, hash_key, **kwargs), **extra)
+
+
+def get_scan_pager(db_model: Type[PynamoModel], segment: int = None, total_segments: int = None,
+                   **kwargs) -> ResultPager:
+    """
+    Builds a ResultPager for a scan, optionally restricted to a single parallel scan segment
+    :param db_model: Type[PynamoModel]
+    :param segment: int
+    :param total_segments: int
+    :param kwargs: pynamo scan kwargs
+    :return: ResultPager
+    """
+    return ResultPager(db_model, PynamoModel.scan.__func__(db_model, segment=segment,
+                                                           total_segments=total_segments, **kwargs))
+
+
 class On429ThrottleError:
     """
     Boto3 Throttle handler for retry
@@ -77,12 +190,12 @@ class On429ThrottleError:
 
 
 def pynamo_read_handler(func):
-    """ Retry dynamodb read wrapper, returns value from function or passes the exception upward """
+    """ Retry dynamodb read wrapper, returns value from function or passes the exception upward,
+        reads of a table whose circuit breaker is open fail fast with a CircuitOpenException """
 
-    @retry(wait_exponential_multiplier=CONFIG.CLIENT_RETRY_WAIT_EXPONENTIAL_MULTIPLIER,
-           wait_exponential_max=CONFIG.CLIENT_RETRY_WAIT_EXPONENTIAL_MAX,
-           stop_max_attempt_number=CONFIG.MAX_NUMBER_OF_CLIENT_RETRIES,
-           retry_on_exception=On429ThrottleError('DynamonDB'))
+    @CIRCUIT_BREAKERS.guard
+    @Retrier(On429ThrottleError('DynamonDB'))
+    @functools.wraps(func)
     def wrapper(*args, **kwargs):
         """ Standard function wrapper """
         try:
@@ -97,10 +210,8 @@ def pynamo_read_handler(func):
 def pynamo_write_handler(func):
     """ Retry dynamodb write wrapper, returns value from function or passes the exception upward """
 
-    @retry(wait_exponential_multiplier=CONFIG.CLIENT_RETRY_WAIT_EXPONENTIAL_MULTIPLIER,
-           wait_exponential_max=CONFIG.CLIENT_RETRY_WAIT_EXPONENTIAL_MAX,
-           stop_max_attempt_number=CONFIG.MAX_NUMBER_OF_CLIENT_RETRIES,
-           retry_on_exception=On429ThrottleError('DynamonDB'))
+    @Retrier(On429ThrottleError('DynamonDB'), operation=OPERATION_WRITE)
+    @functools.wraps(func)
     def wrapper(*args, **kwargs):
         """ Standard function wrapper """
         try:
@@ -112,6 +223,16 @@ def pynamo_write_handler(func):
     return wrapper
 
 
+@pynamo_read_handler
+def fetch_page(pager: ResultPager) -> Optional[Dict[str, Any]]:
+    """
+    Requests the next raw page of a query or scan, retrying throttled requests
+    :param pager: ResultPager
+    :return: dict raw page
+    """
+    return pager.fetch()
+
+
 def get_pynamo_model_keys(db_model: PynamoModel):
     """
     Scan model attributes and pluck the keys
@@ -154,6 +154,15 @@ class Base5xxException(wavelengthBaseException):
         return self._get_response(HTTPStatus.INTERNAL_SERVER_ERROR, context)
 
 
+class Base503Exception(wavelengthBaseException):
+    """
+    503 Service Unavailable, answered as a response instead of failing the invocation like Base5xxException.
+    """
+
+    def get_response(self, context=None):
+        return self._get_response(HTTPStatus.SERVICE_UNAVAILABLE, context)
+
+
 class InvalidParametersException(Base422Exception):
     """
     Derived input validation exception, use when parameters are not valid
@@ -170,3 +179,15 @@ class InvalidEventInputException(Base422Exception):
     """
     Derived input validation exception, use when lambda input event is not valid
     """
+
+
+class DeadlineExceededException(Base503Exception):
+    """
+    Derived service unavailable exception, use when work is stopped because the lambda invocation is about to time out
+    """
+
+
+class CircuitOpenException(Base503Exception):
+    """
+    Derived service unavailable exception, use when calls to a failing dependency are cut by an open circuit breaker
+    """
@@ -21,6 +21,7 @@ class LogLambdaMetrics:
     KEY_SETS = 'sets'
 
     metrics = {}
+    gauge_providers = {}
 
     @staticmethod
     def reset_metrics():
@@ -109,6 +110,29 @@ class LogLambdaMetrics:
 
         LogLambdaMetrics.metrics[LogLambdaMetrics.KEY_GAUGES][str(name)] = item
 
+    @staticmethod
+    def register_gauge(name: str, provider) -> None:
+        """
+        register_gauge adds a callable that is sampled into the gauges every time the metrics are flushed.
+        Registering the same name again replaces the provider.
+        """
+        LogLambdaMetrics.gauge_providers[str(name)] = provider
+
+    @staticmethod
+    def sample_gauges() -> None:
+        """
+        sample_gauges sets every registered gauge to its provider's current value. A failing provider is
+        logged and skipped so it can never break the flush.
+        """
+        for name, provider in list(LogLambdaMetrics.gauge_providers.items()):
+            try:
+                value = provider()
+            except Exception as err:  # pylint: disable=broad-except
+                LogLambdaBase.warn('LogLambdaMetrics#sample_gauges', 'gauge provider failed - %s' % name,
+                                   error=str(err))
+                continue
+            LogLambdaMetrics.gauge(name, value)
+
     @staticmethod
     def sets(name: str, item) -> None:
         """
@@ -152,6 +176,7 @@ class LogLambdaMetrics:
         sanitize calls the other sanitize methods.
         """
         if LogLambdaMetrics.metrics:
+            LogLambdaMetrics.sample_gauges()
             LogLambdaMetrics.metrics[LogLambdaMetrics.KEY_TIMERS] = LogLambdaMetrics.sanitize_timestamps(
                 LogLambdaMetrics.metrics.get(LogLambdaMetrics.KEY_TIMERS))
             LogLambdaMetrics.metrics[LogLambdaMetrics.KEY_SETS] = LogLambdaMetrics.sanitize_sets(
@@ -2,6 +2,7 @@
 Lambda log wrapper
 """
 import functools
+from typing import Optional
 
 from wavelength_py.aws.aws_args import convert_response, convert_body
 from wavelength_py.errors.exceptions import (Base5xxException,
@@ -22,8 +23,41 @@ class LogLambda(LogLambdaBase):
 
     the decorator should be initialized with the logger returned
     from _get_structured_logger()
+
+    serverless-plugin-warmup invocations skip the handler and run the registered warmup hooks instead,
+    see register_warmup
     """
 
+    warmup_hooks = []
+    context = None
+
+    @staticmethod
+    def get_remaining_time_in_millis() -> Optional[int]:
+        """
+        Millis left before the current invocation times out, None outside of an invocation
+        """
+        try:
+            remaining = LogLambda.context.get_remaining_time_in_millis()
+        except AttributeError:
+            return None
+        return remaining if isinstance(remaining, (int, float)) else None
+
+    @staticmethod
+    def register_warmup(hook) -> None:
+        """
+        Adds a callable run on every warmup invocation, e.g. to refresh container lifetime caches
+        """
+        if hook not in LogLambda.warmup_hooks:
+            LogLambda.warmup_hooks.append(hook)
+
+    @staticmethod
+    def _run_warmup_hooks() -> None:
+        for hook in list(LogLambda.warmup_hooks):
+            try:
+                hook()
+            except Exception as error:  # pylint: disable=broad-except
+                LogLambda.warn('LogLambda#warmup', 'warmup hook failed', error=str(error))
+
     @staticmethod
     def _flush_buffer(**kwargs):
         return_status = kwargs.get('return_status')
@@ -58,6 +92,7 @@ class LogLambda(LogLambdaBase):
             # context setting will have no conflict since this is lambda
             # runtime specific
             context = kwargs.get('context', args[1])
+            LogLambda.context = context
             # context.structured_logger = self._set_structured_logger(context, lambda_func.__name__)
             context.structured_logger = self._set_structured_logger(
                 context, logger_name=lambda_func.__name__, service_tag=self.service_tag)
@@ -70,7 +105,9 @@ class LogLambda(LogLambdaBase):
                 self.debug('TRACE',
                            'serverless plugin warmup invocation, skipping processing',
                            state='Skip', **kwargs)
+                self._run_warmup_hooks()
                 self._clear_structured_logger()
+                LogLambda.context = None
                 return None
 
             self.info('TRACE', event, state='Invoked', **kwargs)
@@ -92,6 +129,7 @@ class LogLambda(LogLambdaBase):
                 self.info('TRACE', ret, state='Completed', **kwargs)
                 self._flush_buffer(return_status=ret)
                 self._clear_structured_logger()
+                LogLambda.context = None
             return convert_response(ret)
 
         return log_decorator